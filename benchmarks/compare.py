@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+"""Compare two results of the benchmark suite, like the ones of two commits.
+
+Run with ``python benchmarks/compare.py BASELINE CURRENT [--threshold 1.25] [--min-seconds 0.05]``. Each step that
+took more than the threshold times as long as in the baseline is a regression, unless it took less than the minimum
+number of seconds in both, where the timings are mostly noise. The exit code is 1 if there are any regressions, so it
+can fail a CI job.
+"""
+
+import argparse
+import json
+import sys
+
+
+def main() -> int:
+    """Compare the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('baseline', help='The JSON file of the baseline results')
+    parser.add_argument('current', help='The JSON file of the current results')
+    parser.add_argument('--threshold', type=float, default=1.25, help='The largest ratio of times that is fine')
+    parser.add_argument('--min-seconds', type=float, default=0.05, help='The time under which steps are ignored')
+    args = parser.parse_args()
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+
+    baseline_parameters, current_parameters = (
+        {key: value for key, value in results['parameters'].items() if key != 'stages'}
+        for results in (baseline, current)
+    )
+    if baseline_parameters != current_parameters:
+        print(f'warning: the parameters differ: {baseline_parameters} != {current_parameters}')  # noqa:T001
+
+    name_to_seconds = {result['name']: result['seconds'] for result in baseline['results']}
+    regressions = 0
+    baseline_name, current_name = baseline['commit'] or 'baseline', current['commit'] or 'current'
+    print(f'{"step":<32} {baseline_name:>14} {current_name:>14}   ratio')  # noqa:T001
+    for result in current['results']:
+        name, seconds = result['name'], result['seconds']
+        baseline_seconds = name_to_seconds.get(name)
+        if baseline_seconds is None:
+            print(f'{name:<32} {"-":>14} {seconds:>12.3f} s')  # noqa:T001
+            continue
+        ratio = seconds / baseline_seconds if baseline_seconds else float('inf')
+        regression = ratio > args.threshold and max(seconds, baseline_seconds) >= args.min_seconds
+        regressions += regression
+        print(  # noqa:T001
+            f'{name:<32} {baseline_seconds:>12.3f} s {seconds:>12.3f} s {ratio:>7.2f}x'
+            f'{"  REGRESSION" if regression else ""}',
+        )
+
+    print(f'{regressions} regressions')  # noqa:T001
+    return int(bool(regressions))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""Compare the bulk load path of the manager with the former ORM load path on SQLite.
+
+Run with ``python benchmarks/load_sqlite.py [N_PATHWAYS] [N_PROTEINS] [PATHWAYS_PER_PROTEIN]``. The defaults are
+about the size of the human KEGG: 350 pathways, 8000 proteins, and 4 pathways per protein.
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from bio2bel_kegg.client import PathwayEntry, ProteinEntry
+from bio2bel_kegg.manager import Manager
+from bio2bel_kegg.mappings import HGNCMapping
+from bio2bel_kegg.models import Protein, Species, protein_pathway
+
+
+def get_synthetic_data(n_pathways: int, n_proteins: int, pathways_per_protein: int, seed: int = 0):
+    """Make pathways, proteins, and protein-pathway pairs with KEGG-like identifiers."""
+    rng = random.Random(seed)
+    pathways = [
+        PathwayEntry(kegg_id=f'path:hsa{i:05d}', name=f'Pathway {i}', definition=f'Description of pathway {i}')
+        for i in range(n_pathways)
+    ]
+    proteins = [
+        ProteinEntry(kegg_id=f'hsa:{1000 + i}', entrez_id=str(1000 + i))
+        for i in range(n_proteins)
+    ]
+    pairs = [
+        (protein.kegg_id, pathway.kegg_id)
+        for protein in proteins
+        for pathway in rng.sample(pathways, pathways_per_protein)
+    ]
+    hgnc_mapping = HGNCMapping.from_dicts(
+        {str(1000 + i): str(i) for i in range(n_proteins)},
+        {str(i): f'GENE{i}' for i in range(n_proteins)},
+    )
+    return pathways, proteins, pairs, hgnc_mapping
+
+
+def load_orm(manager: Manager, pathways, proteins, pairs, hgnc_mapping) -> None:
+    """Load like the former manager: one query per pathway and per pair, and one ORM object per row."""
+    species = Species(name='Homo sapiens', taxonomy_id='9606')
+    manager.session.add(species)
+    for pathway in pathways:
+        manager.get_or_create_pathway(
+            kegg_pathway_id=pathway.kegg_id,
+            name=pathway.name,
+            definition=pathway.definition,
+            species=species,
+        )
+    manager.session.commit()
+
+    kegg_protein_id_to_protein = {}
+    for protein in proteins:
+        hgnc_id, = hgnc_mapping.get_hgnc_ids([protein.entrez_id])
+        hgnc_symbol, = hgnc_mapping.get_hgnc_symbols([hgnc_id])
+        kegg_protein_id_to_protein[protein.kegg_id] = model = Protein(
+            kegg_id=protein.kegg_id,
+            entrez_id=protein.entrez_id,
+            hgnc_id=hgnc_id,
+            hgnc_symbol=hgnc_symbol,
+        )
+        manager.session.add(model)
+
+    for kegg_protein_id, kegg_pathway_id in pairs:
+        pathway = manager.get_pathway_by_id(kegg_pathway_id[len('path:'):])
+        kegg_protein_id_to_protein[kegg_protein_id].pathways.append(pathway)
+    manager.session.commit()
+
+
+def load_bulk(manager: Manager, pathways, proteins, pairs, hgnc_mapping) -> None:
+    """Load with the bulk load path of the manager."""
+    manager._load_pathways(pathways, Species(name='Homo sapiens', taxonomy_id='9606'))
+    kegg_protein_id_to_pathway_ids = manager._get_kegg_protein_id_to_pathway_ids(pairs)
+    manager._load_pathway_proteins(proteins, kegg_protein_id_to_pathway_ids, hgnc_mapping=hgnc_mapping)
+
+
+def _time(load, data):
+    with tempfile.TemporaryDirectory() as directory:
+        manager = Manager(connection=f'sqlite:///{os.path.join(directory, "kegg.db")}')
+        manager.create_all()
+        start = time.perf_counter()
+        load(manager, *data)
+        elapsed = time.perf_counter() - start
+        summary = dict(manager.summarize(), memberships=manager.session.query(protein_pathway).count())
+        manager.session.close()
+    return elapsed, summary
+
+
+def main():
+    """Run the benchmark."""
+    n_pathways, n_proteins, pathways_per_protein = (int(arg) for arg in (sys.argv[1:] or (350, 8000, 4)))
+    data = get_synthetic_data(n_pathways, n_proteins, pathways_per_protein)
+    print(f'{n_pathways} pathways, {n_proteins} proteins, {len(data[2])} memberships')  # noqa:T001
+
+    orm_time, orm_summary = _time(load_orm, data)
+    bulk_time, bulk_summary = _time(load_bulk, data)
+    if orm_summary != bulk_summary:
+        raise ValueError(f'the load paths disagree: {orm_summary} != {bulk_summary}')
+
+    print(f'ORM:  {orm_time:7.2f} s')  # noqa:T001
+    print(f'bulk: {bulk_time:7.2f} s  speedup: {orm_time / bulk_time:.1f}x')  # noqa:T001
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""Compare looking up proteins one at a time without indexes with the batched lookups on indexed columns on SQLite.
+
+Run with ``python benchmarks/lookup_sqlite.py [N_PROTEINS] [N_PATHWAYS]``. The defaults look up 20000 HGNC symbols in
+a database of 20000 proteins in 350 pathways. The lookups one at a time are timed on a sample and extrapolated.
+"""
+
+import os
+import sys
+import tempfile
+import time
+from typing import Tuple
+
+from sqlalchemy import select
+
+from bio2bel_kegg.manager import Manager
+from bio2bel_kegg.models import Base, protein_pathway
+from bio2bel_kegg.utils import create_missing_indexes
+from load_sqlite import get_synthetic_data, load_bulk
+
+#: The indexes added for the lookups, which are dropped to time the lookups of older databases
+INDEX_NAMES = (
+    'ix_kegg_protein_hgnc_id',
+    'ix_kegg_protein_hgnc_symbol',
+    'ix_kegg_protein_uniprot_id',
+    'ix_kegg_protein_pathway_pathway_id_protein_id',
+)
+
+SAMPLE_SIZE = 500
+
+
+def time_one_at_a_time(manager: Manager, hgnc_symbols, pathway_ids) -> Tuple[float, float]:
+    """Time looking up each symbol, then the proteins of each pathway, with a query each."""
+    start = time.perf_counter()
+    for hgnc_symbol in hgnc_symbols[:SAMPLE_SIZE]:
+        manager.get_protein_by_hgnc_symbol(hgnc_symbol)
+    elapsed = (time.perf_counter() - start) * len(hgnc_symbols) / min(SAMPLE_SIZE, len(hgnc_symbols))
+
+    start = time.perf_counter()
+    for pathway_id in pathway_ids:
+        manager.session.execute(
+            select([protein_pathway.c.protein_id]).where(protein_pathway.c.pathway_id == pathway_id),
+        ).fetchall()
+    return elapsed, time.perf_counter() - start
+
+
+def main():
+    """Run the benchmark."""
+    n_proteins, n_pathways = (int(arg) for arg in (sys.argv[1:] or (20000, 350)))
+    data = get_synthetic_data(n_pathways, n_proteins, 4)
+    hgnc_symbols = [f'GENE{i}' for i in range(n_proteins)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        manager = Manager(connection=f'sqlite:///{os.path.join(directory, "kegg.db")}')
+        load_bulk(manager, *data)
+        pathway_ids = list(range(1, n_pathways + 1))
+
+        for name in INDEX_NAMES:
+            manager.session.execute(f'DROP INDEX {name}')
+        manager.session.commit()
+        before_lookup, before_pathways = time_one_at_a_time(manager, hgnc_symbols, pathway_ids)
+
+        create_missing_indexes(manager.engine, Base.metadata)
+        after_lookup, after_pathways = time_one_at_a_time(manager, hgnc_symbols, pathway_ids)
+
+        start = time.perf_counter()
+        hgnc_symbol_to_protein = manager.get_hgnc_symbol_to_protein(hgnc_symbols)
+        batch_lookup = time.perf_counter() - start
+        if len(hgnc_symbol_to_protein) != n_proteins:
+            raise ValueError(f'found {len(hgnc_symbol_to_protein)} of {n_proteins} proteins')
+        manager.session.close()
+
+    print(f'looking up {n_proteins} HGNC symbols')  # noqa:T001
+    print(f'one at a time, without indexes (extrapolated): {before_lookup:7.2f} s')  # noqa:T001
+    print(f'one at a time, with indexes (extrapolated):    {after_lookup:7.2f} s')  # noqa:T001
+    print(f'batched, with indexes:                         {batch_lookup:7.2f} s')  # noqa:T001
+    print(f'speedup: {before_lookup / batch_lookup:.0f}x')  # noqa:T001
+    print(f'listing the proteins of {n_pathways} pathways')  # noqa:T001
+    print(f'without the pathway index: {before_pathways:7.3f} s')  # noqa:T001
+    print(f'with the pathway index:    {after_pathways:7.3f} s')  # noqa:T001
+
+
+if __name__ == '__main__':
+    main()
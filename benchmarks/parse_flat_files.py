@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+"""Compare the single-pass section scanner with the former ``iterate_groups`` + :func:`itertools.groupby` parser.
+
+Run with ``python benchmarks/parse_flat_files.py [PROTEIN_FILE] [PATHWAY_FILE]``. The files default to the KEGG flat
+files in ``tests/resources``.
+"""
+
+import itertools as itt
+import logging
+import os
+import sys
+import timeit
+from operator import itemgetter
+from typing import Any, Iterable, Mapping
+
+from bio2bel_kegg.client import _get_lines, _get_xref_names, _get_xrefs, parse_pathway_lines, parse_protein_lines
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+RESOURCES = os.path.join(HERE, os.pardir, 'tests', 'resources')
+
+logger = logging.getLogger(__name__)
+
+
+def _iterate_groups(lines):
+    current_key = None
+    current_subkey = None
+    for line in lines:
+        if line.startswith('///') or not line.strip():
+            continue
+        key, val = line[:12].rstrip(), line[12:].rstrip()
+        if key:
+            if not key.startswith(' '):
+                current_key = key
+                current_subkey = None
+            else:
+                current_subkey = key.strip()
+
+        if current_subkey is not None:
+            yield (current_key, current_subkey), val
+        else:
+            yield current_key, val
+
+
+def _get_line(lines: Iterable[str]) -> str:
+    return list(lines)[0]
+
+
+def legacy_parse_protein_lines(lines: Iterable[str]) -> Mapping[str, Any]:
+    """Parse the lines of a KEGG protein info file with the former parser."""
+    rv = {'xrefs': []}
+    for group, group_lines in itt.groupby(_iterate_groups(lines), key=itemgetter(0)):
+        group_lines = (line for _, line in group_lines)
+        if group == 'ENTRY':
+            line = _get_line(group_lines)
+            kegg_id, _, _ = [x.strip() for x in line.split() if x.strip()]  # not sure what the other two are
+            rv['identifier'] = kegg_id.strip()
+        elif group == 'DEFINITION':
+            rv['definition'] = _get_line(group_lines)
+        elif group == 'ORTHOLOGY':
+            rv['orthology'] = _get_xref_names(group_lines, prefix='kegg.orthology')
+        elif group == 'ORGANISM':
+            line: str = _get_line(group_lines)
+            p_index = line.index('(')
+            rv['species'] = {'name': line[:p_index].rstrip()}
+        elif group == 'PATHWAY':
+            rv['pathway'] = _get_xref_names(group_lines, prefix='kegg.pathway')
+        elif group == 'BRITE':
+            pass
+        elif group == 'POSITION':
+            pass  # rv['position'] = int(_get_line(lines))
+        elif group == 'MOTIF':
+            rv['motif'] = _get_xrefs(group_lines)
+        elif group == 'DBLINKS':
+            rv['xrefs'] = _get_xrefs(group_lines)
+        else:
+            pass  # logger.warning(f'unhandled group: {group}')
+    return rv
+
+
+def legacy_parse_pathway_lines(lines: Iterable[str]) -> Mapping[str, Any]:
+    """Parse the lines of a KEGG pathway info file with the former parser."""
+    rv = {}
+    for group, group_lines in itt.groupby(_iterate_groups(lines), key=itemgetter(0)):
+        group_lines = (line for _, line in group_lines)
+        if group == 'ENTRY':
+            line = _get_line(group_lines)
+            kegg_id, _ = line.split()
+            rv['identifier'] = kegg_id
+        elif group == 'NAME':
+            rv['name'] = _get_line(group_lines)
+        elif group == 'DESCRIPTION':
+            rv['definition'] = _get_line(group_lines)
+        elif group == 'CLASS':
+            pass
+        elif group == 'PATHWAY_MAP':
+            pass
+        elif group == 'MODULE':
+            pass
+        elif group == 'NETWORK':
+            pass
+        elif group == 'DRUG':
+            drugs = []
+            for line in group_lines:
+                xref, name = line.split('  ')
+                try:
+                    p_index = name.rindex('(')
+                except ValueError:
+                    logger.warning(f'could not parse line: {line}')
+                    continue
+                name, note = name[:p_index - 1], name[1 + p_index:].rstrip().rstrip(')')
+                drugs.append({'identifier': xref, 'name': name, 'note': note.split('/')})
+            rv['drugs'] = drugs
+        elif group == 'DISEASE':
+            rv['diseases'] = _get_xref_names(group_lines, prefix='kegg.disease')
+        elif group == 'DBLINKS':
+            rv['xrefs'] = _get_xrefs(group_lines)
+        elif group == 'ORGANISM':
+            line: str = _get_line(group_lines)
+            p_index = line.index('(')
+            rv['species'] = {'name': line[:p_index].rstrip()}
+        elif group == 'GENE':
+            genes = []
+            for line in group_lines:
+                xref, info = line.split('  ', 1)
+                symbol, info = info.split(';')
+                name, info = info.lstrip().split(' [', 1)
+                orthology, ec = info.split(']', 1)
+                orthology_codes = orthology[len('KO:'):].split(' ')
+
+                if ec.strip().lstrip('[').rstrip(']'):
+                    ec_codes = ec[len('EC:'):].split(' ')
+                else:
+                    ec_codes = []
+
+                genes.append({
+                    'prefix': 'ncbigene',
+                    'identifier': xref,
+                    'name': symbol,
+                    'definition': name,
+                    'orthologies': [
+                        {
+                            'prefix': 'kegg.orthology',
+                            'identifier': orthology_code,
+                        }
+                        for orthology_code in orthology_codes
+                    ],
+                    'enzyme_classes': [
+                        {'prefix': 'ec-code', 'identifier': ec_code}
+                        for ec_code in ec_codes
+                    ],
+                })
+            rv['genes'] = genes
+        elif group == 'COMPOUND':
+            rv['compounds'] = _get_xref_names(group_lines, prefix='kegg.compound')
+        elif group == 'REFERENCE':
+            line = _get_line(group_lines)
+            if line.startswith('PMID'):
+                pubmed_id = line[len('PMID:'):]
+                rv['reference'] = {'pubmed_id': pubmed_id}
+            else:
+                continue
+        elif group == 'REL_PATHWAY':
+            rv['related'] = _get_xref_names(group_lines, prefix='kegg.pathway')
+        elif group == 'KO_PATHWAY':
+            pass
+        else:
+            pass  # logger.warning(f'unhandled group: {group}')
+
+    return rv
+
+
+def _compare(label, path, legacy, current, number):
+    with open(path) as file:
+        text = file.read()
+    lines = _get_lines(text)
+
+    legacy_rv = legacy(lines)
+    current_rv = current(text)
+    for key, value in legacy_rv.items():
+        if current_rv.get(key) != value:
+            raise ValueError(f'{label} parsers disagree on {key}: {value} != {current_rv.get(key)}')
+
+    # the former parsers got the lines split from the text of each entity, so that's part of their time
+    legacy_time = min(timeit.repeat(lambda: legacy(_get_lines(text)), number=number, repeat=5)) / number
+    current_time = min(timeit.repeat(lambda: current(text), number=number, repeat=5)) / number
+    print(  # noqa:T001
+        f'{label:<8} {len(lines):>6} lines'
+        f'  iterate_groups: {1e6 * legacy_time:8.1f} us'
+        f'  scanner: {1e6 * current_time:8.1f} us'
+        f'  speedup: {legacy_time / current_time:.1f}x',
+    )
+
+
+def main():
+    """Run the benchmark."""
+    protein_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(RESOURCES, 'test_protein.txt')
+    pathway_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(RESOURCES, 'test_pathway.txt')
+    _compare('protein', protein_path, legacy_parse_protein_lines, parse_protein_lines, number=2000)
+    _compare('pathway', pathway_path, legacy_parse_pathway_lines, parse_pathway_lines, number=500)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark parsing, the entity store, populating the database, lookups, and enrichment on a synthetic KEGG.
+
+Run with ``python benchmarks/suite.py`` and see ``--help`` for the options. The synthetic KEGG files are generated
+with :mod:`synthetic`, by default with 20,000 genes in 350 pathways of a single organism, about the size of the human
+KEGG. Everything runs offline: the entity store is filled from the generated flat files, like after they were
+fetched, and the human proteins are mapped to HGNC with a synthetic mapping instead of the one from protmapper.
+
+The stages are:
+
+1. ``parse``, parsing the list and link files and the flat files of the pathways and genes
+2. ``cache``, writing the flat files to a packed entity store, opening it, and reading them back
+3. ``populate``, loading human like :meth:`Manager.populate`, the other organisms like
+   :meth:`Manager.populate_organisms`, and calculating the pathway similarities
+4. ``lookup``, looking up proteins and pathways one at a time, in batches, and through the lookup cache
+5. ``enrich``, building the membership index and calculating the enrichment of random gene sets one at a time and in
+   a batch, and getting the most similar pathways
+
+Stages that a selected stage depends on are run too. The results are written as JSON, by default to
+``benchmarks/results/<commit>.json``, with the time, count, and rate of each step along with the parameters, commit,
+and platform. Compare two results with ``python benchmarks/compare.py``.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import synthetic
+from bio2bel_kegg.client import iter_entities_texts, parse_entities, parse_pathway_entry, parse_protein_entry
+from bio2bel_kegg.manager import Manager
+from bio2bel_kegg.models import Species
+from bio2bel_kegg.organisms import OrganismEntries
+from bio2bel_kegg.parsers import get_entity_pathway_df, get_pathway_df
+from bio2bel_kegg.store import PackedEntityStore
+from bio2bel_kegg.utils import iter_chunks
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+RESULTS_DIRECTORY = os.path.join(HERE, 'results')
+
+STAGES = ('parse', 'cache', 'populate', 'lookup', 'enrich')
+DEPENDENCIES = {
+    'populate': ('cache',),
+    'lookup': ('cache', 'populate'),
+    'enrich': ('cache', 'populate'),
+}
+
+#: The number of lookups or enrichments timed one at a time
+SAMPLE_SIZE = 1000
+
+
+class Suite:
+    """The state shared by the stages of the benchmarks and their results."""
+
+    def __init__(self, kegg: synthetic.SyntheticKEGG, directory: str, connection: Optional[str], n_gene_sets: int):
+        """Initialize the suite.
+
+        :param kegg: The synthetic KEGG
+        :param directory: A directory for the entity store and the database
+        :param connection: The database connection. Defaults to a SQLite database in the directory.
+        :param n_gene_sets: The number of gene sets enriched in a batch
+        """
+        self.kegg = kegg
+        self.directory = directory
+        self.connection = connection or f'sqlite:///{os.path.join(directory, "kegg.db")}'
+        self.n_gene_sets = n_gene_sets
+        self.rng = random.Random(kegg.seed)
+        self.store = None
+        self.manager = None
+        self.results: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def time(self, name: str, count: int = 1):
+        """Time a step, recording the number of items it processed.
+
+        The count can be updated through the yielded dictionary when it's only known at the end.
+        """
+        result = {'name': name, 'count': count}
+        start = time.perf_counter()
+        yield result
+        result['seconds'] = time.perf_counter() - start
+        self.record(**result)
+
+    def record(self, name: str, seconds: float, count: int = 1) -> None:
+        """Record the result of a step."""
+        self.results.append({
+            'name': name,
+            'seconds': seconds,
+            'count': count,
+            'per_second': count / seconds if seconds else None,
+        })
+        print(f'{name:<32} {seconds:9.3f} s {count:>10} items {count / max(seconds, 1e-9):>14,.0f} /s')  # noqa:T001
+
+    def iter_gene_ids(self, kegg_code: str):
+        """Iterate over the KEGG identifiers of the genes of an organism."""
+        with open(self.kegg.get_path(kegg_code, 'protein_pathway.tsv')) as file:
+            last = None
+            for line in file:
+                gene_id = line[:line.index('\t')]
+                if gene_id != last:
+                    yield gene_id
+                    last = gene_id
+
+    def iter_pathway_ids(self, kegg_code: str):
+        """Iterate over the KEGG identifiers (with prefix) of the pathways of an organism."""
+        with open(self.kegg.get_path(kegg_code, 'pathways.tsv')) as file:
+            for line in file:
+                yield line[:line.index('\t')]
+
+    def run_parse(self) -> None:
+        """Time parsing the files."""
+        with self.time('parse.list_files') as result:
+            result['count'] = sum(
+                len(get_pathway_df(url=self.kegg.get_path(kegg_code, 'pathways.tsv')).index)
+                + len(get_entity_pathway_df(url=self.kegg.get_path(kegg_code, 'protein_pathway.tsv')).index)
+                for kegg_code in self.kegg.kegg_codes
+            )
+
+        for name, parse in (('pathway', parse_pathway_entry), ('gene', parse_protein_entry)):
+            seconds, count = 0.0, 0
+            # only the parsing is timed, a chunk at a time so all the entries aren't in memory at once
+            for kegg_code in self.kegg.kegg_codes:
+                for chunk in iter_chunks(synthetic.iter_entries(self.kegg, kegg_code, name), 10_000):
+                    start = time.perf_counter()
+                    for entity in chunk:
+                        parse(entity)
+                    seconds += time.perf_counter() - start
+                    count += len(chunk)
+            self.record(f'parse.{name}_entries', seconds, count)
+
+    def run_cache(self) -> None:
+        """Time writing the flat files to the entity store and reading them back."""
+        directory = os.path.join(self.directory, 'entity_store')
+        with self.time('cache.write') as result:
+            with PackedEntityStore(directory) as store:
+                result['count'] = synthetic.fill_entity_store(self.kegg, store)
+
+        with self.time('cache.open', result['count']):
+            self.store = PackedEntityStore(directory)
+
+        gene_ids = [gene_id for kegg_code in self.kegg.kegg_codes for gene_id in self.iter_gene_ids(kegg_code)]
+        with self.time('cache.read', len(gene_ids)):
+            for _ in iter_entities_texts(gene_ids, store=self.store):
+                pass
+
+        self.rng.shuffle(gene_ids)
+        with self.time('cache.read_random', len(gene_ids)):
+            for gene_id in gene_ids:
+                self.store.get(gene_id)
+
+    def run_populate(self) -> None:
+        """Time populating the database."""
+        self.manager = Manager(connection=self.connection)
+        self.manager.create_all()
+
+        pathway_ids = list(self.iter_pathway_ids('hsa'))
+        gene_ids = list(self.iter_gene_ids('hsa'))
+        with self.time('populate.human', self.kegg.n_memberships[0]):
+            # like Manager._populate_pathways and Manager._populate_pathway_protein, with the synthetic store
+            pathways = parse_entities(iter_entities_texts(pathway_ids, store=self.store), parse_pathway_entry)
+            self.manager._load_pathways(pathways, Species(name='Homo sapiens', taxonomy_id='9606', kegg_code='hsa'))
+            link_df = get_entity_pathway_df(url=self.kegg.get_path('hsa', 'protein_pathway.tsv'))
+            kegg_protein_id_to_pathway_ids = self.manager._get_kegg_protein_id_to_pathway_ids(link_df.values)
+            del link_df
+            proteins = parse_entities(iter_entities_texts(gene_ids, store=self.store), parse_protein_entry)
+            self.manager._load_pathway_proteins(
+                proteins,
+                kegg_protein_id_to_pathway_ids,
+                hgnc_mapping=synthetic.get_hgnc_mapping(self.kegg),
+            )
+
+        with self.time('populate.organisms', sum(self.kegg.n_memberships[1:])):
+            for i, kegg_code in enumerate(self.kegg.kegg_codes[1:], start=2):
+                link_df = get_entity_pathway_df(url=self.kegg.get_path(kegg_code, 'protein_pathway.tsv'))
+                entries = OrganismEntries(
+                    kegg_code=kegg_code,
+                    kegg_genome_id=f'T{1000 + i:05d}',
+                    taxonomy_id=str(i),
+                    pathways=list(parse_entities(
+                        iter_entities_texts(self.iter_pathway_ids(kegg_code), store=self.store),
+                        parse_pathway_entry,
+                    )),
+                    proteins=list(parse_entities(
+                        iter_entities_texts(self.iter_gene_ids(kegg_code), store=self.store),
+                        parse_protein_entry,
+                    )),
+                    protein_pathway_pairs=[tuple(pair) for pair in link_df.values.tolist()],
+                )
+                self.manager._load_organism(entries, name=f'Synthetica {kegg_code}')
+
+        with self.time('populate.similarity', sum(self.kegg.n_memberships)):
+            self.manager._invalidate_caches()
+            self.manager.refresh_pathway_similarity()
+
+    def run_lookup(self) -> None:
+        """Time looking up proteins and pathways."""
+        kegg_ids = list(self.iter_gene_ids('hsa'))
+        hgnc_symbols = [f'GENE{kegg_id[len("hsa:"):]}' for kegg_id in kegg_ids]
+        pathway_ids = [pathway_id[len('path:'):] for pathway_id in self.iter_pathway_ids('hsa')]
+        sample = self.rng.sample(kegg_ids, min(SAMPLE_SIZE, len(kegg_ids)))
+
+        with self.time('lookup.protein_by_kegg_id', len(sample)):
+            for kegg_id in sample:
+                self.manager.get_protein_by_kegg_id(kegg_id)
+        with self.time('lookup.pathway_by_id', len(pathway_ids)):
+            for pathway_id in pathway_ids:
+                self.manager.get_pathway_by_id(pathway_id)
+        with self.time('lookup.batch_kegg_id', len(kegg_ids)):
+            self.manager.get_kegg_id_to_protein(kegg_ids)
+        with self.time('lookup.batch_hgnc_symbol', len(hgnc_symbols)):
+            self.manager.get_hgnc_symbol_to_protein(hgnc_symbols)
+        with self.time('lookup.batch_pathway_id', len(pathway_ids)):
+            self.manager.get_pathway_id_to_pathway(pathway_ids)
+        self.manager.session.expunge_all()
+
+        manager = Manager(connection=self.connection, lookup_cache_size=len(sample))
+        with self.time('lookup.record_miss', len(sample)):
+            for kegg_id in sample:
+                manager.get_protein_record(kegg_id)
+        with self.time('lookup.record_hit', len(sample)):
+            for kegg_id in sample:
+                manager.get_protein_record(kegg_id)
+        manager.session.close()
+
+    def run_enrich(self) -> None:
+        """Time enrichment and getting similar pathways."""
+        self.manager._invalidate_caches()
+        with self.time('enrich.index', sum(self.kegg.n_memberships)):
+            self.manager.get_membership_index()
+        with self.time('enrich.index_human', self.kegg.n_memberships[0]):
+            self.manager.get_membership_index('hsa')
+
+        n_genes = sum(1 for _ in self.iter_gene_ids('hsa'))
+        gene_sets = {
+            f'gene_set_{i}': [f'GENE{1000 + j}' for j in self.rng.sample(range(n_genes), self.rng.randint(5, 300))]
+            for i in range(self.n_gene_sets)
+        }
+        sample = list(gene_sets.values())[:SAMPLE_SIZE]
+        with self.time('enrich.one_at_a_time', len(sample)):
+            for genes in sample:
+                self.manager.enrich_pathways_for_genes(genes, kegg_code='hsa')
+        with self.time('enrich.batch', len(gene_sets)):
+            for _ in self.manager.iter_batch_enrichment(gene_sets, kegg_code='hsa'):
+                pass
+
+        pathway_ids = [pathway_id[len('path:'):] for pathway_id in self.iter_pathway_ids('hsa')]
+        with self.time('enrich.similar_pathways', len(pathway_ids)):
+            for pathway_id in pathway_ids:
+                self.manager.get_similar_pathways(pathway_id)
+
+    def close(self) -> None:
+        """Close the store and the database, and remove the saved similarities of the temporary database."""
+        if self.store is not None:
+            self.store.close()
+        if self.manager is not None:
+            if os.path.exists(self.manager.pathway_similarity_path):
+                os.remove(self.manager.pathway_similarity_path)
+            self.manager.session.close()
+            self.manager.engine.dispose()
+
+
+def get_commit() -> Optional[str]:
+    """Get the commit of the working tree, with a ``-dirty`` suffix if it has uncommitted changes."""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, text=True).strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=HERE, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f'{commit}-dirty' if dirty.strip() else commit
+
+
+def main():
+    """Run the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--genes', type=int, default=20000, help='The total number of genes, from 1k to 500k')
+    parser.add_argument('--organisms', type=int, default=1, help='The number of organisms')
+    parser.add_argument('--pathways', type=int, default=350, help='The number of pathways of each organism')
+    parser.add_argument('--gene-sets', type=int, default=10000, help='The number of gene sets enriched in a batch')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', default=','.join(STAGES), help=f'Comma-separated stages of {", ".join(STAGES)}')
+    parser.add_argument('--data', help='A directory where the synthetic files are kept between runs')
+    parser.add_argument('--connection', help='The database connection. Defaults to a temporary SQLite database.')
+    parser.add_argument('-o', '--output', help='The JSON file of the results')
+    args = parser.parse_args()
+
+    stages = set(args.stages.split(','))
+    unknown = stages.difference(STAGES)
+    if unknown:
+        parser.error(f'unknown stages: {", ".join(sorted(unknown))}')
+    for stage in list(stages):
+        stages.update(DEPENDENCIES.get(stage, ()))
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        kegg = synthetic.generate(
+            args.data or os.path.join(directory, 'synthetic'),
+            n_genes=args.genes,
+            n_organisms=args.organisms,
+            n_pathways=args.pathways,
+            seed=args.seed,
+        )
+        print(f'generated {kegg.n_genes} genes and {sum(kegg.n_memberships)} memberships of'  # noqa:T001
+              f' {kegg.n_organisms} organisms in {time.perf_counter() - start:.1f} s')
+
+        suite = Suite(kegg, directory, connection=args.connection, n_gene_sets=args.gene_sets)
+        try:
+            for stage in STAGES:
+                if stage in stages:
+                    getattr(suite, f'run_{stage}')()
+        finally:
+            suite.close()
+
+    commit = get_commit()
+    output = args.output or os.path.join(RESULTS_DIRECTORY, f'{commit or "unknown"}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump({
+            'commit': commit,
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'parameters': {
+                'genes': args.genes,
+                'organisms': args.organisms,
+                'pathways': args.pathways,
+                'gene_sets': args.gene_sets,
+                'seed': args.seed,
+                'connection': 'sqlite' if args.connection is None else args.connection.split(':', 1)[0],
+                'stages': sorted(stages),
+            },
+            'results': suite.results,
+        }, file, indent=2)
+    print(f'wrote the results to {output}')  # noqa:T001
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+"""Generate synthetic KEGG flat files at any scale, for benchmarks that run offline.
+
+Run with ``python benchmarks/synthetic.py DIRECTORY [N_GENES] [N_ORGANISMS] [N_PATHWAYS]`` to write the files. For
+each organism, there are the files of the KEGG REST API that the manager reads:
+
+1. ``{code}_pathways.tsv``, like ``list/pathway/{code}``
+2. ``{code}_protein_pathway.tsv``, like ``link/pathway/{code}``
+3. ``{code}_pathway_entries.txt`` and ``{code}_gene_entries.txt``, the concatenated flat files of the pathways and
+   genes, like the responses of ``get`` requests
+
+and ``organisms.tsv``, like ``list/organism``. The first organism is human, with the code ``hsa``. The genes are
+spread evenly over the organisms and each one is in at least one pathway, like the genes of the ``link`` files. The
+sizes of the pathways are skewed like in KEGG, where a few pathways, like the metabolic ones, have many more genes
+than the rest. The flat files have the sections of real entries, including the ones the parsers skip, with sequences
+of realistic lengths, so parsing and storing them costs about as much as for real entries.
+"""
+
+import itertools as itt
+import json
+import os
+import random
+import string
+import sys
+from typing import Iterable, List, NamedTuple, Tuple
+
+from bio2bel_kegg.mappings import HGNCMapping
+from bio2bel_kegg.store import EntityStore
+
+__all__ = [
+    'SyntheticKEGG',
+    'generate',
+    'iter_entries',
+    'fill_entity_store',
+    'get_hgnc_mapping',
+]
+
+MANIFEST = 'manifest.json'
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+NUCLEOTIDES = 'acgt'
+#: The length of the random sequences from which the sequences of the genes are sliced, which is much faster than
+#: drawing each sequence
+POOL_SIZE = 1 << 16
+
+
+class SyntheticKEGG(NamedTuple):
+    """The parameters and files of a synthetic KEGG."""
+
+    directory: str
+    n_genes: int
+    n_organisms: int
+    n_pathways: int
+    seed: int
+    #: The KEGG codes of the organisms, starting with hsa
+    kegg_codes: Tuple[str, ...]
+    #: The number of protein-pathway memberships of each organism
+    n_memberships: Tuple[int, ...]
+
+    def get_path(self, kegg_code: str, name: str) -> str:
+        """Get the path of a file of an organism, like ``pathways.tsv`` or ``gene_entries.txt``."""
+        return os.path.join(self.directory, f'{kegg_code}_{name}')
+
+    @property
+    def organisms_path(self) -> str:
+        """The path of the list of organisms."""
+        return os.path.join(self.directory, 'organisms.tsv')
+
+
+def get_kegg_codes(n_organisms: int) -> List[str]:
+    """Get human then made-up three letter organism codes."""
+    codes = (''.join(letters) for letters in itt.product(string.ascii_lowercase, repeat=3))
+    return ['hsa', *itt.islice((code for code in codes if code != 'hsa'), n_organisms - 1)]
+
+
+def generate(
+    directory: str,
+    n_genes: int = 20000,
+    n_organisms: int = 1,
+    n_pathways: int = 350,
+    seed: int = 0,
+) -> SyntheticKEGG:
+    """Write the files of a synthetic KEGG, or reuse the ones in the directory if they have the same parameters.
+
+    :param directory: The directory of the files
+    :param n_genes: The total number of genes, spread evenly over the organisms
+    :param n_organisms: The number of organisms
+    :param n_pathways: The number of pathways of each organism
+    :param seed: The seed of the random memberships and sequences
+    """
+    parameters = dict(n_genes=n_genes, n_organisms=n_organisms, n_pathways=n_pathways, seed=seed)
+    manifest_path = os.path.join(directory, MANIFEST)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+        if {key: manifest[key] for key in parameters} == parameters:
+            return SyntheticKEGG(
+                directory=directory,
+                kegg_codes=tuple(manifest['kegg_codes']),
+                n_memberships=tuple(manifest['n_memberships']),
+                **parameters,
+            )
+
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    kegg = SyntheticKEGG(directory=directory, kegg_codes=tuple(get_kegg_codes(n_organisms)), n_memberships=(),
+                         **parameters)
+    with open(kegg.organisms_path, 'w') as file:
+        for i, kegg_code in enumerate(kegg.kegg_codes):
+            print(f'T{1001 + i:05d}', kegg_code, _get_organism_name(kegg_code), 'Eukaryotes;Animals', sep='\t',
+                  file=file)
+
+    pools = tuple(''.join(rng.choices(alphabet, k=POOL_SIZE)) for alphabet in (AMINO_ACIDS, NUCLEOTIDES))
+    kegg = kegg._replace(n_memberships=tuple(
+        _write_organism(kegg, kegg_code, n_genes // n_organisms + (i < n_genes % n_organisms), rng, pools)
+        for i, kegg_code in enumerate(kegg.kegg_codes)
+    ))
+    with open(manifest_path, 'w') as file:
+        json.dump(dict(parameters, kegg_codes=kegg.kegg_codes, n_memberships=kegg.n_memberships), file)
+    return kegg
+
+
+def _get_organism_name(kegg_code: str) -> str:
+    return 'Homo sapiens (human)' if kegg_code == 'hsa' else f'Synthetica {kegg_code} ({kegg_code})'
+
+
+def _write_organism(
+    kegg: SyntheticKEGG,
+    kegg_code: str,
+    n_genes: int,
+    rng: random.Random,
+    pools: Tuple[str, str],
+) -> int:
+    organism = _get_organism_name(kegg_code)
+    n_pathways = kegg.n_pathways
+    pathway_ids = [f'{kegg_code}{10 * (i + 1):05d}' for i in range(n_pathways)]
+    # a few large pathways and many small ones
+    weights = [1 / (i + 1) ** 0.8 for i in range(n_pathways)]
+    rng.shuffle(weights)
+
+    pathway_genes = [[] for _ in range(n_pathways)]
+    n_memberships = 0
+    with open(kegg.get_path(kegg_code, 'protein_pathway.tsv'), 'w') as link_file, \
+            open(kegg.get_path(kegg_code, 'gene_entries.txt'), 'w') as gene_file:
+        for gene in range(n_genes):
+            entrez_id = str(1000 + gene)
+            positions = sorted(set(rng.choices(range(n_pathways), weights=weights, k=rng.randint(1, 8))))
+            for position in positions:
+                pathway_genes[position].append(gene)
+                print(f'{kegg_code}:{entrez_id}', f'path:{pathway_ids[position]}', sep='\t', file=link_file)
+            n_memberships += len(positions)
+            gene_file.write(_get_gene_entry(
+                kegg_code,
+                entrez_id,
+                organism,
+                [(pathway_ids[position], f'Pathway {position}') for position in positions],
+                rng,
+                pools,
+            ))
+
+    with open(kegg.get_path(kegg_code, 'pathways.tsv'), 'w') as list_file, \
+            open(kegg.get_path(kegg_code, 'pathway_entries.txt'), 'w') as pathway_file:
+        for position, (pathway_id, genes) in enumerate(zip(pathway_ids, pathway_genes)):
+            print(f'path:{pathway_id}', f'Pathway {position} - {organism}', sep='\t', file=list_file)
+            pathway_file.write(_get_pathway_entry(pathway_id, f'Pathway {position}', organism, genes))
+    return n_memberships
+
+
+def _get_section(key: str, values: Iterable[str]) -> str:
+    return ''.join(
+        f'{key if i == 0 else "":<12}{value}\n'
+        for i, value in enumerate(values)
+    )
+
+
+def _get_gene_entry(
+    kegg_code: str,
+    entrez_id: str,
+    organism: str,
+    pathways: List[Tuple[str, str]],
+    rng: random.Random,
+    pools: Tuple[str, str],
+) -> str:
+    length = rng.randint(100, 900)
+    sequence, nucleotides = (
+        pool[offset:offset + size]
+        for pool, size in zip(pools, (length, 3 * length + 3))
+        for offset in (rng.randrange(len(pool) - size),)
+    )
+    return ''.join([
+        f'ENTRY       {entrez_id:<18}CDS       T01001\n',
+        f'SYMBOL      GENE{entrez_id}\n',
+        f'NAME        synthetic protein {entrez_id}\n',
+        f'ORTHOLOGY   K{int(entrez_id) % 30000:05d}  synthetic orthology\n',
+        f'ORGANISM    {kegg_code}  {organism}\n',
+        _get_section('PATHWAY', (f'{pathway_id}  {name}' for pathway_id, name in pathways)),
+        f'POSITION    {rng.randint(1, 22)}q{rng.randint(11, 36)}\n',
+        'MOTIF       Pfam: PF00001 PF00002\n',
+        f'DBLINKS     NCBI-GeneID: {entrez_id}\n',
+        f'            NCBI-ProteinID: NP_{entrez_id}\n',
+        f'            UniProt: Q{int(entrez_id):05d}\n',
+        f'AASEQ       {length}\n',
+        _get_section('', (sequence[i:i + 60] for i in range(0, length, 60))),
+        f'NTSEQ       {len(nucleotides)}\n',
+        _get_section('', (nucleotides[i:i + 60] for i in range(0, len(nucleotides), 60))),
+        '///\n',
+    ])
+
+
+def _get_pathway_entry(pathway_id: str, name: str, organism: str, genes: List[int]) -> str:
+    return ''.join([
+        f'ENTRY       {pathway_id:<28}Pathway\n',
+        f'NAME        {name} - {organism}\n',
+        f'DESCRIPTION A synthetic pathway with {len(genes)} genes.\n',
+        'CLASS       Metabolism; Synthetic metabolism\n',
+        f'PATHWAY_MAP {pathway_id}  {name}\n',
+        f'ORGANISM    {organism} [GN:T01001]\n',
+        _get_section('GENE', (
+            f'{1000 + gene}  GENE{1000 + gene}; synthetic protein {1000 + gene} [KO:K{(1000 + gene) % 30000:05d}] '
+            f'[EC:1.1.1.{gene % 300}]'
+            for gene in genes
+        )),
+        'COMPOUND    C00031  D-Glucose\n',
+        'REFERENCE   PMID:12345678\n',
+        f'KO_PATHWAY  ko{pathway_id[-5:]}\n',
+        '///\n',
+    ])
+
+
+def iter_entries(kegg: SyntheticKEGG, kegg_code: str, name: str) -> Iterable[Tuple[str, str]]:
+    """Iterate over the KEGG identifiers (with prefix) and flat files of the entries of an organism.
+
+    :param kegg: The synthetic KEGG
+    :param kegg_code: The KEGG code of the organism
+    :param name: Either ``pathway`` or ``gene``
+    """
+    prefix = 'path:' if name == 'pathway' else f'{kegg_code}:'
+    with open(kegg.get_path(kegg_code, f'{name}_entries.txt')) as file:
+        lines = []
+        for line in file:
+            lines.append(line)
+            if line.startswith('///'):
+                yield f'{prefix}{lines[0][12:].split()[0]}', ''.join(lines)
+                lines = []
+
+
+def fill_entity_store(kegg: SyntheticKEGG, store: EntityStore) -> int:
+    """Put the flat files of all organisms in an entity store, like they would be after being fetched.
+
+    :return: The number of entities
+    """
+    count = 0
+    for kegg_code in kegg.kegg_codes:
+        for name in ('pathway', 'gene'):
+            for entity_id, text in iter_entries(kegg, kegg_code, name):
+                store.put(entity_id, text)
+                count += 1
+    return count
+
+
+def get_hgnc_mapping(kegg: SyntheticKEGG) -> HGNCMapping:
+    """Get an HGNC mapping of the human genes, so the human proteins get HGNC identifiers and symbols offline."""
+    n_genes = kegg.n_genes // kegg.n_organisms + (kegg.n_genes % kegg.n_organisms > 0)
+    return HGNCMapping.from_dicts(
+        {str(1000 + i): str(i) for i in range(n_genes)},
+        {str(i): f'GENE{1000 + i}' for i in range(n_genes)},
+    )
+
+
+def main():
+    """Write the files of a synthetic KEGG."""
+    directory, *args = sys.argv[1:]
+    kegg = generate(directory, *(int(arg) for arg in args))
+    print(json.dumps(kegg._asdict(), indent=2))  # noqa:T001
+
+
+if __name__ == '__main__':
+    main()
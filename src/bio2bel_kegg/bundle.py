@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+
+"""Offline snapshots of KEGG, packed into a single bundle that populates databases without the network.
+
+A bundle is a ZIP archive, so it's compressed and its central directory indexes each member for random access. It
+contains:
+
+1. ``manifest.json``, with the KEGG release, the SHA-256 checksum and size of each list, and the number and checksum
+   of the entities
+2. ``lists/``, the list and link files of :mod:`bio2bel_kegg.parsers`, like ``pathways.tsv``,
+   ``protein_pathway.tsv``, ``organisms.tsv``, ``kegg_info.txt``, the ``{code}_pathways.tsv`` and
+   ``{code}_protein_pathway.tsv`` files of other organisms, and the ``{code}_ncbi-geneid.tsv`` and
+   ``{code}_uniprot.tsv`` conv tables, and ``br08901.keg``, the hierarchy of pathway maps
+3. ``entities/``, the flat file of each entity in the entity store, laid out like a
+   :class:`bio2bel_kegg.store.DirectoryEntityStore`
+
+Build a bundle once where there's network access, then populate from it anywhere:
+
+.. code-block:: python
+
+    from bio2bel_kegg.bundle import build_bundle
+    from bio2bel_kegg.manager import Manager
+
+    build_bundle('kegg.zip', fetch_missing=True)
+
+    manager = Manager()
+    manager.populate(bundle='kegg.zip')
+
+The members are written in a fixed order with fixed timestamps, so bundles of the same files are identical.
+"""
+
+import glob
+import hashlib
+import io
+import json
+import logging
+import os
+import zipfile
+from typing import Any, Iterator, Mapping, Optional, Set
+
+from tqdm import tqdm
+
+from .client import ensure_kegg_entities
+from .constants import DATA_DIR
+from .fetcher import Fetcher
+from .metrics import stage
+from .parsers import (
+    PATHWAY_HIERARCHY_NAME, get_entity_pathway_df, get_kegg_release, get_ncbigene_conv_df, get_organisms_df,
+    get_pathway_df, get_pathway_hierarchy, get_uniprot_conv_df, iter_entity_pathway_dfs, parse_kegg_release,
+)
+from .store import EntityStore, get_default_entity_store
+
+__all__ = [
+    'Bundle',
+    'BundleEntityStore',
+    'build_bundle',
+    'get_list_paths',
+]
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_FORMAT = 1
+MANIFEST_NAME = 'manifest.json'
+LISTS_PREFIX = 'lists/'
+ENTITIES_PREFIX = 'entities/'
+
+#: The lists that every bundle has, which are enough to populate human
+REQUIRED_LISTS = ('kegg_info.txt', 'organisms.tsv', 'pathways.tsv', 'protein_pathway.tsv')
+
+# the earliest timestamp a ZIP archive can hold, so the bytes of a bundle only depend on its content
+_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def get_list_paths(directory: Optional[str] = None, force: bool = False) -> Mapping[str, str]:
+    """Get the paths of the list and link files in the data directory, downloading the ones needed for human.
+
+    :param directory: The directory of the files. Defaults to :data:`bio2bel_kegg.constants.DATA_DIR`, where
+     :mod:`bio2bel_kegg.parsers` downloads them.
+    :param force: Download the files needed for human again, for a snapshot of the current release
+    :return: A dictionary from the names of the files to their paths
+    """
+    if directory is None:
+        directory = DATA_DIR
+        get_kegg_release(force=force)
+        get_organisms_df()
+        get_pathway_df(force=force)
+        get_entity_pathway_df(force=force)
+        get_ncbigene_conv_df(force=force)
+        get_uniprot_conv_df(force=force)
+        get_pathway_hierarchy(force=force)
+
+    names = {*REQUIRED_LISTS, PATHWAY_HIERARCHY_NAME}
+    for pattern in ('*_pathways.tsv', '*_protein_pathway.tsv', '*_ncbi-geneid.tsv', '*_uniprot.tsv'):
+        names.update(os.path.basename(path) for path in glob.glob(os.path.join(directory, pattern)))
+    return {
+        name: os.path.join(directory, name)
+        for name in sorted(names)
+        if os.path.exists(os.path.join(directory, name))
+    }
+
+
+def _get_member_name(entity_id: str) -> str:
+    prefix, identifier = entity_id.split(':', 1)
+    return f'{ENTITIES_PREFIX}{prefix}/{identifier}.txt'
+
+
+def _get_entity_id(name: str) -> str:
+    prefix, identifier = name[len(ENTITIES_PREFIX):-len('.txt')].split('/', 1)
+    return f'{prefix}:{identifier}'
+
+
+def _get_referenced_ids(list_paths: Mapping[str, str]) -> Set[str]:
+    """Get the identifiers of the genomes, pathways, and proteins in the lists, which a complete snapshot has."""
+    entity_ids = set()
+    kegg_codes = set()
+    for name, path in list_paths.items():
+        if name.endswith('pathways.tsv'):
+            entity_ids.update(get_pathway_df(url=path)['kegg_pathway_id'])
+            kegg_codes.add(name[:-len('_pathways.tsv')] if '_' in name else 'hsa')
+        elif name.endswith('protein_pathway.tsv'):
+            for chunk in iter_entity_pathway_dfs(url=path):
+                entity_ids.update(chunk['kegg_protein_id'].cat.categories)
+    if 'organisms.tsv' in list_paths:
+        organisms_df = get_organisms_df(url=list_paths['organisms.tsv'])
+        entity_ids.update(
+            f'gn:{kegg_id}'
+            for kegg_id, kegg_code in organisms_df[['kegg_id', 'kegg_code']].values
+            if kegg_code in kegg_codes
+        )
+    return entity_ids
+
+
+def _add_entity(entities_hash, entity_id: str, text: str) -> None:
+    entities_hash.update(entity_id.encode('utf-8'))
+    entities_hash.update(b'\0')
+    entities_hash.update(text.encode('utf-8'))
+    entities_hash.update(b'\0')
+
+
+def _write_member(archive: zipfile.ZipFile, name: str, data: bytes) -> None:
+    info = zipfile.ZipInfo(name, date_time=_DATE_TIME)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    archive.writestr(info, data)
+
+
+def build_bundle(
+    path: str,
+    list_paths: Optional[Mapping[str, str]] = None,
+    store: Optional[EntityStore] = None,
+    fetch_missing: bool = False,
+    fetcher: Optional[Fetcher] = None,
+) -> Mapping[str, Any]:
+    """Pack the list files and the entities of a store into a bundle.
+
+    :param path: The path of the bundle. It's replaced only once the new one is complete.
+    :param list_paths: A dictionary from the names of the list and link files, like ``pathways.tsv``, to their paths.
+     Defaults to the ones from :func:`get_list_paths`.
+    :param store: The store of the entities. Defaults to the one configured in :mod:`bio2bel_kegg.store`.
+    :param fetch_missing: Fetch the genomes, pathways, and proteins in the lists that aren't in the store yet, so the
+     bundle is complete
+    :param fetcher: The fetcher used to get the missing entities
+    :return: The manifest of the bundle
+    """
+    if list_paths is None:
+        list_paths = get_list_paths()
+    missing_lists = sorted(set(REQUIRED_LISTS).difference(list_paths))
+    if missing_lists:
+        raise ValueError(f'missing lists: {", ".join(missing_lists)}')
+    if store is None:
+        store = get_default_entity_store()
+
+    with stage('bundle.check'):
+        referenced_ids = _get_referenced_ids(list_paths)
+        if fetch_missing:
+            failed_ids = ensure_kegg_entities(sorted(referenced_ids), fetcher=fetcher, store=store)
+            if failed_ids:
+                logger.warning('could not fetch %d entities: %s', len(failed_ids), ', '.join(failed_ids))
+        missing_ids = sorted(entity_id for entity_id in referenced_ids if entity_id not in store)
+        if missing_ids:
+            logger.warning('the bundle is missing %d entities of its lists', len(missing_ids))
+
+    with open(list_paths['kegg_info.txt']) as file:
+        release = parse_kegg_release(file)
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with stage('bundle.write'), zipfile.ZipFile(tmp_path, 'w') as archive:
+        lists = {}
+        for name, list_path in sorted(list_paths.items()):
+            with open(list_path, 'rb') as file:
+                data = file.read()
+            _write_member(archive, f'{LISTS_PREFIX}{name}', data)
+            lists[name] = {'size': len(data), 'sha256': hashlib.sha256(data).hexdigest()}
+
+        entities_hash = hashlib.sha256()
+        entity_ids = sorted(store)
+        for entity_id in tqdm(entity_ids, desc='Bundling entities', unit_scale=True):
+            text = store.get(entity_id)
+            _add_entity(entities_hash, entity_id, text)
+            _write_member(archive, _get_member_name(entity_id), text.encode('utf-8'))
+
+        manifest = {
+            'format': BUNDLE_FORMAT,
+            'kegg_release': release,
+            'lists': lists,
+            'entities': {'count': len(entity_ids), 'sha256': entities_hash.hexdigest()},
+            'missing_entities': missing_ids,
+        }
+        _write_member(archive, MANIFEST_NAME, json.dumps(manifest, indent=2).encode('utf-8'))
+    os.replace(tmp_path, path)
+    logger.info('bundled %d lists and %d entities of KEGG %s in %s', len(lists), len(entity_ids), release, path)
+    return manifest
+
+
+class Bundle:
+    """A bundle opened for reading."""
+
+    def __init__(self, path: str):
+        """Open a bundle and read its manifest.
+
+        :param path: The path of the bundle
+        :raises ValueError: If the file isn't a bundle or it's of an unknown format
+        """
+        self.path = path
+        try:
+            self._archive = zipfile.ZipFile(path)
+        except zipfile.BadZipFile as e:
+            raise ValueError(f'{path} is not a bundle: {e}') from None
+        try:
+            self.manifest = json.loads(self._archive.read(MANIFEST_NAME))
+        except KeyError:
+            self._archive.close()
+            raise ValueError(f'{path} is not a bundle: it has no {MANIFEST_NAME}') from None
+        if self.manifest.get('format') != BUNDLE_FORMAT:
+            self._archive.close()
+            raise ValueError(f'{path} is a bundle of unknown format {self.manifest.get("format")}')
+        self._names = set(self._archive.namelist())
+        self.store = BundleEntityStore(self)
+
+    @property
+    def release(self) -> Optional[str]:
+        """The KEGG release of the snapshot, like ``Release 106.0+/05-16, May 23``."""
+        return self.manifest['kegg_release']
+
+    def has_list(self, name: str) -> bool:
+        """Check if the bundle has a list or link file, like ``mmu_pathways.tsv``."""
+        return f'{LISTS_PREFIX}{name}' in self._names
+
+    def open_list(self, name: str) -> io.BufferedIOBase:
+        """Open a list or link file, which can be given to the functions in :mod:`bio2bel_kegg.parsers` as a url.
+
+        :param name: The name of the file, like ``pathways.tsv``
+        :raises ValueError: If the bundle doesn't have the file
+        """
+        if not self.has_list(name):
+            raise ValueError(f'{self.path} has no {name}')
+        return self._archive.open(f'{LISTS_PREFIX}{name}')
+
+    def verify(self) -> None:
+        """Check the lists and entities against the checksums of the manifest.
+
+        Each member is also checked against its CRC-32 as it's read.
+
+        :raises ValueError: If a list or the entities don't match
+        """
+        with stage('bundle.verify'):
+            for name, expected in self.manifest['lists'].items():
+                with self.open_list(name) as file:
+                    data = file.read()
+                if hashlib.sha256(data).hexdigest() != expected['sha256']:
+                    raise ValueError(f'{self.path} has a corrupt {name}')
+
+            entities_hash = hashlib.sha256()
+            count = 0
+            for entity_id in sorted(self.store):
+                _add_entity(entities_hash, entity_id, self.store.get(entity_id))
+                count += 1
+            expected = self.manifest['entities']
+            if count != expected['count'] or entities_hash.hexdigest() != expected['sha256']:
+                raise ValueError(f'{self.path} has corrupt entities')
+
+    def close(self) -> None:
+        """Close the archive."""
+        self._archive.close()
+
+    def __enter__(self):  # noqa: D105
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):  # noqa: D105
+        self.close()
+
+
+class BundleEntityStore(EntityStore):
+    """A read-only store of the entities in a bundle."""
+
+    def __init__(self, bundle: Bundle):
+        """Initialize the store.
+
+        :param bundle: The open bundle
+        """
+        self.bundle = bundle
+
+    def get(self, entity_id: str) -> Optional[str]:  # noqa: D102
+        name = _get_member_name(entity_id)
+        if name not in self.bundle._names:
+            return None
+        return self.bundle._archive.read(name).decode('utf-8')
+
+    def put(self, entity_id: str, text: str) -> None:  # noqa: D102
+        raise TypeError(f'{self.bundle.path} is read-only')
+
+    def __contains__(self, entity_id: str) -> bool:  # noqa: D105
+        return _get_member_name(entity_id) in self.bundle._names
+
+    def __iter__(self) -> Iterator[str]:  # noqa: D105
+        for name in self.bundle._names:
+            if name.startswith(ENTITIES_PREFIX):
+                yield _get_entity_id(name)
+
+    def __len__(self) -> int:  # noqa: D105
+        return self.bundle.manifest['entities']['count']
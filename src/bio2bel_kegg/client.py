@@ -4,156 +4,372 @@
 
 import itertools as itt
 import logging
-import os
-from multiprocessing.pool import ThreadPool
-from operator import itemgetter
-from typing import Any, Collection, Iterable, List, Mapping, Optional, Tuple
-from urllib.request import urlretrieve
-
-from protmapper.api import hgnc_name_to_id
-from protmapper.uniprot_client import get_entrez_id, um
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Any, Callable, Collection, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple, TypeVar, Union,
+)
+
 from tqdm import tqdm
 
-from .constants import ENTITY_DIRECTORY, XREF_MAPPING
+from .constants import KEGG_GET_MAX_ENTRIES, KEGG_GET_URL, XREF_MAPPING
+from .fetcher import Fetcher
+from .metrics import get_metrics, increment, stage, timed
+from .store import EntityStore, get_default_entity_store
+from .utils import iter_chunks
 
 __all__ = [
     'get_entities_lines',
+    'iter_entities_lines',
+    'iter_entities_texts',
+    'ensure_kegg_entities',
     'parse_protein_lines',
     'parse_pathway_lines',
+    'iter_sections',
+    'ProteinEntry',
+    'PathwayEntry',
+    'parse_protein_entry',
+    'parse_pathway_entry',
+    'get_pathway_proteins',
+    'parse_entities',
 ]
 
 logger = logging.getLogger(__name__)
 
-HGNC_ID_TO_ENTREZ_ID = {
-    hgnc: get_entrez_id(uniprot)
-    for uniprot, hgnc in um.uniprot_hgnc.items()
-}
-ENTREZ_ID_TO_HGNC_ID = {v: k for k, v in HGNC_ID_TO_ENTREZ_ID.items()}
-HGNC_ID_TO_SYMBOL = {v: k for k, v in hgnc_name_to_id.items()}
+X = TypeVar('X')
 
 
 def get_entities_lines(
     entity_ids: Collection[str],
-    thread_pool_size: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    fetcher: Optional[Fetcher] = None,
+    store: Optional[EntityStore] = None,
 ) -> List[Tuple[str, List[str]]]:
     """Get entities.
 
+    Entities that are not in the store yet are fetched with multi-entry ``get`` requests then split back into
+    one entry per entity.
+
     :param entity_ids: Can be KEGG pathway identifiers or KEGG protein identifiers
-    :param thread_pool_size:
+    :param batch_size: The number of entities per request. Defaults to :data:`KEGG_GET_MAX_ENTRIES`, which is
+     the most KEGG allows. Set to 1 to send one request per entity.
+    :param fetcher: The fetcher used to send requests. Defaults to one with the default concurrency and rate limit.
+    :param store: The store that caches entities. Defaults to the one configured in :mod:`bio2bel_kegg.store`.
     """
-    # Multi-thread processing of protein description requests
-    if thread_pool_size is None:
-        thread_pool_size = 3
-    with ThreadPool(processes=thread_pool_size) as pool:
-        results: Iterable[Tuple[str, List[str]]] = pool.imap_unordered(ensure_kegg_entity, entity_ids)
-        # make sure it gets the whole way through this before doing the next step
-        results: Iterable[Tuple[str, List[str]]] = tqdm(
-            results,
-            total=len(entity_ids),
-            desc=f'Fetching protein information ({thread_pool_size} threads)',
-        )
-        return [(x, y) for x,y in results if x]
-
-
-def ensure_kegg_entity(entity_id: str) -> Tuple[str, List[str]]:
+    if store is None:
+        store = get_default_entity_store()
+
+    with stage('client.get_entities_lines'):
+        failed_ids = ensure_kegg_entities(entity_ids, batch_size=batch_size, fetcher=fetcher, store=store)
+        if failed_ids:
+            logger.warning('could not fetch %d entities: %s', len(failed_ids), ', '.join(failed_ids))
+
+        get = timed(store.get, 'store.get')
+        entity_id_to_text = {}
+        for entity_id in entity_ids:
+            text = get(entity_id)
+            if text is not None:
+                entity_id_to_text[entity_id] = text
+
+        # entities that were found corrupt when they were read are dropped by the store, so they're fetched again
+        dropped_ids = set(entity_ids).difference(entity_id_to_text, failed_ids)
+        if dropped_ids:
+            ensure_kegg_entities(dropped_ids, batch_size=batch_size, fetcher=fetcher, store=store)
+            for entity_id in dropped_ids:
+                text = get(entity_id)
+                if text is not None:
+                    entity_id_to_text[entity_id] = text
+
+        return [
+            (entity_id, _get_lines(entity_id_to_text[entity_id]))
+            for entity_id in entity_ids
+            if entity_id in entity_id_to_text
+        ]
+
+
+def ensure_kegg_entity(entity_id: str, store: Optional[EntityStore] = None) -> Tuple[str, List[str]]:
     """Send a given entity to the KEGG API and process the results.
 
     :param entity_id: A KEGG entity identifier (with prefix)
+    :param store: The store that caches entities
     """
-    prefix, identifier = entity_id.split(':', 1)
-    entity_type_directory = os.path.join(ENTITY_DIRECTORY, prefix)
-    os.makedirs(entity_type_directory, exist_ok=True)
-    entity_text_path = os.path.join(entity_type_directory, f'{identifier}.txt')
+    if store is None:
+        store = get_default_entity_store()
 
-    if not os.path.exists(entity_text_path):
-        try:
-            urlretrieve(f'http://rest.kegg.jp/get/{entity_id}', entity_text_path)  # noqa:S310
-        except Exception:
+    with stage('client.ensure_kegg_entity'):
+        entities = get_entities_lines([entity_id], store=store)
+        if not entities:
             return None, None
 
-    with open(entity_text_path) as file:
-        lines = [line.strip() for line in file]
+        return entities[0]
+
 
-    return entity_id, lines
+def iter_entities_lines(
+    entity_ids: Iterable[str],
+    batch_size: Optional[int] = None,
+    fetcher: Optional[Fetcher] = None,
+    store: Optional[EntityStore] = None,
+) -> Iterable[Tuple[str, List[str]]]:
+    """Iterate over entities, yielding the ones in the store first then the others as they are fetched.
+
+    Unlike :func:`get_entities_lines`, only a bounded number of entities are held in memory at a time.
+
+    :param entity_ids: Can be KEGG pathway identifiers or KEGG protein identifiers
+    :param batch_size: The number of entities per request. Defaults to :data:`KEGG_GET_MAX_ENTRIES`.
+    :param fetcher: The fetcher used to send requests
+    :param store: The store that caches entities
+    """
+    for entity_id, text in iter_entities_texts(entity_ids, batch_size=batch_size, fetcher=fetcher, store=store):
+        yield entity_id, _get_lines(text)
 
 
-def iterate_groups(lines):
-    current_key = None
-    current_subkey = None
-    for line in lines:
-        if line.startswith('///') or not line.strip():
+def iter_entities_texts(
+    entity_ids: Iterable[str],
+    batch_size: Optional[int] = None,
+    fetcher: Optional[Fetcher] = None,
+    store: Optional[EntityStore] = None,
+    force: bool = False,
+) -> Iterable[Tuple[str, str]]:
+    """Iterate over the text of entities like :func:`iter_entities_lines`, without splitting them into lines.
+
+    The parsers work directly on the text, so this saves a pass over each entity.
+
+    :param entity_ids: Can be KEGG pathway identifiers or KEGG protein identifiers
+    :param batch_size: The number of entities per request. Defaults to :data:`KEGG_GET_MAX_ENTRIES`.
+    :param fetcher: The fetcher used to send requests
+    :param store: The store that caches entities
+    :param force: Fetch all entities again, replacing the ones in the store
+    """
+    if store is None:
+        store = get_default_entity_store()
+
+    get = timed(store.get, 'store.get')
+    missing_ids = []
+    hits = 0
+    for entity_id in entity_ids:
+        text = None if force else get(entity_id)
+        if text is None:
+            missing_ids.append(entity_id)
+        else:
+            hits += 1
+            yield entity_id, text
+    increment('store.hits', hits)
+    increment('store.misses', len(missing_ids))
+
+    failed_ids = []
+    yield from _iter_fetched_entries(missing_ids, failed_ids, batch_size, fetcher, store)
+
+    if failed_ids:
+        logger.warning('could not fetch %d entities: %s', len(failed_ids), ', '.join(failed_ids))
+
+
+def ensure_kegg_entities(
+    entity_ids: Iterable[str],
+    batch_size: Optional[int] = None,
+    fetcher: Optional[Fetcher] = None,
+    store: Optional[EntityStore] = None,
+) -> List[str]:
+    """Make sure the given entities are in the store, fetching the missing ones with multi-entry requests.
+
+    :param entity_ids: KEGG entity identifiers (with prefix)
+    :param batch_size: The number of entities per request. Defaults to :data:`KEGG_GET_MAX_ENTRIES`.
+    :param fetcher: The fetcher used to send requests
+    :param store: The store that caches entities
+    :return: The entity identifiers that could not be fetched, either because requests for them kept failing or
+     because KEGG does not have them
+    """
+    if store is None:
+        store = get_default_entity_store()
+
+    entity_ids = list(entity_ids)
+    missing_ids = [
+        entity_id
+        for entity_id in entity_ids
+        if entity_id not in store
+    ]
+    increment('store.hits', len(entity_ids) - len(missing_ids))
+    increment('store.misses', len(missing_ids))
+    failed_ids = []
+    entries = _iter_fetched_entries(missing_ids, failed_ids, batch_size, fetcher, store)
+    for _ in tqdm(entries, total=len(missing_ids), desc=f'Fetching {len(missing_ids)} entities'):
+        pass
+    return failed_ids
+
+
+def _iter_fetched_entries(
+    entity_ids: Sequence[str],
+    failed_ids: List[str],
+    batch_size: Optional[int] = None,
+    fetcher: Optional[Fetcher] = None,
+    store: Optional[EntityStore] = None,
+) -> Iterable[Tuple[str, str]]:
+    """Fetch entities with multi-entry requests, store them, and yield them as they arrive.
+
+    :param entity_ids: KEGG entity identifiers (with prefix)
+    :param failed_ids: A list to which the identifiers that could not be fetched are added
+    """
+    if batch_size is None:
+        batch_size = KEGG_GET_MAX_ENTRIES
+    elif not 0 < batch_size <= KEGG_GET_MAX_ENTRIES:
+        raise ValueError(f'batch_size must be between 1 and {KEGG_GET_MAX_ENTRIES}: {batch_size}')
+
+    if not entity_ids:
+        return
+
+    url_to_batch = {}
+    for i in range(0, len(entity_ids), batch_size):
+        batch = entity_ids[i:i + batch_size]
+        url_to_batch[f'{KEGG_GET_URL}/{"+".join(batch)}'] = batch
+
+    if fetcher is None:
+        fetcher = Fetcher()
+
+    put = timed(store.put, 'store.put')
+    # a small buffer is enough to keep the connections busy while the consumer catches up
+    for result in fetcher.iter_texts(url_to_batch, queue_size=2 * fetcher.max_connections):
+        batch = url_to_batch[result.url]
+        if result.text is None:
+            logger.warning('gave up on %s: %s', result.url, result.error)
+            failed_ids.extend(batch)
             continue
-        key, val = line[:12].rstrip(), line[12:].rstrip()
-        if key:
-            if not key.startswith(' '):
-                current_key = key
-                current_subkey = None
-            else:
-                current_subkey = key.strip()
-
-        if current_subkey is not None:
-            yield (current_key, current_subkey), val
+
+        # KEGG leaves out entries that don't exist, so match them back up using their ENTRY lines
+        identifier_to_entity_id = {
+            entity_id.split(':', 1)[1]: entity_id
+            for entity_id in batch
+        }
+        for identifier, entry in split_entries(result.text):
+            entity_id = identifier_to_entity_id.pop(identifier, None)
+            if entity_id is None:
+                logger.warning('unexpected entry %s in response for %s', identifier, result.url)
+                continue
+            put(entity_id, entry)
+            increment('entities.fetched')
+            yield entity_id, entry
+        failed_ids.extend(identifier_to_entity_id.values())
+
+
+def split_entries(text: str) -> Iterable[Tuple[str, str]]:
+    """Split the response to a multi-entry ``get`` request into its entries.
+
+    :param text: One or more KEGG flat file entries, each terminated by ``///``
+    :return: Pairs of the identifier from the ENTRY line and the text of the entry, including its terminator
+    """
+    if not text.endswith('\n'):
+        text += '\n'
+    for entry in text.split('///\n'):
+        entry = entry.lstrip('\n')
+        if not entry.startswith('ENTRY'):
+            continue
+        first_line = entry[:entry.find('\n')]
+        identifier = first_line[12:].split()[0]
+        yield identifier, f'{entry}///\n'
+
+
+def _get_lines(text: str) -> List[str]:
+    return [line.rstrip() for line in text.splitlines()]
+
+
+#: Matches the keys of sections, which start at the beginning of a line
+_SECTION_KEY = re.compile(r'\n([A-Z][A-Z0-9_]*)')
+
+
+def iter_sections(lines: Union[str, Iterable[str]], keys: Collection[str]) -> Iterable[Tuple[str, List[str]]]:
+    """Iterate over the given sections of a KEGG flat file in a single pass over its text.
+
+    Sections that aren't asked for, like BRITE or the sequences, are skipped without being split into lines. The
+    values of a section end at its first subkey, like the AUTHORS of a REFERENCE.
+
+    :param lines: The text of a KEGG flat file or its lines
+    :param keys: The keys of the sections to yield, like ``ENTRY`` or ``DBLINKS``
+    :return: Pairs of the key of each section and the values of its lines, with the key field cut off
+    """
+    text = lines if isinstance(lines, str) else '\n'.join(line.rstrip('\n') for line in lines)
+    text = '\n' + text  # so the first key is found like the others
+    key, start = None, 0
+    for match in _SECTION_KEY.finditer(text):
+        if key is not None:
+            yield key, _get_values(text, start, match.start())
+        key = match.group(1)
+        if key in keys:
+            start = match.start() + 1
         else:
-            yield current_key, val
+            key = None
+    if key is not None:
+        yield key, _get_values(text, start, len(text))
+
+
+def _get_values(text: str, start: int, end: int) -> List[str]:
+    lines = text[start:end].split('\n')
+    values = [lines[0][12:].rstrip()]
+    for line in itt.islice(lines, 1, None):
+        if line[:1] == ' ' and line[:12].strip():  # a subkey
+            break
+        value = line[12:].rstrip()
+        if value:
+            values.append(value)
+    return values
 
 
-def get_line(lines: Iterable[str]) -> str:
-    return list(lines)[0]
+#: The sections of KEGG protein info files that are parsed
+PROTEIN_SECTIONS = frozenset({'ENTRY', 'DEFINITION', 'ORTHOLOGY', 'ORGANISM', 'PATHWAY', 'MOTIF', 'DBLINKS'})
 
 
-def parse_protein_lines(lines: Iterable[str]) -> Mapping[str, Any]:
-    """Parse the lines of a KEGG protein info file."""
+def parse_protein_lines(lines: Union[str, Iterable[str]]) -> Mapping[str, Any]:
+    """Parse a KEGG protein info file.
+
+    :param lines: The text of the file or its lines
+    """
     rv = {'xrefs': []}
-    for group, group_lines in itt.groupby(iterate_groups(lines), key=itemgetter(0)):
-        group_lines = (line for _, line in group_lines)
+    for group, group_lines in iter_sections(lines, PROTEIN_SECTIONS):
         if group == 'ENTRY':
-            line = get_line(group_lines)
+            line = group_lines[0]
             kegg_id, _, _ = [x.strip() for x in line.split() if x.strip()]  # not sure what the other two are
             rv['identifier'] = kegg_id.strip()
         elif group == 'DEFINITION':
-            rv['definition'] = get_line(group_lines)
+            rv['definition'] = group_lines[0]
         elif group == 'ORTHOLOGY':
             rv['orthology'] = _get_xref_names(group_lines, prefix='kegg.orthology')
         elif group == 'ORGANISM':
-            line: str = get_line(group_lines)
+            line = group_lines[0]
             p_index = line.index('(')
             rv['species'] = {'name': line[:p_index].rstrip()}
         elif group == 'PATHWAY':
             rv['pathway'] = _get_xref_names(group_lines, prefix='kegg.pathway')
-        elif group == 'BRITE':
-            pass
-        elif group == 'POSITION':
-            pass  # rv['position'] = int(get_line(lines))
         elif group == 'MOTIF':
             rv['motif'] = _get_xrefs(group_lines)
         elif group == 'DBLINKS':
             rv['xrefs'] = _get_xrefs(group_lines)
-        else:
-            pass  # logger.warning(f'unhandled group: {group}')
     return rv
 
 
-def parse_pathway_lines(lines: Iterable[str]) -> Mapping[str, Any]:
-    """Parse the lines of a KEGG pathway info file."""
+#: The sections of KEGG pathway info files that are parsed
+PATHWAY_SECTIONS = frozenset({
+    'ENTRY', 'NAME', 'DESCRIPTION', 'CLASS', 'DRUG', 'DISEASE', 'DBLINKS', 'ORGANISM', 'GENE', 'COMPOUND',
+    'REFERENCE', 'REL_PATHWAY',
+})
+
+
+def parse_pathway_lines(lines: Union[str, Iterable[str]]) -> Mapping[str, Any]:
+    """Parse a KEGG pathway info file.
+
+    :param lines: The text of the file or its lines
+    """
     rv = {}
-    for group, group_lines in itt.groupby(iterate_groups(lines), key=itemgetter(0)):
-        group_lines = (line for _, line in group_lines)
+    for group, group_lines in iter_sections(lines, PATHWAY_SECTIONS):
         if group == 'ENTRY':
-            line = get_line(group_lines)
+            line = group_lines[0]
             kegg_id, _ = line.split()
             rv['identifier'] = kegg_id
         elif group == 'NAME':
-            rv['name'] = get_line(group_lines)
+            rv['name'] = group_lines[0]
         elif group == 'DESCRIPTION':
-            rv['definition'] = get_line(group_lines)
+            rv['definition'] = group_lines[0]
         elif group == 'CLASS':
-            pass
-        elif group == 'PATHWAY_MAP':
-            pass
-        elif group == 'MODULE':
-            pass
-        elif group == 'NETWORK':
-            pass
+            # the categories of the pathway in the KEGG BRITE hierarchy, like Metabolism; Carbohydrate metabolism
+            rv['classes'] = [name.strip() for name in group_lines[0].split(';')]
         elif group == 'DRUG':
             drugs = []
             for line in group_lines:
@@ -171,7 +387,7 @@ def parse_pathway_lines(lines: Iterable[str]) -> Mapping[str, Any]:
         elif group == 'DBLINKS':
             rv['xrefs'] = _get_xrefs(group_lines)
         elif group == 'ORGANISM':
-            line: str = get_line(group_lines)
+            line = group_lines[0]
             p_index = line.index('(')
             rv['species'] = {'name': line[:p_index].rstrip()}
         elif group == 'GENE':
@@ -209,22 +425,156 @@ def parse_pathway_lines(lines: Iterable[str]) -> Mapping[str, Any]:
         elif group == 'COMPOUND':
             rv['compounds'] = _get_xref_names(group_lines, prefix='kegg.compound')
         elif group == 'REFERENCE':
-            line = get_line(group_lines)
+            line = group_lines[0]
             if line.startswith('PMID'):
                 pubmed_id = line[len('PMID:'):]
                 rv['reference'] = {'pubmed_id': pubmed_id}
-            else:
-                continue
         elif group == 'REL_PATHWAY':
             rv['related'] = _get_xref_names(group_lines, prefix='kegg.pathway')
-        elif group == 'KO_PATHWAY':
-            pass
-        else:
-            pass  # logger.warning(f'unhandled group: {group}')
 
     return rv
 
 
+class ProteinEntry(NamedTuple):
+    """The parts of a KEGG protein entry that are loaded in the database."""
+
+    #: The KEGG identifier (with prefix) of the protein
+    kegg_id: str
+    #: The NCBI Entrez Gene identifier from the ENTRY line
+    entrez_id: str
+    #: Pairs of prefixes and identifiers from the DBLINKS section
+    xrefs: Tuple[Tuple[str, str], ...] = ()
+
+
+class PathwayEntry(NamedTuple):
+    """The parts of a KEGG pathway entry that are loaded in the database."""
+
+    #: The KEGG identifier (with prefix) of the pathway
+    kegg_id: str
+    #: The name of the pathway
+    name: str
+    #: The description of the pathway
+    definition: Optional[str] = None
+    #: The KEGG gene identifiers (without the organism code) from the GENE section, like 10327
+    gene_ids: Tuple[str, ...] = ()
+    #: The KEGG identifiers (without prefix) of the pathways in the REL_PATHWAY section, like hsa00020
+    related_ids: Tuple[str, ...] = ()
+
+
+def parse_protein_entry(entity: Tuple[str, Union[str, List[str]]]) -> ProteinEntry:
+    """Parse a KEGG protein entity into a compact record.
+
+    :param entity: A pair of a KEGG protein identifier and the text or lines of its flat file
+    """
+    entity_id, lines = entity
+    protein = parse_protein_lines(lines)
+    return ProteinEntry(
+        kegg_id=entity_id,
+        entrez_id=protein['identifier'],
+        xrefs=tuple((xref['prefix'], xref['identifier']) for xref in protein['xrefs']),
+    )
+
+
+def parse_pathway_entry(entity: Tuple[str, Union[str, List[str]]]) -> PathwayEntry:
+    """Parse a KEGG pathway entity into a compact record.
+
+    :param entity: A pair of a KEGG pathway identifier and the text or lines of its flat file
+    """
+    entity_id, lines = entity
+    pathway = parse_pathway_lines(lines)
+    return PathwayEntry(
+        kegg_id=entity_id,
+        name=pathway['name'],
+        definition=pathway.get('definition'),
+        gene_ids=tuple(gene['identifier'] for gene in pathway.get('genes', ())),
+        related_ids=tuple(related['identifier'] for related in pathway.get('related', ())),
+    )
+
+
+def get_pathway_proteins(
+    pathways: Iterable[PathwayEntry],
+    kegg_code: str,
+) -> Tuple[List[ProteinEntry], List[Tuple[str, str]]]:
+    """Get the proteins of pathways from their GENE sections, without fetching the flat file of each protein.
+
+    Only the identifier on the ENTRY line of the flat file of a protein is loaded, which is the same as the one in the
+    GENE sections of its pathways, so the proteins are the same as if they were fetched.
+
+    :param pathways: Parsed pathways
+    :param kegg_code: The KEGG code of the organism of the pathways, like ``hsa``
+    :return: The proteins, in the order they're first found, and pairs of KEGG protein identifiers and KEGG pathway
+     identifiers like the ones of a protein-pathway link file
+    """
+    proteins = {}
+    protein_pathway_pairs = []
+    for pathway in pathways:
+        for gene_id in pathway.gene_ids:
+            kegg_protein_id = f'{kegg_code}:{gene_id}'
+            if kegg_protein_id not in proteins:
+                proteins[kegg_protein_id] = ProteinEntry(kegg_id=kegg_protein_id, entrez_id=gene_id)
+            protein_pathway_pairs.append((kegg_protein_id, pathway.kegg_id))
+    return list(proteins.values()), protein_pathway_pairs
+
+
+def parse_entities(
+    entities_lines: Iterable[Tuple[str, List[str]]],
+    parse: Callable[[Tuple[str, List[str]]], X],
+    processes: Optional[int] = None,
+    chunksize: Optional[int] = None,
+) -> Iterable[X]:
+    """Parse entities, optionally across a pool of processes, and yield the results in the same order.
+
+    Entities are sent to the processes in chunks to amortize pickling, and only a few chunks per process are in
+    flight at a time, so a stream of entities isn't read into memory all at once.
+
+    :param entities_lines: Pairs of KEGG identifiers and the text or lines of their flat files
+    :param parse: A module-level function like :func:`parse_protein_entry` or :func:`parse_pathway_entry`
+    :param processes: The number of processes to parse with. If None or 1, parses in this process.
+    :param chunksize: The number of entities sent to a process at a time. Defaults to 100.
+    """
+    stage_name = f'parse.{parse.__name__}'
+    if processes is None or processes == 1:
+        yield from map(timed(parse, stage_name), entities_lines)
+        return
+
+    if chunksize is None:
+        chunksize = 100
+
+    # the workers can't record metrics, so they send back how long each chunk took if they're being collected
+    metrics = get_metrics()
+    parse_chunk = _parse_chunk if metrics is None else _parse_chunk_timed
+
+    def _get_results(future):
+        if metrics is None:
+            return future.result()
+        results, wall, cpu = future.result()
+        metrics.add_stage(stage_name, wall, cpu, calls=len(results))
+        return results
+
+    max_in_flight = 2 * processes
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = deque()
+        for chunk in iter_chunks(entities_lines, chunksize):
+            futures.append(executor.submit(parse_chunk, parse, chunk))
+            if len(futures) >= max_in_flight:
+                yield from _get_results(futures.popleft())
+        while futures:
+            yield from _get_results(futures.popleft())
+
+
+def _parse_chunk(parse: Callable[[Tuple[str, List[str]]], X], chunk: List[Tuple[str, List[str]]]) -> List[X]:
+    return [parse(entity) for entity in chunk]
+
+
+def _parse_chunk_timed(
+    parse: Callable[[Tuple[str, List[str]]], X],
+    chunk: List[Tuple[str, List[str]]],
+) -> Tuple[List[X], float, float]:
+    wall, cpu = time.perf_counter(), time.process_time()
+    results = _parse_chunk(parse, chunk)
+    return results, time.perf_counter() - wall, time.process_time() - cpu
+
+
 def _get_xrefs(group_lines: Iterable[str]) -> List[Mapping[str, Any]]:
     xrefs_list = []
     for line in group_lines:
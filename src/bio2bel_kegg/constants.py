@@ -15,6 +15,19 @@ METADATA_FILE_PATH = os.path.join(DATA_DIR, 'protein_metadata.json')  # Metadata
 ENTITY_DIRECTORY = os.path.join(DATA_DIR, 'entities')
 os.makedirs(ENTITY_DIRECTORY, exist_ok=True)
 
+# packed, indexed store for the entities. Set the backend to "directory" to use ENTITY_DIRECTORY instead
+ENTITY_STORE_DIRECTORY = os.path.join(DATA_DIR, 'entity_store')
+ENTITY_STORE_BACKEND = os.environ.get('BIO2BEL_KEGG_ENTITY_STORE', 'packed')
+# size in bytes to which the least recently used entities are evicted from the store after populating or updating. A
+# size of 0 lets the store grow without bound
+ENTITY_STORE_MAX_SIZE = int(os.environ.get('BIO2BEL_KEGG_ENTITY_STORE_MAX_SIZE', 0))
+
+# sorted arrays of the HGNC mappings from protmapper, in a subdirectory for each of its versions
+MAPPINGS_DIRECTORY = os.path.join(DATA_DIR, 'mappings')
+
+# overlaps of the pairs of pathways, in an archive for each database connection
+PATHWAY_SIMILARITY_DIRECTORY = os.path.join(DATA_DIR, 'pathway_similarity')
+
 # returns the list of human pathways
 KEGG_PATHWAYS_URL = 'http://rest.kegg.jp/list/pathway'
 KEGG_HUMAN_PATHWAYS_URL = 'http://rest.kegg.jp/list/pathway/hsa'
@@ -23,9 +36,40 @@ KEGG_HUMAN_PATHWAYS_URL = 'http://rest.kegg.jp/list/pathway/hsa'
 PROTEIN_PATHWAY_URL = 'http://rest.kegg.jp/link/pathway'
 PROTEIN_PATHWAY_HUMAN_URL = 'http://rest.kegg.jp/link/pathway/hsa'
 
+# organism-wide tables of the NCBI Entrez Gene and UniProt identifiers of the genes of an organism, like
+# conv/ncbi-geneid/hsa and conv/uniprot/hsa
+KEGG_CONV_URL = 'http://rest.kegg.jp/conv'
+
+# where the proteins loaded with the pathways come from: "entries" fetches the flat file of each protein, "pathways"
+# takes them from the GENE sections of the pathways, and "conv" takes them from the protein-pathway links and the
+# identifiers from the conv tables
+PROTEIN_SOURCES = ('entries', 'pathways', 'conv')
+
+# the KEGG BRITE hierarchy of the pathway maps, from the top categories like Metabolism down to the reference maps
+KEGG_PATHWAY_HIERARCHY_URL = 'http://rest.kegg.jp/get/br:br08901'
+
 # KEGG stats
 KEGG_STATISTICS_URL = 'http://rest.kegg.jp/info/kegg'
 
+# returns the flat files for up to KEGG_GET_MAX_ENTRIES entries joined with "+"
+KEGG_GET_URL = 'http://rest.kegg.jp/get'
+KEGG_GET_MAX_ENTRIES = 10
+
+# size and time to live in seconds of the cache of the records of pathways and proteins looked up by the manager. A size
+# of 0 disables the cache, and a time to live of 0 keeps the records until the database is changed by the manager
+LOOKUP_CACHE_SIZE = int(os.environ.get('BIO2BEL_KEGG_LOOKUP_CACHE_SIZE', 0))
+LOOKUP_CACHE_TTL = float(os.environ.get('BIO2BEL_KEGG_LOOKUP_CACHE_TTL', 0))
+
+# path of a JSON report of the timings and counters of populating or updating the database, if it's set
+METRICS_PATH = os.environ.get('BIO2BEL_KEGG_METRICS')
+
+# the largest number of identifiers in an IN query, below the limit of 999 parameters of older versions of SQLite
+IN_QUERY_CHUNK_SIZE = 500
+
+# default concurrency and throttling of requests to the KEGG API
+KEGG_MAX_CONNECTIONS = 3
+KEGG_REQUESTS_PER_SECOND = 3.0
+
 # returns the list of organism pathways
 KEGG_ORGANISM_URL = 'http://rest.kegg.jp/list/organism'
 
@@ -0,0 +1,600 @@
+# -*- coding: utf-8 -*-
+
+"""An in-memory index of protein-pathway memberships for fast pathway enrichment.
+
+The memberships are loaded once from the database into a compressed sparse row (CSR) matrix with a row for each
+protein and a column for each pathway. Proteins are looked up by their HGNC identifiers, HGNC symbols, or NCBI Entrez
+Gene identifiers, then the overlap of a query with every pathway is counted with a single :func:`numpy.bincount` and
+the hypergeometric p-values of all pathways are computed together, without any queries to the database.
+
+Many queries, like the clusters of a single-cell experiment, are scored in chunks with
+:meth:`MembershipIndex.iter_batch_enrichment`. The overlaps of all queries of a chunk are counted at once, like the
+product of a sparse query-protein matrix with the protein-pathway matrix, and their p-values are corrected for the
+false discovery rate with :func:`benjamini_hochberg`.
+"""
+
+import hashlib
+import itertools as itt
+import logging
+from typing import Any, Hashable, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Set, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .models import Pathway, Protein, protein_pathway
+from .utils import iter_chunks
+
+__all__ = [
+    'Enrichment',
+    'GeneSets',
+    'MembershipIndex',
+    'Memberships',
+    'query_memberships',
+    'benjamini_hochberg',
+    'hypergeometric_sf',
+]
+
+logger = logging.getLogger(__name__)
+
+#: The keys by which proteins can be looked up in a :class:`MembershipIndex`
+KEYS = ('hgnc_id', 'hgnc_symbol', 'entrez_id')
+
+#: The largest number of terms of hypergeometric sums held in memory at once
+HYPERGEOMETRIC_GRID_SIZE = 1 << 21
+
+#: The columns of the tables from :meth:`MembershipIndex.iter_batch_enrichment`
+BATCH_ENRICHMENT_COLUMNS = [
+    'query', 'pathway_id', 'mapped_proteins', 'pathway_size', 'query_size', 'p_value', 'q_value',
+]
+
+#: Gene sets, either as a sequence or mapping of collections of identifiers, or as a data frame with a row for each
+#: gene set and a column for each gene, in which the genes of a set are the non-zero entries of its row
+GeneSets = Union[Sequence[Iterable[str]], Mapping[Hashable, Iterable[str]], pd.DataFrame]
+
+
+class Memberships(NamedTuple):
+    """The pathways, proteins, and memberships of the database, with the memberships as positions in both lists."""
+
+    #: The KEGG identifiers of the pathways, ordered by their primary keys
+    pathway_ids: List[str]
+    #: The names of the pathways
+    pathway_names: List[str]
+    #: The KEGG identifier, HGNC identifier, HGNC symbol, and NCBI Entrez Gene identifier of each protein that is in
+    #: at least one of the pathways, ordered by their primary keys
+    proteins: List[Tuple[str, Optional[str], Optional[str], Optional[str]]]
+    #: The position of the pathway of each membership
+    pathway_positions: np.ndarray
+    #: The position of the protein of each membership
+    protein_positions: np.ndarray
+
+
+def query_memberships(session, species_id: Optional[int] = None) -> Memberships:
+    """Get the pathways, proteins, and memberships from the database with three queries of plain columns.
+
+    :param session: A SQLAlchemy session
+    :param species_id: The primary key of a species to which the pathways are restricted. The proteins are the ones
+     in at least one of the pathways.
+    """
+    pathway_query = session.query(Pathway.id, Pathway.identifier, Pathway.name).order_by(Pathway.id)
+    membership_query = session.query(protein_pathway.c.pathway_id, protein_pathway.c.protein_id)
+    if species_id is not None:
+        pathway_query = pathway_query.filter(Pathway.species_id == species_id)
+        membership_query = (
+            membership_query
+            .join(Pathway, Pathway.id == protein_pathway.c.pathway_id)
+            .filter(Pathway.species_id == species_id)
+        )
+    pathways = pathway_query.all()
+    memberships = np.array(membership_query.all(), dtype=np.int64).reshape(-1, 2)
+    proteins = (
+        session.query(Protein.id, Protein.kegg_id, Protein.hgnc_id, Protein.hgnc_symbol, Protein.entrez_id)
+        .filter(Protein.id.in_(membership_query.with_entities(protein_pathway.c.protein_id).subquery()))
+        .order_by(Protein.id)
+        .all()
+    )
+
+    # map the primary keys to positions, since both lists are sorted by primary key
+    pathway_primary_keys = np.array([pathway[0] for pathway in pathways], dtype=np.int64)
+    protein_primary_keys = np.array([protein[0] for protein in proteins], dtype=np.int64)
+    return Memberships(
+        pathway_ids=[pathway[1] for pathway in pathways],
+        pathway_names=[pathway[2] for pathway in pathways],
+        proteins=[tuple(protein[1:]) for protein in proteins],
+        pathway_positions=np.searchsorted(pathway_primary_keys, memberships[:, 0]),
+        protein_positions=np.searchsorted(protein_primary_keys, memberships[:, 1]),
+    )
+
+
+class Enrichment(NamedTuple):
+    """The pathways that overlap with a query, ordered by their p-values."""
+
+    #: The KEGG identifiers of the pathways, like hsa00010
+    pathway_ids: np.ndarray
+    #: The number of proteins of the query in each pathway
+    mapped_proteins: np.ndarray
+    #: The number of proteins in each pathway
+    pathway_sizes: np.ndarray
+    #: The hypergeometric p-value of the overlap with each pathway
+    p_values: np.ndarray
+    #: The number of proteins of the query found in the index
+    query_size: int
+
+
+class MembershipIndex:
+    """Protein-pathway memberships as a CSR matrix with a row for each protein and a column for each pathway."""
+
+    def __init__(
+        self,
+        pathway_ids: Sequence[str],
+        pathway_names: Sequence[str],
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        hgnc_ids: Sequence[Optional[str]],
+        hgnc_symbols: Sequence[Optional[str]],
+        entrez_ids: Sequence[Optional[str]],
+    ):
+        """Initialize the index.
+
+        :param pathway_ids: The KEGG identifier of each pathway (column)
+        :param pathway_names: The name of each pathway (column)
+        :param indptr: The offsets in ``indices`` where the pathways of each protein (row) start, with one more
+         element than there are proteins
+        :param indices: The columns of the pathways of each protein, one protein after another
+        :param hgnc_ids: The HGNC identifier of each protein (row)
+        :param hgnc_symbols: The HGNC symbol of each protein (row)
+        :param entrez_ids: The NCBI Entrez Gene identifier of each protein (row)
+        """
+        self.pathway_ids = np.asarray(pathway_ids, dtype=object)
+        self.pathway_names = np.asarray(pathway_names, dtype=object)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.hgnc_symbols = np.asarray(hgnc_symbols, dtype=object)
+
+        self.n_proteins = len(self.indptr) - 1
+        self.pathway_sizes = np.bincount(self.indices, minlength=len(self.pathway_ids))
+        self._log_factorials = _get_log_factorials(self.n_proteins)
+
+        self._key_to_rows = {}
+        self._values_indexes = {}
+        for key, values in zip(KEYS, (hgnc_ids, hgnc_symbols, entrez_ids)):
+            value_to_row = self._key_to_rows[key] = {}
+            for row, value in enumerate(values):
+                if value:
+                    value_to_row.setdefault(value, row)
+
+        # the transposed matrix, for listing the proteins of a pathway
+        rows = np.repeat(np.arange(self.n_proteins), np.diff(self.indptr))
+        order = np.argsort(self.indices, kind='stable')
+        self._pathway_indptr = np.concatenate([[0], np.cumsum(self.pathway_sizes)])
+        self._pathway_indices = rows[order]
+
+    def get_checksum(self) -> str:
+        """Get a SHA-256 checksum of the pathways and the proteins of each of them, in the order of their rows."""
+        checksum = hashlib.sha256()
+        checksum.update('\t'.join(self.pathway_ids.tolist()).encode('utf-8'))
+        checksum.update(self._pathway_indptr.astype(np.int64).tobytes())
+        checksum.update(self._pathway_indices.astype(np.int64).tobytes())
+        return checksum.hexdigest()
+
+    @classmethod
+    def from_session(cls, session, species_id: Optional[int] = None) -> 'MembershipIndex':
+        """Build the index from the pathways and proteins in the database.
+
+        :param session: A SQLAlchemy session
+        :param species_id: The primary key of a species to which the pathways are restricted. The proteins in the
+         index are the ones in at least one of the pathways.
+        """
+        memberships = query_memberships(session, species_id=species_id)
+        proteins = memberships.proteins
+        rows, columns = memberships.protein_positions, memberships.pathway_positions
+
+        order = np.argsort(rows, kind='stable')
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(proteins)))])
+        logger.info(
+            'indexed %d memberships of %d proteins in %d pathways',
+            len(rows), len(proteins), len(memberships.pathway_ids),
+        )
+        return cls(
+            pathway_ids=memberships.pathway_ids,
+            pathway_names=memberships.pathway_names,
+            indptr=indptr,
+            indices=columns[order],
+            hgnc_ids=[protein[1] for protein in proteins],
+            hgnc_symbols=[protein[2] for protein in proteins],
+            entrez_ids=[protein[3] for protein in proteins],
+        )
+
+    def get_rows(self, identifiers: Iterable[str], key: str = 'hgnc_symbol') -> np.ndarray:
+        """Get the rows of the proteins with the given identifiers, leaving out the ones that aren't in the index.
+
+        :param identifiers: HGNC identifiers, HGNC symbols, or NCBI Entrez Gene identifiers
+        :param key: One of ``hgnc_id``, ``hgnc_symbol``, or ``entrez_id``
+        """
+        value_to_row = self._get_value_to_row(key)
+        rows = {value_to_row.get(identifier) for identifier in identifiers}
+        rows.discard(None)
+        return np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+    def _get_value_to_row(self, key: str) -> Mapping[str, int]:
+        value_to_row = self._key_to_rows.get(key)
+        if value_to_row is None:
+            raise ValueError(f'invalid key: {key}. Use one of {", ".join(KEYS)}')
+        return value_to_row
+
+    def count_overlaps(self, rows: np.ndarray) -> np.ndarray:
+        """Count how many of the given proteins are in each pathway.
+
+        :param rows: The rows of distinct proteins, from :meth:`get_rows`
+        :return: An array with the count for each pathway (column)
+        """
+        if not len(rows):
+            return np.zeros(len(self.pathway_ids), dtype=np.int64)
+        starts, ends = self.indptr[rows], self.indptr[rows + 1]
+        columns = self.indices[_concatenate_ranges(starts, ends)]
+        return np.bincount(columns, minlength=len(self.pathway_ids))
+
+    def enrich(self, identifiers: Iterable[str], key: str = 'hgnc_symbol') -> Enrichment:
+        """Calculate the enrichment of all pathways that overlap with a set of proteins.
+
+        :param identifiers: HGNC identifiers, HGNC symbols, or NCBI Entrez Gene identifiers
+        :param key: One of ``hgnc_id``, ``hgnc_symbol``, or ``entrez_id``
+        """
+        rows = self.get_rows(identifiers, key=key)
+        overlaps = self.count_overlaps(rows)
+        columns = np.flatnonzero(overlaps)
+        mapped_proteins = overlaps[columns]
+        pathway_sizes = self.pathway_sizes[columns]
+        p_values = hypergeometric_sf(
+            mapped_proteins,
+            pathway_sizes,
+            len(rows),
+            self.n_proteins,
+            log_factorials=self._log_factorials,
+        )
+        order = np.argsort(p_values, kind='stable')
+        return Enrichment(
+            pathway_ids=self.pathway_ids[columns[order]],
+            mapped_proteins=mapped_proteins[order],
+            pathway_sizes=pathway_sizes[order],
+            p_values=p_values[order],
+            query_size=len(rows),
+        )
+
+    def iter_batch_enrichment(
+        self,
+        gene_sets: GeneSets,
+        key: str = 'hgnc_symbol',
+        chunk_size: Optional[int] = None,
+    ) -> Iterable[pd.DataFrame]:
+        """Calculate the enrichment of pathways for many gene sets, yielding a table for each chunk of gene sets.
+
+        Each table has a row for each pair of a gene set and a pathway that overlap, ordered by gene set then p-value,
+        with the columns in :data:`BATCH_ENRICHMENT_COLUMNS`. The q-values are adjusted with the Benjamini-Hochberg
+        procedure over all pathways in the index for each gene set, counting the pathways without overlap as tests
+        with p-values of one.
+
+        :param gene_sets: A sequence or mapping of gene sets, or a data frame with a row for each gene set and a column
+         for each gene. The ``query`` column holds the position in the sequence, the key in the mapping, or the label
+         of the row of the data frame.
+        :param key: One of ``hgnc_id``, ``hgnc_symbol``, or ``entrez_id``
+        :param chunk_size: The number of gene sets in each table. Defaults to 1000.
+        """
+        if chunk_size is None:
+            chunk_size = 1000
+
+        if isinstance(gene_sets, pd.DataFrame):
+            column_rows = self.get_rows_or_missing(gene_sets.columns, key=key)
+            for start in range(0, len(gene_sets.index), chunk_size):
+                block = gene_sets.iloc[start:start + chunk_size]
+                queries, columns = np.nonzero(block.to_numpy())
+                yield self._enrich_chunk(block.index.tolist(), queries, column_rows[columns])
+            return
+
+        items = gene_sets.items() if isinstance(gene_sets, Mapping) else enumerate(gene_sets)
+        for chunk in iter_chunks(items, chunk_size):
+            identifiers = [list(gene_set) for _, gene_set in chunk]
+            queries = np.repeat(np.arange(len(chunk)), [len(gene_set) for gene_set in identifiers])
+            rows = self.get_rows_or_missing(itt.chain.from_iterable(identifiers), key=key)
+            yield self._enrich_chunk([name for name, _ in chunk], queries, rows)
+
+    def batch_enrich(
+        self,
+        gene_sets: GeneSets,
+        key: str = 'hgnc_symbol',
+        chunk_size: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """Calculate the enrichment of pathways for many gene sets in a single table.
+
+        See :meth:`iter_batch_enrichment`, which keeps less in memory at once.
+        """
+        tables = list(self.iter_batch_enrichment(gene_sets, key=key, chunk_size=chunk_size))
+        if not tables:
+            return pd.DataFrame(columns=BATCH_ENRICHMENT_COLUMNS)
+        return pd.concat(tables, ignore_index=True)
+
+    def get_rows_or_missing(self, identifiers: Iterable[str], key: str = 'hgnc_symbol') -> np.ndarray:
+        """Get the row of the protein for each identifier, or -1 if it isn't in the index.
+
+        The identifiers are looked up all at once in a hash table built the first time it's needed.
+
+        :param identifiers: HGNC identifiers, HGNC symbols, or NCBI Entrez Gene identifiers
+        :param key: One of ``hgnc_id``, ``hgnc_symbol``, or ``entrez_id``
+        """
+        values_index = self._values_indexes.get(key)
+        if values_index is None:
+            value_to_row = self._get_value_to_row(key)
+            values_index = self._values_indexes[key] = (
+                pd.Index(list(value_to_row), dtype=object),
+                np.fromiter(value_to_row.values(), dtype=np.int64, count=len(value_to_row)),
+            )
+        values, rows = values_index
+        positions = values.get_indexer(pd.Index(list(identifiers), dtype=object))
+        return np.where(positions >= 0, rows[positions], -1)
+
+    def _enrich_chunk(self, names: Sequence[Any], queries: np.ndarray, rows: np.ndarray) -> pd.DataFrame:
+        """Calculate the enrichment for a chunk of gene sets at once.
+
+        :param names: The names of the gene sets
+        :param queries: The position of the gene set of each protein
+        :param rows: The row of each protein, or -1 if it isn't in the index
+        """
+        # each protein only counts once per gene set
+        found = rows >= 0
+        queries, rows = np.divmod(_unique(queries[found] * self.n_proteins + rows[found]), self.n_proteins)
+        query_sizes = np.bincount(queries, minlength=len(names))
+
+        # every protein of every gene set contributes a (gene set, pathway) pair for each of its pathways, and the
+        # number of times each pair occurs is its overlap. This is the product of a sparse gene set-protein matrix
+        # with the protein-pathway matrix
+        starts, ends = self.indptr[rows], self.indptr[rows + 1]
+        columns = self.indices[_concatenate_ranges(starts, ends)]
+        queries = np.repeat(queries, ends - starts)
+        n_pathways = len(self.pathway_ids)
+        pairs, mapped_proteins = np.unique(queries * n_pathways + columns, return_counts=True)
+        queries, columns = np.divmod(pairs, n_pathways)
+
+        pathway_sizes = self.pathway_sizes[columns]
+        p_values = hypergeometric_sf(
+            mapped_proteins,
+            pathway_sizes,
+            query_sizes[queries],
+            self.n_proteins,
+            log_factorials=self._log_factorials,
+        )
+
+        order = _argsort_groups(p_values, queries)
+        queries, columns, p_values = queries[order], columns[order], p_values[order]
+        return pd.DataFrame({
+            'query': np.array(names, dtype=object)[queries],
+            'pathway_id': self.pathway_ids[columns],
+            'mapped_proteins': mapped_proteins[order],
+            'pathway_size': pathway_sizes[order],
+            'query_size': query_sizes[queries],
+            'p_value': p_values,
+            'q_value': _adjust_sorted(p_values, queries, n_tests=n_pathways),
+        }, columns=BATCH_ENRICHMENT_COLUMNS)
+
+    def get_hgnc_symbols(self, column: int) -> Set[str]:
+        """Get the HGNC symbols of the proteins in a pathway.
+
+        :param column: The column of the pathway
+        """
+        rows = self._pathway_indices[self._pathway_indptr[column]:self._pathway_indptr[column + 1]]
+        return {symbol for symbol in self.hgnc_symbols[rows].tolist() if symbol}
+
+    def query_hgnc_symbols(self, hgnc_symbols: Iterable[str]) -> Mapping[str, Mapping]:
+        """Count the proteins of the query in each pathway, like the ``query_hgnc_symbols`` of ComPath managers.
+
+        :param hgnc_symbols: HGNC gene symbols
+        :return: The mapped pathways and their gene sets, keyed by the KEGG identifiers of the pathways
+        """
+        overlaps = self.count_overlaps(self.get_rows(hgnc_symbols, key='hgnc_symbol'))
+        rv = {}
+        for column in np.flatnonzero(overlaps).tolist():
+            pathway_id = self.pathway_ids[column]
+            pathway_gene_set = self.get_hgnc_symbols(column)
+            rv[pathway_id] = {
+                'pathway_id': pathway_id,
+                'pathway_name': self.pathway_names[column],
+                'mapped_proteins': int(overlaps[column]),
+                'pathway_size': len(pathway_gene_set),
+                'pathway_gene_set': pathway_gene_set,
+            }
+        return rv
+
+    def __len__(self) -> int:  # noqa: D105
+        return self.n_proteins
+
+
+def _unique(values: np.ndarray) -> np.ndarray:
+    """Get the sorted distinct values, which is faster with a sort than with :func:`numpy.unique` for integers."""
+    values = np.sort(values)
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:] = values[1:] != values[:-1]
+    return values[keep]
+
+
+def _concatenate_ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Get the concatenation of ``range(start, end)`` for each pair of starts and ends, without a Python loop."""
+    lengths = ends - starts
+    total = lengths.sum()
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    # each position is its offset in its range plus the start of its range
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return np.arange(total) + offsets
+
+
+def _get_log_factorials(n: int) -> np.ndarray:
+    """Get the natural logarithms of the factorials of 0 through ``n``."""
+    return np.concatenate([[0.0], np.cumsum(np.log(np.arange(1, n + 1, dtype=np.float64)))])
+
+
+def hypergeometric_sf(
+    k: np.ndarray,
+    big_k: np.ndarray,
+    n: Union[int, np.ndarray],
+    big_n: int,
+    log_factorials: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Calculate the probabilities of drawing at least ``k`` successes, for several numbers of successes.
+
+    This is the p-value of a one-sided Fisher's exact test, like ``scipy.stats.hypergeom.sf(k - 1, N, K, n)``,
+    calculated for many pathways and queries at once. Each distinct combination of the parameters is only calculated
+    once. When all terms of the sums fit in :data:`HYPERGEOMETRIC_GRID_SIZE`, they're calculated together in a grid.
+    Otherwise, the sums are built up term by term for all p-values together, from the ratios of consecutive terms,
+    over whichever tail decreases away from ``k``, until the terms are negligible.
+
+    :param k: The number of proteins of the query in each pathway
+    :param big_k: The number of proteins in each pathway
+    :param n: The number of proteins in the query, or in the query of each pathway
+    :param big_n: The number of proteins in all pathways
+    :param log_factorials: The logarithms of the factorials of 0 through ``big_n``, if they're already calculated
+    """
+    k, big_k, n = (
+        array.ravel()
+        for array in np.broadcast_arrays(
+            np.asarray(k, dtype=np.int64),
+            np.asarray(big_k, dtype=np.int64),
+            np.asarray(n, dtype=np.int64),
+        )
+    )
+    if not len(k):
+        return np.zeros(0, dtype=np.float64)
+    if log_factorials is None:
+        log_factorials = _get_log_factorials(big_n)
+
+    # all parameters are at most big_n (k can be one more), so they're packed in a single integer to find the
+    # distinct combinations quickly
+    base = big_n + 2
+    keys, inverse = np.unique((k.clip(0, base - 1) * base + big_k) * base + n, return_inverse=True)
+    keys, n = np.divmod(keys, base)
+    k, big_k = np.divmod(keys, base)
+
+    # the sums run over the support of the distribution from k upwards
+    starts = np.maximum(k, n - (big_n - big_k))
+    ends = np.minimum(n, big_k)
+    width = max(int((ends - starts).max()) + 1, 1)
+    if len(k) * width <= HYPERGEOMETRIC_GRID_SIZE:
+        p_values = _sum_grid(starts, ends, width, big_k, n, big_n, log_factorials)
+    else:
+        p_values = _sum_tails(k, starts, ends, big_k, n, big_n, log_factorials)
+    return np.minimum(p_values, 1.0)[inverse]
+
+
+def _get_log_terms(i, big_k, n, big_n: int, log_factorials: np.ndarray) -> np.ndarray:
+    """Get the logarithms of the probabilities of drawing exactly ``i`` successes."""
+    return (
+        _log_binomial(big_k, i, log_factorials)
+        + _log_binomial(big_n - big_k, n - i, log_factorials)
+        - _log_binomial(big_n, n, log_factorials)
+    )
+
+
+def _sum_grid(starts, ends, width: int, big_k, n, big_n: int, log_factorials: np.ndarray) -> np.ndarray:
+    """Sum all terms from the starts to the ends in a grid with a row for each sum."""
+    i = starts[:, np.newaxis] + np.arange(width)[np.newaxis, :]
+    valid = i <= ends[:, np.newaxis]
+    i = np.where(valid, i, starts[:, np.newaxis])
+    log_terms = _get_log_terms(i, big_k[:, np.newaxis], n[:, np.newaxis], big_n, log_factorials)
+    return np.where(valid, np.exp(log_terms), 0.0).sum(axis=1)
+
+
+def _sum_tails(k, starts, ends, big_k, n, big_n: int, log_factorials: np.ndarray) -> np.ndarray:
+    """Sum the upper tails from ``k`` above the mean and one minus the lower tails from ``k - 1`` below it."""
+    lower = np.maximum(0, n - (big_n - big_k))
+    upward = k * big_n > n * big_k
+    i = np.where(upward, starts, np.clip(k - 1, lower, ends))
+    terms = np.exp(_get_log_terms(i, big_k, n, big_n, log_factorials))
+    sums = terms.copy()
+    rest = big_n - big_k - n
+
+    active = np.flatnonzero(np.where(upward, i < ends, i > lower))
+    while len(active):
+        i_active, big_k_active, n_active, rest_active = i[active], big_k[active], n[active], rest[active]
+        upward_active = upward[active]
+        ratio = np.where(
+            upward_active,
+            (big_k_active - i_active) * (n_active - i_active) / ((i_active + 1) * (rest_active + i_active + 1)),
+            i_active * (rest_active + i_active) / ((big_k_active - i_active + 1) * (n_active - i_active + 1)),
+        )
+        terms_active = terms[active] * ratio
+        sums_active = sums[active] + terms_active
+        i_active = i_active + np.where(upward_active, 1, -1)
+        terms[active], sums[active], i[active] = terms_active, sums_active, i_active
+        # the terms only get smaller away from the mode, so a negligible term ends its sum
+        finished = (
+            np.where(upward_active, i_active >= ends[active], i_active <= lower[active])
+            | ((ratio < 1) & (terms_active < sums_active * 1e-17))
+        )
+        active = active[~finished]
+
+    p_values = np.where(upward, sums, 1.0 - sums)
+    p_values[k <= lower] = 1.0
+    p_values[starts > ends] = 0.0
+    return p_values
+
+
+def _log_binomial(n, k, log_factorials: np.ndarray):
+    k = np.clip(k, 0, n)
+    return log_factorials[n] - log_factorials[k] - log_factorials[n - k]
+
+
+def _argsort_groups(values: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    """Get the order that sorts by group, then by value within each group."""
+    # sorting the distinct integers that combine the group with the rank of the value is faster than a stable sort
+    ranks = np.empty(len(values), dtype=np.int64)
+    ranks[np.argsort(values, kind='stable')] = np.arange(len(values))
+    return np.argsort(groups.astype(np.int64) * len(values) + ranks)
+
+
+#: The distance between the logarithms of the q-values of consecutive groups in :func:`benjamini_hochberg`, which is
+#: more than the range of the logarithms of positive floats
+_GROUP_SHIFT = 1024.0
+
+
+def benjamini_hochberg(
+    p_values: np.ndarray,
+    groups: Optional[np.ndarray] = None,
+    n_tests: Optional[int] = None,
+) -> np.ndarray:
+    """Adjust p-values for the false discovery rate with the Benjamini-Hochberg procedure, separately in each group.
+
+    :param p_values: The p-values
+    :param groups: A non-negative integer for each p-value, like the query it belongs to. Defaults to a single group.
+    :param n_tests: The number of tests in each group, if it's more than the number of its p-values, like when the
+     tests with p-values of one are left out. Defaults to the number of p-values in each group.
+    :return: The q-value of each p-value, in the same order
+    """
+    p_values = np.asarray(p_values, dtype=np.float64)
+    groups = np.zeros(len(p_values), dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+    if not len(p_values):
+        return np.zeros(0, dtype=np.float64)
+
+    order = _argsort_groups(p_values, groups)
+    rv = np.empty(len(order), dtype=np.float64)
+    rv[order] = _adjust_sorted(p_values[order], groups[order], n_tests)
+    return rv
+
+
+def _adjust_sorted(p_values: np.ndarray, groups: np.ndarray, n_tests: Optional[int] = None) -> np.ndarray:
+    """Adjust p-values that are sorted by group then by p-value with the Benjamini-Hochberg procedure."""
+    is_start = np.ones(len(p_values), dtype=bool)
+    is_start[1:] = groups[1:] != groups[:-1]
+    positions = np.arange(len(p_values))
+    ranks = positions - np.maximum.accumulate(np.where(is_start, positions, 0)) + 1
+    codes = np.cumsum(is_start) - 1
+    if n_tests is None:
+        starts = np.flatnonzero(is_start)
+        n_tests = np.diff(np.append(starts, len(p_values)))[codes]
+
+    adjusted = np.minimum(p_values * n_tests / ranks, 1.0)
+
+    # each q-value is the smallest adjusted p-value at its rank or above in its group. The logarithms of the groups
+    # are shifted apart, with later groups higher, so a single running minimum from the end never carries a value
+    # from one group into the one before it
+    tiny = np.finfo(np.float64).tiny
+    shifted = np.log(np.maximum(adjusted, tiny)) + _GROUP_SHIFT * codes
+    q_values = np.exp(np.minimum.accumulate(shifted[::-1])[::-1] - _GROUP_SHIFT * codes)
+    q_values[q_values <= tiny] = 0.0
+    return np.minimum(q_values, 1.0)
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+"""Streaming exports of the protein-pathway memberships in the database to BEL.
+
+Instead of loading :class:`Pathway` and :class:`Protein` objects and building a :class:`pybel.BELGraph`, the
+memberships are read as plain rows of columns with a server-side cursor, ordered by organism then pathway. Each
+pathway node is made once when its first row arrives, and each protein node once per organism, since proteins are
+never shared between organisms. The lines are written as soon as they're made, so the memory used depends on the size
+of the largest organism rather than on the size of the database.
+
+Two formats are supported:
+
+1. ``bel``, a BEL script with a ``partOf`` statement for each membership, like the unqualified edges that
+   :func:`pybel.to_bel_script` writes
+2. ``jsonl``, node-link JSON lines. Each node is written once, before the first edge that uses it, as an object with
+   its ``id``, ``function``, ``concept``, and ``bel``. Each edge is an object with its ``source``, ``target``, and
+   ``relation``.
+"""
+
+import json
+import logging
+from typing import Callable, Iterable, Optional, TextIO, Tuple, TypeVar
+
+import pybel.dsl
+from bel_resources import make_knowledge_header
+from pybel.constants import CITATION_TYPE_PUBMED, PART_OF, PYBEL_AUTOEVIDENCE, PYBEL_PUBMED, SET_CITATION_FMT
+from sqlalchemy.orm import Session
+
+from .constants import KEGG
+from .models import Pathway, Protein, get_protein_node, protein_pathway
+
+__all__ = [
+    'FORMATS',
+    'iter_membership_nodes',
+    'iter_bel_lines',
+    'iter_nodelink_lines',
+    'write_export',
+]
+
+logger = logging.getLogger(__name__)
+
+#: The formats of :func:`write_export`
+FORMATS = ('bel', 'jsonl')
+
+#: The number of rows fetched from the database at a time
+EXPORT_CHUNK_SIZE = 10_000
+
+X = TypeVar('X')
+
+
+def _identity(node: pybel.dsl.BaseEntity) -> pybel.dsl.BaseEntity:
+    return node
+
+
+def iter_membership_nodes(
+    session: Session,
+    convert: Callable[[pybel.dsl.BaseEntity], X] = _identity,
+    chunk_size: Optional[int] = None,
+) -> Iterable[Tuple[X, X, bool, bool]]:
+    """Iterate over the protein and pathway nodes of each membership, ordered by organism then pathway.
+
+    :param session: A SQLAlchemy session
+    :param convert: A function applied once to each distinct node, like one that makes its BEL string
+    :param chunk_size: The number of rows fetched at a time. Defaults to :data:`EXPORT_CHUNK_SIZE`.
+    :return: Tuples of the converted protein node, the converted pathway node, and whether each of them is new
+    """
+    query = (
+        session.query(
+            Pathway.species_id,
+            Pathway.id,
+            Pathway.identifier,
+            Pathway.name,
+            Protein.hgnc_id,
+            Protein.hgnc_symbol,
+            Protein.entrez_id,
+        )
+        .select_from(protein_pathway)
+        .join(Pathway, Pathway.id == protein_pathway.c.pathway_id)
+        .join(Protein, Protein.id == protein_pathway.c.protein_id)
+        .order_by(Pathway.species_id, Pathway.id)
+        # fetch rows in chunks, from a server-side cursor on the backends that support one
+        .yield_per(chunk_size or EXPORT_CHUNK_SIZE)
+    )
+
+    last_species_id = last_pathway_id = pathway = None
+    proteins = {}
+    for species_id, pathway_id, identifier, name, hgnc_id, hgnc_symbol, entrez_id in query:
+        if species_id != last_species_id:
+            proteins.clear()
+            last_species_id = species_id
+
+        new_pathway = pathway_id != last_pathway_id
+        if new_pathway:
+            pathway = convert(pybel.dsl.BiologicalProcess(namespace=KEGG, name=name, identifier=identifier))
+            last_pathway_id = pathway_id
+
+        # proteins with the same identifiers, like the products of the same gene, make the same node
+        key = (hgnc_id, hgnc_symbol) if hgnc_id else entrez_id
+        protein = proteins.get(key)
+        new_protein = protein is None
+        if new_protein:
+            protein = proteins[key] = convert(get_protein_node(hgnc_id, hgnc_symbol, entrez_id))
+
+        yield protein, pathway, new_protein, new_pathway
+
+
+def iter_bel_lines(
+    session: Session,
+    name: str,
+    version: str = '1.0.0',
+    chunk_size: Optional[int] = None,
+) -> Iterable[str]:
+    """Iterate over the lines of a BEL script with a ``partOf`` statement for each membership.
+
+    :param session: A SQLAlchemy session
+    :param name: The name of the BEL document
+    :param version: The version of the BEL document
+    :param chunk_size: The number of rows fetched at a time. Defaults to :data:`EXPORT_CHUNK_SIZE`.
+    """
+    yield from make_knowledge_header(name=name, version=version)
+    yield SET_CITATION_FMT.format(CITATION_TYPE_PUBMED, PYBEL_PUBMED)
+    yield f'SET SupportingText = "{PYBEL_AUTOEVIDENCE}"'
+    for protein_bel, pathway_bel, _, _ in iter_membership_nodes(session, _to_bel, chunk_size=chunk_size):
+        yield f'{protein_bel} {PART_OF} {pathway_bel}'
+    yield 'UNSET SupportingText'
+    yield 'UNSET Citation'
+
+
+def iter_nodelink_lines(session: Session, chunk_size: Optional[int] = None) -> Iterable[str]:
+    """Iterate over node-link JSON lines, with each node written before the first edge that uses it.
+
+    :param session: A SQLAlchemy session
+    :param chunk_size: The number of rows fetched at a time. Defaults to :data:`EXPORT_CHUNK_SIZE`.
+    """
+    nodes = iter_membership_nodes(session, _to_nodelink, chunk_size=chunk_size)
+    for (protein_id, protein_line), (pathway_id, pathway_line), new_protein, new_pathway in nodes:
+        if new_pathway:
+            yield pathway_line
+        if new_protein:
+            yield protein_line
+        yield json.dumps({'source': protein_id, 'target': pathway_id, 'relation': PART_OF})
+
+
+def _to_bel(node: pybel.dsl.BaseEntity) -> str:
+    return node.as_bel()
+
+
+def _to_nodelink(node: pybel.dsl.BaseEntity) -> Tuple[str, str]:
+    node_id = node.md5
+    return node_id, json.dumps(dict(node, id=node_id, bel=node.as_bel()))
+
+
+def write_export(
+    session: Session,
+    file: TextIO,
+    fmt: str = 'bel',
+    name: str = 'KEGG',
+    chunk_size: Optional[int] = None,
+) -> int:
+    """Write all memberships to a file, one line at a time.
+
+    :param session: A SQLAlchemy session
+    :param file: A file opened for writing text
+    :param fmt: One of ``bel`` or ``jsonl``
+    :param name: The name of the BEL document, for the ``bel`` format
+    :param chunk_size: The number of rows fetched at a time. Defaults to :data:`EXPORT_CHUNK_SIZE`.
+    :return: The number of lines written
+    """
+    if fmt == 'bel':
+        lines = iter_bel_lines(session, name=name, chunk_size=chunk_size)
+    elif fmt == 'jsonl':
+        lines = iter_nodelink_lines(session, chunk_size=chunk_size)
+    else:
+        raise ValueError(f'invalid format: {fmt}. Use one of {", ".join(FORMATS)}')
+
+    count = 0
+    for line in lines:
+        print(line, file=file)  # noqa:T001
+        count += 1
+    logger.info('wrote %d lines of %s', count, fmt)
+    return count
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+"""An asynchronous fetcher for the KEGG RESTful API.
+
+Requests are scheduled on an :mod:`asyncio` event loop running in a background thread. They are sent over a pool of
+persistent (keep-alive) HTTP connections, throttled with a token bucket so KEGG's rate limits are respected, and
+transient failures are retried with jittered exponential backoff. Requests that still fail are reported with their
+error instead of being dropped.
+"""
+
+import asyncio
+import logging
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .constants import KEGG_MAX_CONNECTIONS, KEGG_REQUESTS_PER_SECOND
+from .metrics import increment, observe
+
+__all__ = [
+    'Fetcher',
+    'FetchResult',
+    'OfflineFetcher',
+    'TokenBucket',
+]
+
+logger = logging.getLogger(__name__)
+
+#: HTTP status codes that are worth retrying
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+_DONE = object()
+
+
+class FetchResult(NamedTuple):
+    """The outcome of fetching a URL."""
+
+    #: The URL that was requested
+    url: str
+    #: The body of the response, or None if the request failed for good
+    text: Optional[str]
+    #: A description of the last error if the request failed for good
+    error: Optional[str] = None
+
+
+class TokenBucket:
+    """A token bucket that limits how many requests are started per second."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """Initialize the token bucket.
+
+        :param rate: The number of tokens added per second
+        :param capacity: The maximum number of tokens that can be saved up for a burst. Defaults to one.
+        """
+        if rate <= 0:
+            raise ValueError(f'rate must be positive: {rate}')
+        self.rate = rate
+        self.capacity = capacity or 1.0
+        self._tokens = self.capacity
+        self._last = None
+        self._lock = None
+
+    async def acquire(self) -> None:
+        """Wait until a token is available then take it."""
+        loop = asyncio.get_event_loop()
+        if self._lock is None:  # create lazily so it belongs to the running loop
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = loop.time()
+                if self._last is not None:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Fetcher:
+    """Fetches many URLs concurrently over persistent connections."""
+
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        requests_per_second: Optional[float] = None,
+        max_retries: int = 5,
+        backoff_factor: float = 0.5,
+        max_backoff: float = 60.0,
+        timeout: float = 60.0,
+    ):
+        """Initialize the fetcher.
+
+        :param max_connections: The number of requests in flight at the same time, each using its own
+         persistent connection. Defaults to :data:`bio2bel_kegg.constants.KEGG_MAX_CONNECTIONS`.
+        :param requests_per_second: The most requests started per second. Defaults to
+         :data:`bio2bel_kegg.constants.KEGG_REQUESTS_PER_SECOND`.
+        :param max_retries: The number of times a transient failure is retried
+        :param backoff_factor: The base of the exponential backoff in seconds. The n-th retry waits a random
+         time up to ``backoff_factor * 2 ** n`` seconds, or longer if the server asks for it with Retry-After.
+        :param max_backoff: The longest time in seconds to wait before a retry
+        :param timeout: The timeout in seconds for connecting and for reading each response
+        """
+        self.max_connections = max_connections or KEGG_MAX_CONNECTIONS
+        self.requests_per_second = requests_per_second or KEGG_REQUESTS_PER_SECOND
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+    def iter_texts(self, urls: Iterable[str], queue_size: int = 0) -> Iterator[FetchResult]:
+        """Fetch the URLs and yield the results as they complete, which is not necessarily in order.
+
+        :param urls: The URLs to fetch. The iterable is consumed lazily.
+        :param queue_size: The most results that are buffered before fetching pauses. Defaults to no limit.
+        """
+        results = queue.Queue(maxsize=queue_size)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._run, args=(iter(urls), results, stop), daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = results.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            while thread.is_alive():  # unblock the event loop in case it waits on a full queue
+                try:
+                    results.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            thread.join()
+
+    def _run(self, urls: Iterator[str], results: queue.Queue, stop: threading.Event) -> None:
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self._fetch_all(urls, results, stop))
+        except BaseException as e:
+            results.put(e)
+        finally:
+            loop.close()
+            results.put(_DONE)
+
+    async def _fetch_all(self, urls: Iterator[str], results: queue.Queue, stop: threading.Event) -> None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_connections, pool_block=True)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        bucket = TokenBucket(self.requests_per_second)
+        executor = ThreadPoolExecutor(max_workers=self.max_connections)
+        try:
+            await asyncio.gather(*(
+                self._worker(urls, results, stop, session=session, bucket=bucket, executor=executor)
+                for _ in range(self.max_connections)
+            ))
+        finally:
+            executor.shutdown(wait=True)
+            session.close()
+
+    async def _worker(self, urls: Iterator[str], results: queue.Queue, stop: threading.Event, **kwargs) -> None:
+        # all workers run on the same thread, so they can safely share the iterator
+        for url in urls:
+            if stop.is_set():
+                return
+            result = await self._fetch(url, stop, **kwargs)
+            while True:
+                try:
+                    results.put_nowait(result)
+                except queue.Full:
+                    if stop.is_set():
+                        return
+                    await asyncio.sleep(0.01)
+                else:
+                    break
+
+    async def _fetch(
+        self,
+        url: str,
+        stop: threading.Event,
+        *,
+        session: requests.Session,
+        bucket: TokenBucket,
+        executor: ThreadPoolExecutor,
+    ) -> FetchResult:
+        loop = asyncio.get_event_loop()
+        error = None
+        for attempt in range(1 + self.max_retries):
+            if attempt:
+                logger.debug('retrying %s after %s (attempt %d)', url, error, attempt)
+                increment('http.retries')
+            await bucket.acquire()
+            retry_after = None
+            increment('http.requests')
+            start = time.perf_counter()
+            try:
+                response = await loop.run_in_executor(executor, partial(session.get, url, timeout=self.timeout))
+            except requests.RequestException as e:
+                observe('http.latency', time.perf_counter() - start)
+                increment('http.errors')
+                error = f'{e.__class__.__name__}: {e}'
+            else:
+                observe('http.latency', time.perf_counter() - start)
+                increment('http.bytes', len(response.content))
+                increment(f'http.status.{response.status_code}')
+                if response.status_code == 200:
+                    return FetchResult(url, response.content.decode('utf-8'))
+                if response.status_code == 404:  # KEGG's answer when none of the requested entries exist
+                    return FetchResult(url, '')
+                error = f'HTTP {response.status_code}'
+                if response.status_code not in RETRY_STATUS_CODES:
+                    break
+                retry_after = response.headers.get('Retry-After')
+
+            if attempt < self.max_retries and not stop.is_set():
+                await asyncio.sleep(self._get_delay(attempt, retry_after))
+
+        increment('http.failures')
+        return FetchResult(url, None, error)
+
+    def _get_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Get a full-jitter exponential backoff delay, respecting the Retry-After header if it's given in seconds."""
+        delay = random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))  # noqa:S311
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, min(self.max_backoff, float(retry_after)))
+        return delay
+
+
+class OfflineFetcher(Fetcher):
+    """A fetcher that never sends requests, for populating from a bundle without the network.
+
+    Each URL fails right away, so the entities that are missing from the store are logged and skipped.
+    """
+
+    def iter_texts(self, urls: Iterable[str], queue_size: int = 0) -> Iterator[FetchResult]:  # noqa: D102
+        for url in urls:
+            yield FetchResult(url, None, 'offline')
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+"""A bounded least-recently-used cache of lightweight records of pathways and proteins.
+
+The records are immutable named tuples made from plain columns, so they can be shared between threads and outlive the
+session that loaded them, unlike ORM objects. Entries can expire after a time to live, which bounds how long a process
+serves records that another process has since changed in the database. The manager clears its cache itself whenever
+it populates, updates, or drops the database.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, NamedTuple, Optional, TypeVar
+
+__all__ = [
+    'CacheInfo',
+    'LookupCache',
+    'PathwayRecord',
+    'ProteinRecord',
+]
+
+X = TypeVar('X')
+
+
+class PathwayRecord(NamedTuple):
+    """A pathway, detached from the database."""
+
+    #: The KEGG identifier, like hsa00010
+    identifier: str
+    name: str
+    definition: Optional[str]
+    #: The KEGG code of the organism, like hsa
+    kegg_code: Optional[str]
+
+
+class ProteinRecord(NamedTuple):
+    """A protein, detached from the database."""
+
+    #: The KEGG identifier, like hsa:5214
+    kegg_id: str
+    entrez_id: str
+    uniprot_id: Optional[str]
+    hgnc_id: Optional[str]
+    hgnc_symbol: Optional[str]
+
+
+class CacheInfo(NamedTuple):
+    """The statistics of a :class:`LookupCache`."""
+
+    hits: int
+    misses: int
+    size: int
+    maxsize: int
+    ttl: Optional[float]
+
+
+class LookupCache:
+    """A thread-safe least-recently-used cache whose entries can expire."""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None, timer: Callable[[], float] = time.monotonic):
+        """Initialize the cache.
+
+        :param maxsize: The largest number of entries. The least recently used entry is evicted to make room.
+        :param ttl: The number of seconds after which an entry expires. If None, entries don't expire.
+        :param timer: The clock used for expiry
+        """
+        if maxsize < 1:
+            raise ValueError(f'maxsize must be positive: {maxsize}')
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # incremented by clear, so values loaded from before a clear are never stored after it
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, load: Callable[[], X]) -> X:
+        """Get the value for a key, loading and storing it if it's missing or expired.
+
+        :param key: The key
+        :param load: A function that loads the value, called without holding the lock. None is cached like any other
+         value, so lookups of missing identifiers are cached too.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires is None or self._timer() < expires:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            generation = self._generation
+
+        value = load()
+
+        with self._lock:
+            if generation == self._generation:
+                expires = None if self.ttl is None else self._timer() + self.ttl
+                self._entries[key] = expires, value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        """Remove all entries, keeping the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def info(self) -> CacheInfo:
+        """Get the hit and miss counters and the size of the cache."""
+        with self._lock:
+            return CacheInfo(
+                hits=self.hits,
+                misses=self.misses,
+                size=len(self._entries),
+                maxsize=self.maxsize,
+                ttl=self.ttl,
+            )
+
+    def __len__(self) -> int:  # noqa: D105
+        return len(self._entries)
@@ -2,19 +2,53 @@
 
 """Manager for Bio2BEL KEGG."""
 
+import hashlib
+import io
+import itertools as itt
 import logging
-from typing import List, Mapping, Optional
+import os
+import sys
+import time
+from collections import defaultdict
+from contextlib import ExitStack, nullcontext
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Set, TextIO, Tuple, Union
 
+import click
+import numpy as np
+import pandas as pd
+from more_click import verbose_option
+from sqlalchemy import and_, bindparam, func
 from tqdm import tqdm
 
 from bio2bel.compath import CompathManager
+from .bundle import Bundle, build_bundle, get_list_paths
 from .client import (
-    ENTREZ_ID_TO_HGNC_ID, HGNC_ID_TO_SYMBOL, get_entities_lines, parse_pathway_lines,
-    parse_protein_lines,
+    PathwayEntry, ProteinEntry, get_entities_lines, get_pathway_proteins, iter_entities_texts, parse_entities,
+    parse_pathway_entry, parse_protein_entry,
 )
-from .constants import MODULE_NAME
-from .models import Base, Pathway, Protein, Species, protein_pathway
-from .parsers import get_entity_pathway_df, get_organisms_df, get_pathway_df
+from .constants import (
+    ENTITY_STORE_MAX_SIZE, IN_QUERY_CHUNK_SIZE, LOOKUP_CACHE_SIZE, LOOKUP_CACHE_TTL, MODULE_NAME,
+    PATHWAY_SIMILARITY_DIRECTORY, PROTEIN_SOURCES,
+)
+from .enrichment import Enrichment, GeneSets, MembershipIndex
+from .export import FORMATS, write_export
+from .fetcher import Fetcher, OfflineFetcher
+from .lookup_cache import CacheInfo, LookupCache, PathwayRecord, ProteinRecord
+from .mappings import HGNCMapping, get_hgnc_mapping
+from .matrix import MembershipMatrix
+from .metrics import collect_metrics, increment, measured
+from .models import (
+    Base, Pathway, PathwayCategory, Protein, Release, Species, pathway_hierarchy, protein_pathway, related_pathway,
+)
+from .organisms import OrganismEntries, iter_organisms_entries
+from .parsers import (
+    PATHWAY_HIERARCHY_NAME, get_conv_protein_entries, get_entity_pathway_df, get_kegg_release, get_ncbigene_conv_df,
+    get_organisms_df, get_pathway_df, get_pathway_hierarchy, get_uniprot_conv_df, parse_pathway_hierarchy,
+    remove_path_prefix,
+)
+from .similarity import PathwaySimilarity
+from .store import EntityStore, get_entity_store, migrate_entity_store, prune_default_entity_store
+from .utils import add_missing_columns, bulk_load_transaction, create_missing_indexes, iter_chunks
 
 __all__ = [
     'Manager',
@@ -24,6 +58,48 @@ logger = logging.getLogger(__name__)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
 
 
+def _check_records_usage(store: EntityStore) -> None:
+    """Exit the command if the store doesn't record the use of its entities, which the cache commands need."""
+    if not store.records_usage:
+        click.secho(f'{store.__class__.__name__} does not record the use of its entities', fg='red')
+        sys.exit(1)
+
+
+def _get_map_number(kegg_pathway_id: str) -> str:
+    """Get the number of the reference map of a pathway, like 00010 for hsa00010."""
+    return kegg_pathway_id[-5:]
+
+
+metrics_option = click.option(
+    '--metrics',
+    type=click.Path(dir_okay=False),
+    help='Write a JSON report of the timings and counters here. Defaults to $BIO2BEL_KEGG_METRICS.',
+)
+
+protein_source_option = click.option(
+    '--proteins',
+    'protein_source',
+    type=click.Choice(PROTEIN_SOURCES),
+    default='entries',
+    show_default=True,
+    help='Fetch the flat file of each protein, take the proteins from the GENE sections of the pathways, or take them'
+         ' from the protein-pathway links with the identifiers of the conv tables',
+)
+
+
+def _collect_metrics(path: Optional[str]):
+    return collect_metrics(path) if path else nullcontext()
+
+
+def _get_uniprot_id(protein: ProteinEntry) -> Optional[str]:
+    """Get the UniProt identifiers of a protein from its cross-references, separated by spaces."""
+    return ' '.join(identifier for prefix, identifier in protein.xrefs if prefix == 'uniprot') or None
+
+
+def _get_human_species() -> Species:
+    return Species(name='Homo sapiens', taxonomy_id='9606', kegg_code='hsa', kegg_genome_id='T01001')
+
+
 class Manager(CompathManager):
     """Protein-pathway memberships."""
 
@@ -34,6 +110,198 @@ class Manager(CompathManager):
     edge_model = protein_pathway
     protein_model = Protein
 
+    def __init__(
+        self,
+        *args,
+        lookup_cache_size: Optional[int] = None,
+        lookup_cache_ttl: Optional[float] = None,
+        **kwargs,
+    ):
+        """Initialize the manager.
+
+        :param lookup_cache_size: The number of records kept by :meth:`get_pathway_record` and
+         :meth:`get_protein_record`. Defaults to :data:`bio2bel_kegg.constants.LOOKUP_CACHE_SIZE`. If 0, there's no
+         cache.
+        :param lookup_cache_ttl: The number of seconds after which cached records expire. Defaults to
+         :data:`bio2bel_kegg.constants.LOOKUP_CACHE_TTL`. If 0, they're kept until the database is changed by this
+         manager.
+        """
+        super().__init__(*args, **kwargs)
+        self._membership_indexes = {}
+        self._pathway_similarity = None
+
+        if lookup_cache_size is None:
+            lookup_cache_size = LOOKUP_CACHE_SIZE
+        if lookup_cache_ttl is None:
+            lookup_cache_ttl = LOOKUP_CACHE_TTL
+        self.lookup_cache = (
+            LookupCache(maxsize=lookup_cache_size, ttl=lookup_cache_ttl or None)
+            if lookup_cache_size else
+            None
+        )
+
+    def create_all(self, check_first: bool = True) -> None:
+        """Create the tables, and the columns and indexes that tables created by older versions don't have yet."""
+        super().create_all(check_first=check_first)
+        added = add_missing_columns(self.engine, self._metadata)
+        for name in added:
+            logger.info('added column %s', name)
+        if f'{Species.__tablename__}.kegg_code' in added:
+            self._set_human_kegg_code()
+        for name in create_missing_indexes(self.engine, self._metadata):
+            logger.info('created index %s', name)
+
+    def _set_human_kegg_code(self) -> None:
+        """Set the KEGG code of the species of human loaded by older versions, which only loaded human."""
+        species_id = (
+            self.session.query(func.min(Species.id))
+            .filter(Species.taxonomy_id == '9606', Species.kegg_code.is_(None))
+            .scalar()
+        )
+        if species_id is None:
+            return
+        self.session.execute(
+            Species.__table__.update()
+            .where(Species.id == species_id)
+            .values(kegg_code='hsa', kegg_genome_id='T01001'),
+        )
+        self.session.commit()
+
+    def _invalidate_caches(self) -> None:
+        """Clear the caches built from the database, after its content changed."""
+        self._membership_indexes.clear()
+        self._pathway_similarity = None
+        if self.lookup_cache is not None:
+            self.lookup_cache.clear()
+
+    def drop_all(self, check_first: bool = True) -> None:
+        """Drop all tables from the database and clear the caches built from it."""
+        super().drop_all(check_first=check_first)
+        self._invalidate_caches()
+
+    @property
+    def pathway_similarity_path(self) -> str:
+        """The path of the archive of the pathway similarity matrix, which is different for each database."""
+        digest = hashlib.sha256(self.connection.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(PATHWAY_SIMILARITY_DIRECTORY, f'{digest}.npz')
+
+    def get_pathway_similarity(self) -> PathwaySimilarity:
+        """Get the overlaps of all pairs of pathways, loading them from their archive if it's up to date.
+
+        The matrix is recalculated and saved again when the database is populated or updated. An archive is up to date
+        if it was counted from the same memberships, by the checksum of the membership index.
+        """
+        if self._pathway_similarity is not None:
+            return self._pathway_similarity
+
+        path = self.pathway_similarity_path
+        if os.path.exists(path):
+            similarity = PathwaySimilarity.load(path)
+            if (
+                len(similarity.pathway_ids) == self.count_pathways()
+                and similarity.n_memberships == self.session.query(protein_pathway).count()
+                and similarity.checksum == self.get_membership_index().get_checksum()
+            ):
+                self._pathway_similarity = similarity
+                return similarity
+            logger.info('the pathway similarity matrix in %s is out of date', path)
+
+        return self.refresh_pathway_similarity()
+
+    @measured('similarity.refresh')
+    def refresh_pathway_similarity(self) -> PathwaySimilarity:
+        """Calculate the overlaps of all pairs of pathways and save them in their archive."""
+        similarity = PathwaySimilarity.from_membership_index(self.get_membership_index())
+        similarity.save(self.pathway_similarity_path)
+        self._pathway_similarity = similarity
+        return similarity
+
+    def get_similar_pathways(self, kegg_pathway_id: str, k: int = 10, metric: str = 'jaccard') -> pd.DataFrame:
+        """Get the pathways that share the most proteins with a pathway.
+
+        :param kegg_pathway_id: The KEGG identifier of a pathway, like ``hsa00010``
+        :param k: The largest number of pathways returned
+        :param metric: One of ``overlap``, ``jaccard``, or ``overlap_coefficient``
+        """
+        return self.get_pathway_similarity().get_most_similar(kegg_pathway_id, k=k, metric=metric)
+
+    def get_similar_pathway_pairs(self, threshold: float, metric: str = 'jaccard') -> pd.DataFrame:
+        """Get all pairs of pathways whose similarity is at least the threshold.
+
+        :param threshold: The lowest value of the metric
+        :param metric: One of ``overlap``, ``jaccard``, or ``overlap_coefficient``
+        """
+        return self.get_pathway_similarity().get_pairs(threshold, metric=metric)
+
+    def get_membership_index(self, kegg_code: Optional[str] = None) -> MembershipIndex:
+        """Get the in-memory index of protein-pathway memberships, building it the first time it's used.
+
+        The index is rebuilt after the database is populated or updated.
+
+        :param kegg_code: The KEGG code of an organism, like ``hsa``, to which the index is restricted. Defaults to
+         all organisms in the database.
+        """
+        index = self._membership_indexes.get(kegg_code)
+        if index is None:
+            index = self._membership_indexes[kegg_code] = MembershipIndex.from_session(
+                self.session,
+                species_id=self._get_species_id(kegg_code),
+            )
+        return index
+
+    def _get_species_id(self, kegg_code: Optional[str]) -> Optional[int]:
+        """Get the primary key of the species of an organism, or None if no organism is given."""
+        if kegg_code is None:
+            return None
+        species_id = self.session.query(Species.id).filter(Species.kegg_code == kegg_code).scalar()
+        if species_id is None:
+            raise ValueError(f'organism is not loaded: {kegg_code}')
+        return species_id
+
+    def query_hgnc_symbols(self, hgnc_symbols: Iterable[str]) -> Mapping[str, Mapping]:
+        """Calculate the pathway counter dictionary with the in-memory membership index.
+
+        :param hgnc_symbols: An iterable of HGNC gene symbols to be queried
+        :return: Enriched pathways with mapped pathways/total
+        """
+        return self.get_membership_index().query_hgnc_symbols(hgnc_symbols)
+
+    def enrich_pathways_for_genes(
+        self,
+        identifiers: Iterable[str],
+        key: str = 'hgnc_symbol',
+        kegg_code: Optional[str] = None,
+    ) -> Enrichment:
+        """Calculate the hypergeometric enrichment of pathways for a set of genes.
+
+        :param identifiers: HGNC identifiers, HGNC symbols, or NCBI Entrez Gene identifiers
+        :param key: One of ``hgnc_id``, ``hgnc_symbol``, or ``entrez_id``
+        :param kegg_code: The KEGG code of the organism whose pathways are tested, like ``hsa``. Defaults to all
+         organisms in the database.
+        """
+        return self.get_membership_index(kegg_code=kegg_code).enrich(identifiers, key=key)
+
+    def iter_batch_enrichment(
+        self,
+        gene_sets: GeneSets,
+        key: str = 'hgnc_symbol',
+        kegg_code: Optional[str] = None,
+        chunk_size: Optional[int] = None,
+    ) -> Iterable[pd.DataFrame]:
+        """Calculate the enrichment of pathways for many gene sets, yielding a table for each chunk of gene sets.
+
+        :param gene_sets: A sequence or mapping of gene sets, or a data frame with a row for each gene set and a column
+         for each gene
+        :param key: One of ``hgnc_id``, ``hgnc_symbol``, or ``entrez_id``
+        :param kegg_code: The KEGG code of the organism whose pathways are tested, like ``hsa``. Defaults to all
+         organisms in the database.
+        :param chunk_size: The number of gene sets in each table. Defaults to 1000.
+
+        See :meth:`bio2bel_kegg.enrichment.MembershipIndex.iter_batch_enrichment` for the columns of the tables.
+        """
+        index = self.get_membership_index(kegg_code=kegg_code)
+        return index.iter_batch_enrichment(gene_sets, key=key, chunk_size=chunk_size)
+
     def get_or_create_pathway(
         self,
         kegg_pathway_id: str,
@@ -46,8 +314,7 @@ class Manager(CompathManager):
         :param kegg_pathway_id: A KEGG pathway identifier
         :param name: name of the pathway
         """
-        if kegg_pathway_id.startswith('path:'):
-            kegg_pathway_id = kegg_pathway_id[len('path:'):]
+        kegg_pathway_id = remove_path_prefix(kegg_pathway_id)
 
         pathway = self.get_pathway_by_id(kegg_pathway_id)
         if pathway is None:
@@ -76,105 +343,1037 @@ class Manager(CompathManager):
         """Get a protein by its hgnc symbol."""
         return self.session.query(Protein).filter(Protein.hgnc_symbol == hgnc_symbol).one_or_none()
 
+    def get_pathway_category(self, name: str) -> Optional[PathwayCategory]:
+        """Get a category of the hierarchy of pathway maps by its name, like ``Metabolism``.
+
+        Names of categories are looked up before names of reference maps, and higher levels before lower ones.
+        """
+        return (
+            self.session.query(PathwayCategory)
+            .filter(PathwayCategory.name == name)
+            .order_by(PathwayCategory.map_number.isnot(None), PathwayCategory.level, PathwayCategory.id)
+            .first()
+        )
+
+    def _query_under_category(self, name: str):
+        """Query the primary keys of the pathways under all the categories with the given name, through the closure."""
+        category_ids = self.session.query(PathwayCategory.id).filter(PathwayCategory.name == name)
+        return self.session.query(pathway_hierarchy.c.pathway_id).filter(
+            pathway_hierarchy.c.category_id.in_(category_ids),
+        )
+
+    def get_pathways_under_category(self, name: str, kegg_code: Optional[str] = None) -> List[Pathway]:
+        """Get the pathways under a category of the hierarchy of pathway maps at any depth.
+
+        :param name: The name of a category, like ``Metabolism`` or ``Carbohydrate metabolism``
+        :param kegg_code: The KEGG code of an organism, like ``hsa``, to which the pathways are restricted
+        """
+        query = self.session.query(Pathway).filter(Pathway.id.in_(self._query_under_category(name)))
+        species_id = self._get_species_id(kegg_code)
+        if species_id is not None:
+            query = query.filter(Pathway.species_id == species_id)
+        return query.order_by(Pathway.identifier).all()
+
+    def get_proteins_under_category(self, name: str, kegg_code: Optional[str] = None) -> List[Protein]:
+        """Get the proteins in any pathway under a category of the hierarchy of pathway maps.
+
+        :param name: The name of a category, like ``Metabolism`` or ``Carbohydrate metabolism``
+        :param kegg_code: The KEGG code of an organism, like ``hsa``, to which the pathways are restricted
+        """
+        pathway_ids = self._query_under_category(name)
+        species_id = self._get_species_id(kegg_code)
+        if species_id is not None:
+            pathway_ids = pathway_ids.join(Pathway, Pathway.id == pathway_hierarchy.c.pathway_id).filter(
+                Pathway.species_id == species_id,
+            )
+        protein_ids = self.session.query(protein_pathway.c.protein_id).filter(
+            protein_pathway.c.pathway_id.in_(pathway_ids),
+        )
+        return self.session.query(Protein).filter(Protein.id.in_(protein_ids)).order_by(Protein.kegg_id).all()
+
+    def get_pathway_record(self, pathway_id: str) -> Optional[PathwayRecord]:
+        """Get a detached record of a pathway, from the lookup cache if it's enabled.
+
+        :param pathway_id: A KEGG pathway identifier, like ``hsa00010``
+        """
+        return self._get_record(('pathway', pathway_id), lambda: self._query_pathway_record(pathway_id))
+
+    def _query_pathway_record(self, pathway_id: str) -> Optional[PathwayRecord]:
+        row = (
+            self.session.query(Pathway.identifier, Pathway.name, Pathway.definition, Species.kegg_code)
+            .outerjoin(Species, Species.id == Pathway.species_id)
+            .filter(Pathway.identifier == pathway_id)
+            .first()
+        )
+        return row and PathwayRecord(*row)
+
+    def get_protein_record(self, identifier: str, key: str = 'kegg_id') -> Optional[ProteinRecord]:
+        """Get a detached record of a protein, from the lookup cache if it's enabled.
+
+        :param identifier: The identifier of the protein
+        :param key: One of ``kegg_id``, ``hgnc_id``, ``hgnc_symbol``, or ``entrez_id``. If several proteins have the
+         identifier, the one that was loaded first is used.
+        """
+        if key not in ProteinRecord._fields or key == 'uniprot_id':
+            raise ValueError(f'invalid key: {key}. Use one of kegg_id, hgnc_id, hgnc_symbol, or entrez_id')
+        return self._get_record(('protein', key, identifier), lambda: self._query_protein_record(identifier, key))
+
+    def _query_protein_record(self, identifier: str, key: str) -> Optional[ProteinRecord]:
+        row = (
+            self.session.query(*(getattr(Protein, field) for field in ProteinRecord._fields))
+            .filter(getattr(Protein, key) == identifier)
+            .order_by(Protein.id)
+            .first()
+        )
+        return row and ProteinRecord(*row)
+
+    def _get_record(self, key, load):
+        if self.lookup_cache is None:
+            return load()
+        return self.lookup_cache.get(key, load)
+
+    def get_lookup_cache_info(self) -> Optional[CacheInfo]:
+        """Get the hit and miss counters and the size of the lookup cache, or None if it's disabled."""
+        return self.lookup_cache and self.lookup_cache.info()
+
+    def get_kegg_id_to_protein(self, kegg_ids: Iterable[str]) -> Dict[str, Protein]:
+        """Get the proteins with the given KEGG identifiers, in chunked queries.
+
+        :param kegg_ids: KEGG protein identifiers, like ``hsa:5214``
+        :return: A dictionary from each identifier found to its protein
+        """
+        return self._get_value_to_model(Protein.kegg_id, kegg_ids)
+
+    def get_hgnc_id_to_protein(self, hgnc_ids: Iterable[str]) -> Dict[str, Protein]:
+        """Get the proteins with the given HGNC identifiers, in chunked queries.
+
+        :param hgnc_ids: HGNC identifiers
+        :return: A dictionary from each identifier found to its protein. If several proteins have the same
+         identifier, the one that was loaded first is used.
+        """
+        return self._get_value_to_model(Protein.hgnc_id, hgnc_ids)
+
+    def get_hgnc_symbol_to_protein(self, hgnc_symbols: Iterable[str]) -> Dict[str, Protein]:
+        """Get the proteins with the given HGNC symbols, in chunked queries.
+
+        :param hgnc_symbols: HGNC symbols
+        :return: A dictionary from each symbol found to its protein. If several proteins have the same symbol, the
+         one that was loaded first is used.
+        """
+        return self._get_value_to_model(Protein.hgnc_symbol, hgnc_symbols)
+
+    def get_pathway_id_to_pathway(self, pathway_ids: Iterable[str]) -> Dict[str, Pathway]:
+        """Get the pathways with the given KEGG identifiers, in chunked queries.
+
+        :param pathway_ids: KEGG pathway identifiers, like ``hsa00010``
+        :return: A dictionary from each identifier found to its pathway
+        """
+        return self._get_value_to_model(Pathway.identifier, pathway_ids)
+
+    def _get_value_to_model(self, column, values: Iterable[str]) -> Dict[str, Base]:
+        """Look up models by the values of a column with an ``IN`` query for each chunk of distinct values."""
+        model = column.class_
+        rv = {}
+        for chunk in iter_chunks(sorted(set(values)), IN_QUERY_CHUNK_SIZE):
+            for instance in self.session.query(model).filter(column.in_(chunk)).order_by(model.id):
+                rv.setdefault(getattr(instance, column.key), instance)
+        return rv
+
+    def _help_get_proteins(self, protein_column, queries: Iterable[str]) -> List[Protein]:
+        """Get the proteins whose column has one of the given values, in chunked queries."""
+        return [
+            protein
+            for chunk in iter_chunks(sorted(set(queries)), IN_QUERY_CHUNK_SIZE)
+            for protein in self.session.query(Protein).filter(protein_column.in_(chunk))
+        ]
+
     """Methods to populate the DB"""
 
-    def _populate_organisms(self, url: Optional[str] = None):
-        organisms_df = get_organisms_df(url=url)
+    @measured('populate_organisms', collect=True)
+    def populate_organisms(
+        self,
+        organisms: Union[None, str, Iterable[str]] = None,
+        url: Optional[str] = None,
+        processes: Optional[int] = None,
+        protein_source: str = 'entries',
+    ) -> List[str]:
+        """Populate the pathways and proteins of several organisms.
+
+        The organisms are fetched and parsed in a pool of worker processes. Each one is then loaded in its own
+        transaction along with its species, so organisms that were already loaded are skipped and an interrupted run
+        can be resumed by running it again.
+
+        :param organisms: KEGG organism codes, like ``hsa`` or ``mmu``, or ``all`` for all KEGG organisms
+        :param url: An optional url from a KEGG organism list file
+        :param processes: The number of worker processes. Defaults to the number of CPUs.
+        :param protein_source: Where the proteins come from, one of :data:`bio2bel_kegg.constants.PROTEIN_SOURCES`.
+         See :func:`bio2bel_kegg.organisms.get_organism_entries`.
+        :return: The codes of the organisms that were loaded
+        """
+        self._ensure_pathway_hierarchy()
+        kegg_codes = self._populate_organisms(
+            url=url,
+            organisms=organisms,
+            processes=processes,
+            protein_source=protein_source,
+        )
+        prune_default_entity_store()
+        return kegg_codes
+
+    def _populate_organisms(
+        self,
+        url: Optional[str] = None,
+        organisms: Union[None, str, Iterable[str]] = None,
+        processes: Optional[int] = None,
+        bundle: Optional[Bundle] = None,
+        protein_source: str = 'entries',
+    ) -> List[str]:
+        if bundle is not None:
+            with bundle.open_list('organisms.tsv') as file:
+                organisms_df = get_organisms_df(url=file)
+        else:
+            organisms_df = get_organisms_df(url=url)
         logger.debug('got %d organisms', len(organisms_df.index))
-        # TODO implement
+        if isinstance(organisms, str):
+            organisms = None if organisms == 'all' else [organisms]
+        if organisms is not None:
+            organisms = set(organisms)
+            for kegg_code in sorted(organisms.difference(organisms_df['kegg_code'])):
+                logger.warning('unknown KEGG organism: %s', kegg_code)
+            organisms_df = organisms_df[organisms_df['kegg_code'].isin(organisms)]
+
+        loaded = {kegg_code for kegg_code, in self.session.query(Species.kegg_code) if kegg_code}
+        organisms_df = organisms_df[~organisms_df['kegg_code'].isin(loaded)]
+        if loaded:
+            logger.info('skipping %d organisms that are already loaded', len(loaded))
+
+        kegg_code_to_name = {
+            kegg_code: names[0]
+            for kegg_code, names in organisms_df[['kegg_code', 'name']].values
+        }
+        organisms_entries = iter_organisms_entries(
+            organisms_df[['kegg_code', 'kegg_id']].values.tolist(),
+            processes=processes,
+            bundle=bundle,
+            protein_source=protein_source,
+        )
+        loaded_codes = []
+        for entries in tqdm(organisms_entries, total=len(organisms_df.index), desc='Loading organisms'):
+            self._load_organism(entries, name=kegg_code_to_name[entries.kegg_code])
+            loaded_codes.append(entries.kegg_code)
+        if loaded_codes:
+            self._invalidate_caches()
+            self.refresh_pathway_similarity()
+        return loaded_codes
 
-    def _populate_pathways(self, url: Optional[str] = None):
+    @measured('populate.load_organism')
+    def _load_organism(self, entries: OrganismEntries, name: str) -> None:
+        """Insert the species, pathways, proteins, and memberships of an organism in a single transaction.
+
+        :param entries: The parsed pathways and proteins of the organism
+        :param name: The scientific name of the organism
+        """
+        species = Species(
+            name=name,
+            taxonomy_id=entries.taxonomy_id,
+            kegg_code=entries.kegg_code,
+            kegg_genome_id=entries.kegg_genome_id,
+        )
+        # HGNC only covers human genes
+        hgnc_mapping = get_hgnc_mapping() if entries.kegg_code == 'hsa' else None
+        with bulk_load_transaction(self.session):
+            self._insert_pathways(entries.pathways, species)
+            kegg_protein_id_to_pathway_ids = self._get_kegg_protein_id_to_pathway_ids(
+                entries.protein_pathway_pairs,
+                species=species,
+            )
+            protein_id = self._get_next_id(Protein)
+            for batch in iter_chunks(entries.proteins, 1000):
+                protein_id = self._load_proteins(batch, kegg_protein_id_to_pathway_ids, protein_id, hgnc_mapping)
+
+    @measured('populate.pathways')
+    def _populate_pathways(
+        self,
+        url: Optional[str] = None,
+        fetcher: Optional[Fetcher] = None,
+        processes: Optional[int] = None,
+        store: Optional[EntityStore] = None,
+    ) -> List[PathwayEntry]:
         """Populate pathways.
 
         :param url: url from pathway table file
+        :param fetcher: The fetcher used to get the pathway descriptions from the KEGG API
+        :param processes: The number of processes used to parse the pathway descriptions
+        :param store: The store that caches entities. Defaults to the one configured in :mod:`bio2bel_kegg.store`.
+        :return: The parsed pathways, whose genes can be loaded with :meth:`_populate_pathway_genes`
+        """
+        pathways_df = get_pathway_df(url=url)
+        pathways_lines = get_entities_lines(pathways_df['kegg_pathway_id'], fetcher=fetcher, store=store)
+        pathways = parse_entities(pathways_lines, parse_pathway_entry, processes=processes)
+
+        # there are only a few hundred pathways, so they're kept for their genes
+        pathways = list(tqdm(pathways, total=len(pathways_lines), desc='loading pathways'))
+        self._load_pathways(pathways, self._get_species('hsa') or _get_human_species())
+        return pathways
+
+    def _get_species(self, kegg_code: str) -> Optional[Species]:
+        """Get the species of an organism by its KEGG code, if it's in the database."""
+        return self.session.query(Species).filter(Species.kegg_code == kegg_code).one_or_none()
+
+    def _is_human_loaded(self) -> bool:
+        """Check if the pathways and proteins of human are loaded, which are committed separately by populate."""
+        return (
+            self._get_species('hsa') is not None
+            and self.session.query(Protein.id).filter(Protein.kegg_id.startswith('hsa:')).first() is not None
+        )
+
+    def _load_pathways(self, pathways: Iterable[PathwayEntry], species: Species) -> None:
+        """Insert pathways that aren't in the database yet in a single transaction.
+
+        :param pathways: Parsed pathways
+        :param species: The species of the pathways
+        """
+        with bulk_load_transaction(self.session):
+            self._insert_pathways(pathways, species)
+
+    def _insert_pathways(self, pathways: Iterable[PathwayEntry], species: Species) -> int:
+        """Insert the pathways that aren't in the database yet.
+
+        :return: The number of pathways inserted
         """
-        species = Species(name='Homo sapiens', taxonomy_id='9606')
         self.session.add(species)
+        self.session.flush()
 
-        pathways_df = get_pathway_df(url=url)
-        pathways_lines = get_entities_lines(pathways_df['kegg_pathway_id'])
-        for kegg_pathway_id, pathway_lines in tqdm(pathways_lines, desc='loading pathways'):
-            pathway = parse_pathway_lines(pathway_lines)
-            self.get_or_create_pathway(
-                kegg_pathway_id=kegg_pathway_id,
-                name=pathway['name'],
-                definition=pathway.get('definition'),
-                species=species,
+        # pathway identifiers start with the organism code, so only the ones of this species can clash
+        identifiers = {
+            identifier
+            for identifier, in self.session.query(Pathway.identifier).filter(Pathway.species_id == species.id)
+        }
+        rows = []
+        for pathway in pathways:
+            kegg_pathway_id = remove_path_prefix(pathway.kegg_id)
+            if kegg_pathway_id in identifiers:
+                continue
+            identifiers.add(kegg_pathway_id)
+            rows.append({
+                'identifier': kegg_pathway_id,
+                'name': pathway.name,
+                'definition': pathway.definition,
+                'species_id': species.id,
+            })
+
+        if rows:
+            self._insert(Pathway.__table__, rows)
+            pathway_ids = dict(
+                self.session.query(Pathway.identifier, Pathway.id).filter(Pathway.species_id == species.id),
+            )
+            self._insert_pathway_hierarchy([(pathway_ids[row['identifier']], row['identifier']) for row in rows])
+            inserted = {row['identifier'] for row in rows}
+            self._insert_related_pathways(
+                [pathway for pathway in pathways if remove_path_prefix(pathway.kegg_id) in inserted],
+                pathway_ids,
             )
+        return len(rows)
 
-        self.session.commit()
+    def _insert_related_pathways(self, pathways: Iterable[PathwayEntry], pathway_ids: Mapping[str, int]) -> None:
+        """Insert the links of the REL_PATHWAY sections of pathways to the ones that are in the database.
+
+        :param pathways: Parsed pathways, which are in the database
+        :param pathway_ids: The primary keys of the pathways of their species, by their KEGG identifiers
+        """
+        rows = []
+        for pathway in pathways:
+            pathway_id = pathway_ids[remove_path_prefix(pathway.kegg_id)]
+            for related_id in dict.fromkeys(pathway.related_ids):
+                related_pathway_id = pathway_ids.get(related_id)
+                if related_pathway_id is not None and related_pathway_id != pathway_id:
+                    rows.append({'pathway_id': pathway_id, 'related_pathway_id': related_pathway_id})
+        if rows:
+            self._insert(related_pathway, rows)
+
+    @measured('populate.hierarchy')
+    def populate_hierarchy(self, url: Optional[str] = None, force: bool = False) -> bool:
+        """Load the KEGG BRITE hierarchy of pathway maps (br08901) and link all pathways in the database to it.
+
+        The hierarchy replaces the one loaded before, unless it's the same. Pathways that are inserted later are linked
+        to it as they're inserted.
+
+        :param url: An optional url from a KEGG BRITE hierarchy file
+        :param force: Download the file again even if it's already in the data directory
+        :return: If the hierarchy was loaded, rather than being the same as the one in the database
+        """
+        hierarchy = get_pathway_hierarchy(url=url, force=force)
+        if sorted(hierarchy) == sorted(self._get_pathway_hierarchy()):
+            logger.info('the hierarchy of pathway maps is up to date')
+            return False
+        self._load_pathway_hierarchy(hierarchy)
+        return True
 
+    def _ensure_pathway_hierarchy(self, url: Optional[str] = None, bundle: Optional[Bundle] = None) -> None:
+        """Load the hierarchy of pathway maps if it's not in the database yet, from a bundle if one is given."""
+        if self.session.query(PathwayCategory.id).first() is not None:
+            return
+        if bundle is None:
+            hierarchy = get_pathway_hierarchy(url=url)
+        elif bundle.has_list(PATHWAY_HIERARCHY_NAME):
+            with bundle.open_list(PATHWAY_HIERARCHY_NAME) as file:
+                hierarchy = parse_pathway_hierarchy(io.TextIOWrapper(file, encoding='utf-8'))
+        else:
+            logger.info('the bundle does not have the hierarchy of pathway maps')
+            return
+        self._load_pathway_hierarchy(hierarchy)
+
+    def _get_pathway_hierarchy(self) -> List[Tuple[Tuple[str, ...], str, str]]:
+        """Get the hierarchy of pathway maps in the database as triples, like :func:`get_pathway_hierarchy`."""
+        categories = {
+            category_id: (name, parent_id, map_number)
+            for category_id, name, parent_id, map_number in self.session.query(
+                PathwayCategory.id, PathwayCategory.name, PathwayCategory.parent_id, PathwayCategory.map_number,
+            )
+        }
+        rv = []
+        for name, parent_id, map_number in categories.values():
+            if map_number is None:
+                continue
+            names = []
+            while parent_id is not None:
+                parent_name, parent_id, _ = categories[parent_id]
+                names.append(parent_name)
+            rv.append((tuple(reversed(names)), map_number, name))
+        return rv
+
+    def _load_pathway_hierarchy(self, hierarchy: Iterable[Tuple[Tuple[str, ...], str, str]]) -> None:
+        """Replace the hierarchy of pathway maps and its closure in a single transaction.
+
+        :param hierarchy: The triples from :func:`bio2bel_kegg.parsers.parse_pathway_hierarchy`
+        """
+        with bulk_load_transaction(self.session):
+            self.session.execute(pathway_hierarchy.delete())
+            self.session.execute(PathwayCategory.__table__.delete())
+
+            # the primary keys are set here so the nodes can point to their parents in the same insert
+            rows = []
+            path_to_id = {}
+            for categories, map_number, name in hierarchy:
+                parent_id = None
+                for level in range(1, len(categories) + 1):
+                    category_id = path_to_id.get(categories[:level])
+                    if category_id is None:
+                        category_id = path_to_id[categories[:level]] = len(rows) + 1
+                        rows.append({
+                            'id': category_id,
+                            'name': categories[level - 1],
+                            'level': level,
+                            'map_number': None,
+                            'parent_id': parent_id,
+                        })
+                    parent_id = category_id
+                rows.append({
+                    'id': len(rows) + 1,
+                    'name': name,
+                    'level': len(categories) + 1,
+                    'map_number': map_number,
+                    'parent_id': parent_id,
+                })
+            if rows:
+                self._insert(PathwayCategory.__table__, rows)
+            logger.info('loaded %d nodes of the hierarchy of pathway maps', len(rows))
+            self._insert_pathway_hierarchy(self.session.query(Pathway.id, Pathway.identifier))
+
+    def _insert_pathway_hierarchy(self, pathways: Iterable[Tuple[int, str]]) -> int:
+        """Link pathways to their reference maps and all the nodes above them in the closure of the hierarchy.
+
+        :param pathways: Pairs of the primary keys and the KEGG identifiers (without prefix) of pathways that aren't
+         linked yet
+        :return: The number of rows inserted
+        """
+        nodes = self.session.query(PathwayCategory.id, PathwayCategory.parent_id, PathwayCategory.map_number).all()
+        if not nodes:
+            return 0
+
+        # the depths of the ancestors of each reference map, which can be in several categories
+        parent_ids = {category_id: parent_id for category_id, parent_id, _ in nodes}
+        map_number_to_depths = defaultdict(dict)
+        for category_id, _, map_number in nodes:
+            if map_number is None:
+                continue
+            depths = map_number_to_depths[map_number]
+            depth = 0
+            while category_id is not None:
+                depths[category_id] = min(depth, depths.get(category_id, depth))
+                category_id = parent_ids[category_id]
+                depth += 1
+
+        count = 0
+        for chunk in iter_chunks(pathways, 1000):
+            rows = [
+                {'category_id': category_id, 'pathway_id': pathway_id, 'depth': depth}
+                for pathway_id, identifier in chunk
+                for category_id, depth in map_number_to_depths.get(_get_map_number(identifier), {}).items()
+            ]
+            if rows:
+                self._insert(pathway_hierarchy, rows)
+                count += len(rows)
+        return count
+
+    def _delete_pathway_links(self, pathway_ids: Sequence[int]) -> None:
+        """Delete the rows of the hierarchy and the related pathways that point to pathways about to be deleted."""
+        for chunk in iter_chunks(pathway_ids, 500):
+            self.session.execute(pathway_hierarchy.delete().where(pathway_hierarchy.c.pathway_id.in_(chunk)))
+            self.session.execute(related_pathway.delete().where(related_pathway.c.pathway_id.in_(chunk)))
+            self.session.execute(related_pathway.delete().where(related_pathway.c.related_pathway_id.in_(chunk)))
+
+    @measured('populate.proteins')
     def _populate_pathway_protein(
         self,
         url: Optional[str] = None,
-        thread_pool_size: Optional[int] = None,
+        fetcher: Optional[Fetcher] = None,
+        batch_size: Optional[int] = None,
+        processes: Optional[int] = None,
+        store: Optional[EntityStore] = None,
     ) -> None:
         """Populate proteins.
 
+        Proteins are fetched, parsed, and loaded as a stream in batches, so the memory needed depends on the batch
+        size rather than on the number of proteins. Each batch of proteins and its pathway memberships are written
+        with bulk inserts, and the whole load is committed as a single transaction.
+
         :param url: url from protein to pathway file
+        :param fetcher: The fetcher used to get the protein descriptions from the KEGG API
+        :param batch_size: The number of proteins inserted at a time. Defaults to 1000.
+        :param processes: The number of processes used to parse the protein descriptions. Defaults to parsing
+         in this process.
+        :param store: The store that caches entities. Defaults to the one configured in :mod:`bio2bel_kegg.store`.
         """
         entity_pathway_df = get_entity_pathway_df(url=url)
-
-        logger.debug('creating description URLs')
+        kegg_protein_id_to_pathway_ids = self._get_kegg_protein_id_to_pathway_ids(entity_pathway_df)
         kegg_protein_ids = list(entity_pathway_df['kegg_protein_id'].unique())
+        del entity_pathway_df
 
-        logger.debug('protein id from index 0: %s', kegg_protein_ids[0])
-
-        # KEGG protein ID to Protein model attributes dictionary
         logger.debug(
-            'Fetching all protein meta-information. You can modify the numbers of request by modifying ThreadPool'
-            ' to make this faster. However, the KEGG RESTful API might reject a big amount of requests.',
+            'Fetching all protein meta-information. You can modify the number of connections and requests per second'
+            ' of the fetcher to make this faster. However, the KEGG RESTful API might reject a big amount of requests.',
         )
-        entities_lines = get_entities_lines(kegg_protein_ids, thread_pool_size=thread_pool_size)
-        proteins = [
-            (entity_id, parse_protein_lines(entity_lines))
-            for entity_id, entity_lines in tqdm(entities_lines, desc='Parsing protein information')
-        ]
+        entities_texts = iter_entities_texts(kegg_protein_ids, fetcher=fetcher, store=store)
+        proteins = parse_entities(entities_texts, parse_protein_entry, processes=processes)
+        proteins = tqdm(proteins, total=len(kegg_protein_ids), desc='Loading proteins')
+        self._load_pathway_proteins(proteins, kegg_protein_id_to_pathway_ids, batch_size=batch_size)
+
+    @measured('populate.pathway_genes')
+    def _populate_pathway_genes(self, pathways: Iterable[PathwayEntry], batch_size: Optional[int] = None) -> None:
+        """Populate the proteins of human pathways from their GENE sections, without fetching each protein.
+
+        :param pathways: The parsed pathways, which were loaded already
+        :param batch_size: The number of proteins inserted at a time. Defaults to 1000.
+        """
+        proteins, protein_pathway_pairs = get_pathway_proteins(pathways, 'hsa')
+        kegg_protein_id_to_pathway_ids = self._get_kegg_protein_id_to_pathway_ids(protein_pathway_pairs)
+        proteins = tqdm(proteins, desc='Loading proteins')
+        self._load_pathway_proteins(proteins, kegg_protein_id_to_pathway_ids, batch_size=batch_size)
+
+    @measured('populate.proteins_conv')
+    def _populate_pathway_protein_conv(
+        self,
+        url: Optional[str] = None,
+        ncbigene_url: Optional[str] = None,
+        uniprot_url: Optional[str] = None,
+        batch_size: Optional[int] = None,
+    ) -> None:
+        """Populate human proteins from the protein-pathway links, with the identifiers of the conv tables.
+
+        The NCBI Entrez Gene and UniProt identifiers of all proteins are joined on from two files, so no protein is
+        fetched on its own.
+
+        :param url: url from protein to pathway file
+        :param ncbigene_url: url from a KEGG NCBI Entrez Gene conv file
+        :param uniprot_url: url from a KEGG UniProt conv file
+        :param batch_size: The number of proteins inserted at a time. Defaults to 1000.
+        """
+        entity_pathway_df = get_entity_pathway_df(url=url)
+        kegg_protein_id_to_pathway_ids = self._get_kegg_protein_id_to_pathway_ids(entity_pathway_df)
+        proteins = get_conv_protein_entries(
+            entity_pathway_df['kegg_protein_id'],
+            get_ncbigene_conv_df(url=ncbigene_url),
+            get_uniprot_conv_df(url=uniprot_url),
+        )
+        del entity_pathway_df
+        proteins = tqdm(proteins, desc='Loading proteins')
+        self._load_pathway_proteins(proteins, kegg_protein_id_to_pathway_ids, batch_size=batch_size)
+
+    def _get_kegg_protein_id_to_pathway_ids(
+        self,
+        protein_pathway_pairs: Union[pd.DataFrame, Iterable[Tuple[str, str]]],
+        species: Optional[Species] = None,
+    ) -> Mapping[str, Set[int]]:
+        """Group the primary keys of pathways by the KEGG identifiers of their proteins.
+
+        :param protein_pathway_pairs: A dataframe from :func:`bio2bel_kegg.parsers.get_entity_pathway_df` or pairs of
+         KEGG protein identifiers and KEGG pathway identifiers
+        :param species: The species of the pathways. Defaults to looking up pathways of all species.
+        """
+        if isinstance(protein_pathway_pairs, pd.DataFrame):
+            df = protein_pathway_pairs
+        else:
+            df = pd.DataFrame(
+                list(protein_pathway_pairs),
+                columns=['kegg_protein_id', 'kegg_pathway_id'],
+                dtype='category',
+            )
+
+        # there are few enough pathways to look up all of their primary keys at once
+        query = self.session.query(Pathway.identifier, Pathway.id)
+        if species is not None:
+            query = query.filter(Pathway.species_id == species.id)
+        pathway_identifier_to_id = dict(query)
+
+        # look up each distinct pathway once, then spread its primary key over its rows with the codes
+        kegg_pathway_ids = remove_path_prefix(df['kegg_pathway_id'].astype('category'))
+        category_pathway_ids = np.array([
+            pathway_identifier_to_id.get(kegg_pathway_id, -1)
+            for kegg_pathway_id in kegg_pathway_ids.cat.categories
+        ] + [-1], dtype=np.int64)  # the code of missing values is -1, which picks the last one
+        for kegg_pathway_id in kegg_pathway_ids.cat.categories[category_pathway_ids[:-1] < 0]:
+            logger.warning('could not find pathway for kegg.pathway:%s', kegg_pathway_id)
+        pathway_ids = category_pathway_ids[kegg_pathway_ids.cat.codes.to_numpy()]
+
+        kegg_protein_id_to_pathway_ids = defaultdict(set)
+        for kegg_protein_id, pathway_id in zip(df['kegg_protein_id'].tolist(), pathway_ids.tolist()):
+            if pathway_id >= 0:
+                kegg_protein_id_to_pathway_ids[kegg_protein_id].add(pathway_id)
+        return kegg_protein_id_to_pathway_ids
+
+    def _load_pathway_proteins(
+        self,
+        proteins: Iterable[ProteinEntry],
+        kegg_protein_id_to_pathway_ids: Mapping[str, Iterable[int]],
+        batch_size: Optional[int] = None,
+        hgnc_mapping: Optional[HGNCMapping] = None,
+    ) -> None:
+        """Insert proteins and their pathway memberships in batches, all in a single transaction.
+
+        :param proteins: Parsed proteins, which are consumed lazily
+        :param kegg_protein_id_to_pathway_ids: The primary keys of the pathways of each protein
+        :param batch_size: The number of proteins inserted at a time. Defaults to 1000.
+        :param hgnc_mapping: The mapping used to look up HGNC identifiers and symbols. Defaults to the one from
+         :func:`bio2bel_kegg.mappings.get_hgnc_mapping`.
+        """
+        if batch_size is None:
+            batch_size = 1000
+        if hgnc_mapping is None:
+            hgnc_mapping = get_hgnc_mapping()
+
+        with bulk_load_transaction(self.session):
+            protein_id = self._get_next_id(Protein)
+            for batch in iter_chunks(proteins, batch_size):
+                protein_id = self._load_proteins(batch, kegg_protein_id_to_pathway_ids, protein_id, hgnc_mapping)
+
+    @measured('db.insert')
+    def _insert(self, table, rows: Sequence[Mapping]) -> None:
+        """Insert rows into a table with a single statement, counting them in the metrics."""
+        self.session.execute(table.insert(), rows)
+        increment(f'rows.inserted.{table.name}', len(rows))
+
+    def _delete_by_ids(self, model, ids: Sequence[int]) -> None:
+        """Delete rows of the given model by their primary keys, in chunks to stay under SQLite's variable limit."""
+        for chunk in iter_chunks(ids, 500):
+            self.session.execute(model.__table__.delete().where(model.id.in_(chunk)))
+        increment(f'rows.deleted.{model.__tablename__}', len(ids))
+
+    def _get_next_id(self, model) -> int:
+        """Get the first primary key after the ones used by the given model."""
+        max_id = self.session.query(func.max(model.id)).scalar()
+        return 1 if max_id is None else max_id + 1
+
+    def _load_proteins(
+        self,
+        proteins: Sequence[ProteinEntry],
+        kegg_protein_id_to_pathway_ids: Mapping[str, Iterable[int]],
+        first_id: int,
+        hgnc_mapping: Optional[HGNCMapping],
+    ) -> int:
+        """Insert a batch of parsed proteins and their pathway memberships.
+
+        The primary keys of the proteins are assigned here, so the memberships can be inserted without reading
+        them back from the database.
+
+        :param proteins: The proteins to insert
+        :param kegg_protein_id_to_pathway_ids: The primary keys of the pathways of each protein
+        :param first_id: The primary key of the first protein in the batch
+        :param hgnc_mapping: The mapping used to look up HGNC identifiers and symbols, or None for proteins of
+         organisms other than human
+        :return: The primary key for the first protein of the next batch
+        """
+        if hgnc_mapping is None:
+            hgnc_ids = hgnc_symbols = [None] * len(proteins)
+        else:
+            hgnc_ids = hgnc_mapping.get_hgnc_ids([protein.entrez_id for protein in proteins])
+            hgnc_symbols = hgnc_mapping.get_hgnc_symbols(hgnc_ids)
 
         # namespace is actually kegg.genes
-        kegg_protein_id_to_protein = {}
-        for kegg_protein_id, protein_info in tqdm(proteins, desc='Loading proteins'):
-            entrez_id = protein_info['identifier']
-            hgnc_id = ENTREZ_ID_TO_HGNC_ID.get(entrez_id)
-            if hgnc_id:
-                hgnc_symbol = HGNC_ID_TO_SYMBOL.get(hgnc_id)
-            else:
-                logger.warning('no hgnc id for kegg.protein:%s', kegg_protein_id)
-                hgnc_symbol = None  # FIXME can this even happen?
-
-            kegg_protein_id_to_protein[kegg_protein_id] = protein = Protein(
-                kegg_id=kegg_protein_id,
-                entrez_id=entrez_id,
-                hgnc_id=hgnc_id,
-                hgnc_symbol=hgnc_symbol,
-            )
-            self.session.add(protein)
-
-        for kegg_protein_id, kegg_pathway_id in entity_pathway_df.values:
-            if kegg_pathway_id.startswith('path:'):
-                kegg_pathway_id = kegg_pathway_id[len('path:'):]
-            pathway = self.get_pathway_by_id(kegg_pathway_id)
-            if pathway is None:
-                logger.warning('could not find pathway for kegg.pathway:%s', kegg_pathway_id)
-                continue
-            protein = kegg_protein_id_to_protein.get(kegg_protein_id)
-            
-            if not protein:
-                continue
-                
-            protein.pathways.append(pathway)
-        self.session.commit()
+        rows = []
+        memberships = []
+        for protein_id, protein, hgnc_id, hgnc_symbol in zip(itt.count(first_id), proteins, hgnc_ids, hgnc_symbols):
+            if not hgnc_id and hgnc_mapping is not None:
+                logger.warning('no hgnc id for kegg.protein:%s', protein.kegg_id)
+
+            rows.append({
+                'id': protein_id,
+                'kegg_id': protein.kegg_id,
+                'entrez_id': protein.entrez_id,
+                'uniprot_id': _get_uniprot_id(protein),
+                'hgnc_id': hgnc_id,
+                'hgnc_symbol': hgnc_symbol,
+            })
+            memberships.extend(
+                {'protein_id': protein_id, 'pathway_id': pathway_id}
+                for pathway_id in kegg_protein_id_to_pathway_ids.get(protein.kegg_id, ())
+            )
+
+        if rows:
+            self._insert(Protein.__table__, rows)
+        if memberships:
+            self._insert(protein_pathway, memberships)
 
+        return first_id + len(rows)
+
+    @measured('populate', collect=True)
     def populate(
         self,
         organism_url: Optional[str] = None,
         pathways_url: Optional[str] = None,
         protein_pathway_url: Optional[str] = None,
+        release_url: Optional[str] = None,
+        fetcher: Optional[Fetcher] = None,
+        batch_size: Optional[int] = None,
+        processes: Optional[int] = None,
+        organisms: Union[None, str, Iterable[str]] = None,
+        bundle: Optional[str] = None,
+        protein_source: str = 'entries',
+        ncbigene_url: Optional[str] = None,
+        uniprot_url: Optional[str] = None,
+        hierarchy_url: Optional[str] = None,
     ):
-        """Populate all tables."""
-        self._populate_organisms(url=organism_url)
-        self._populate_pathways(url=pathways_url)
-        self._populate_pathway_protein(url=protein_pathway_url)
+        """Populate all tables.
+
+        :param organism_url: An optional url from a KEGG organism list file
+        :param pathways_url: An optional url from a KEGG pathway list file, used when loading human
+        :param protein_pathway_url: An optional url from a KEGG protein-pathway link file, used when loading human
+        :param release_url: An optional url from a KEGG statistics file, from which the loaded release is recorded
+        :param fetcher: The fetcher used to get entity descriptions from the KEGG API. Pass one to configure the
+         number of connections, the rate limit, and retries.
+        :param batch_size: The number of proteins committed at a time
+        :param processes: The number of processes used to parse the entity descriptions. Parsing is spread over
+         processes in chunks while the results are still loaded in order. When loading organisms, the number of
+         worker processes that each fetch and parse whole organisms.
+        :param organisms: KEGG organism codes, like ``hsa`` or ``mmu``, or ``all`` for all KEGG organisms. Defaults
+         to only loading human, which is skipped if it's already loaded. See :meth:`populate_organisms`.
+        :param bundle: The path of a bundle made by :func:`bio2bel_kegg.bundle.build_bundle`, which is verified then
+         used instead of the network for the lists, the entities, and the release. Entities that aren't in the bundle
+         are logged and skipped. The urls and the fetcher are ignored.
+        :param protein_source: Where the proteins come from, one of :data:`bio2bel_kegg.constants.PROTEIN_SOURCES`.
+         ``entries`` fetches the flat file of each protein. ``pathways`` takes the proteins and their memberships from
+         the GENE sections of the pathways, without the protein-pathway link file. ``conv`` takes the proteins from
+         the link file and their NCBI Entrez Gene and UniProt identifiers from the conv tables of human. Both of the
+         latter turn the thousands of requests of a cold load of human into a few dozen.
+        :param ncbigene_url: An optional url from a KEGG NCBI Entrez Gene conv file, used when loading human from
+         the conv tables
+        :param uniprot_url: An optional url from a KEGG UniProt conv file, used when loading human from the conv tables
+        :param hierarchy_url: An optional url from the KEGG BRITE hierarchy of pathway maps, which is only loaded if
+         the database doesn't have one yet. See :meth:`populate_hierarchy`.
+        """
+        if protein_source not in PROTEIN_SOURCES:
+            raise ValueError(f'unknown protein source: {protein_source}')
+        with ExitStack() as stack:
+            if bundle is None:
+                release = get_kegg_release(url=release_url)
+                store = snapshot = None
+            else:
+                snapshot = stack.enter_context(Bundle(bundle))
+                snapshot.verify()
+                release, store, fetcher = snapshot.release, snapshot.store, OfflineFetcher()
+                pathways_url = stack.enter_context(snapshot.open_list('pathways.tsv'))
+                protein_pathway_url = stack.enter_context(snapshot.open_list('protein_pathway.tsv'))
+                if organisms is None and protein_source == 'conv':
+                    ncbigene_url = stack.enter_context(snapshot.open_list('hsa_ncbi-geneid.tsv'))
+                    uniprot_url = stack.enter_context(snapshot.open_list('hsa_uniprot.tsv'))
+
+            self._ensure_pathway_hierarchy(url=hierarchy_url, bundle=snapshot)
+            if organisms is not None:
+                self._populate_organisms(
+                    url=organism_url,
+                    organisms=organisms,
+                    processes=processes,
+                    bundle=snapshot,
+                    protein_source=protein_source,
+                )
+            elif self._is_human_loaded():
+                logger.info('skipping human, which is already loaded')
+            else:
+                pathways = self._populate_pathways(url=pathways_url, fetcher=fetcher, processes=processes, store=store)
+                if protein_source == 'pathways':
+                    self._populate_pathway_genes(pathways, batch_size=batch_size)
+                elif protein_source == 'conv':
+                    self._populate_pathway_protein_conv(
+                        url=protein_pathway_url,
+                        ncbigene_url=ncbigene_url,
+                        uniprot_url=uniprot_url,
+                        batch_size=batch_size,
+                    )
+                else:
+                    self._populate_pathway_protein(
+                        url=protein_pathway_url,
+                        fetcher=fetcher,
+                        batch_size=batch_size,
+                        processes=processes,
+                        store=store,
+                    )
+        if release is not None:
+            self.session.add(Release(release=release))
+            self.session.commit()
+        self._invalidate_caches()
+        self.refresh_pathway_similarity()
+        if bundle is None:
+            prune_default_entity_store()
+
+    def get_release(self) -> Optional[str]:
+        """Get the KEGG release that was loaded last, if it was recorded."""
+        release = self.session.query(Release).order_by(Release.id.desc()).first()
+        return release and release.release
+
+    @measured('update', collect=True)
+    def update(
+        self,
+        pathways_url: Optional[str] = None,
+        protein_pathway_url: Optional[str] = None,
+        release_url: Optional[str] = None,
+        fetcher: Optional[Fetcher] = None,
+        processes: Optional[int] = None,
+        force: bool = False,
+        hierarchy_url: Optional[str] = None,
+    ) -> Mapping[str, int]:
+        """Update the database to the current KEGG release without repopulating it.
+
+        The current pathway and protein-pathway lists are compared with the database. Only the pathways that are
+        new or renamed and the proteins that are new or whose pathways changed are fetched again. All the changes
+        are then applied in a single transaction, so the database can be read while the update runs and readers
+        never see a partial update.
+
+        :param pathways_url: url from pathway table file
+        :param protein_pathway_url: url from protein to pathway file
+        :param release_url: url from a KEGG statistics file
+        :param fetcher: The fetcher used to get entity descriptions from the KEGG API
+        :param processes: The number of processes used to parse the entity descriptions
+        :param force: Compare with the current lists even if the release is the same as the one loaded last
+        :param hierarchy_url: url from the KEGG BRITE hierarchy of pathway maps, which is reloaded after the update
+         if it changed
+        :return: The number of pathways, proteins, and memberships that were added, changed, and deleted
+        """
+        release = get_kegg_release(url=release_url)
+        if not force and release is not None and release == self.get_release():
+            logger.info('KEGG %s is already loaded', release)
+            return {}
+
+        pathways_df = get_pathway_df(url=pathways_url, force=True)
+        pathway_names = dict(zip(remove_path_prefix(pathways_df['kegg_pathway_id']), pathways_df['name']))
+        del pathways_df
+
+        entity_pathway_df = get_entity_pathway_df(url=protein_pathway_url, force=True)
+        kegg_protein_ids = set(entity_pathway_df['kegg_protein_id'].cat.categories)
+        kegg_pathway_ids = remove_path_prefix(entity_pathway_df['kegg_pathway_id'])
+        in_pathways = kegg_pathway_ids.isin(pathway_names).to_numpy()
+        pairs = set(zip(
+            entity_pathway_df['kegg_protein_id'][in_pathways].tolist(),
+            kegg_pathway_ids[in_pathways].tolist(),
+        ))
+        del entity_pathway_df, kegg_pathway_ids
+
+        # only the lists of human are compared, so the other organisms are left alone
+        species = self._get_species('hsa')
+        if species is None:
+            old_pathway_ids, old_pathway_names, old_protein_ids, old_pairs = {}, {}, {}, set()
+        else:
+            old_pathway_ids = dict(
+                self.session.query(Pathway.identifier, Pathway.id).filter(Pathway.species_id == species.id),
+            )
+            old_pathway_names = dict(
+                self.session.query(Pathway.identifier, Pathway.name).filter(Pathway.species_id == species.id),
+            )
+            # proteins don't have a species, but their identifiers start with the code of their organism
+            old_protein_ids = dict(
+                self.session.query(Protein.kegg_id, Protein.id).filter(Protein.kegg_id.startswith('hsa:')),
+            )
+            old_pairs = set(
+                self.session.query(Protein.kegg_id, Pathway.identifier)
+                .join(protein_pathway, Protein.id == protein_pathway.c.protein_id)
+                .join(Pathway, Pathway.id == protein_pathway.c.pathway_id)
+                .filter(Pathway.species_id == species.id),
+            )
+
+        # pathways are changed if they're renamed, proteins if their pathways change
+        fetch_pathway_ids = [
+            identifier
+            for identifier, name in pathway_names.items()
+            if old_pathway_names.get(identifier) != name
+        ]
+        fetch_protein_ids = sorted(
+            kegg_protein_ids.difference(old_protein_ids).union(
+                kegg_protein_id
+                for kegg_protein_id, _ in pairs.symmetric_difference(old_pairs)
+                if kegg_protein_id in kegg_protein_ids
+            ),
+        )
+
+        # fetch and parse everything before writing, so the transaction stays short
+        fetch_pathway_ids = [f'path:{identifier}' for identifier in fetch_pathway_ids]
+        pathways = list(parse_entities(
+            iter_entities_texts(fetch_pathway_ids, fetcher=fetcher, force=True),
+            parse_pathway_entry,
+            processes=processes,
+        ))
+        proteins = list(parse_entities(
+            iter_entities_texts(fetch_protein_ids, fetcher=fetcher, force=True),
+            parse_protein_entry,
+            processes=processes,
+        ))
+        # this can download the HGNC resources, which shouldn't hold the write lock
+        hgnc_mapping = get_hgnc_mapping()
+
+        with bulk_load_transaction(self.session):
+            removed_pairs = old_pairs.difference(pairs)
+            self._delete_memberships([
+                (old_protein_ids[kegg_protein_id], old_pathway_ids[identifier])
+                for kegg_protein_id, identifier in removed_pairs
+            ])
+            deleted_protein_ids = [
+                protein_id
+                for kegg_protein_id, protein_id in old_protein_ids.items()
+                if kegg_protein_id not in kegg_protein_ids
+            ]
+            self._delete_by_ids(Protein, deleted_protein_ids)
+            deleted_pathway_ids = [
+                pathway_id
+                for identifier, pathway_id in old_pathway_ids.items()
+                if identifier not in pathway_names
+            ]
+            self._delete_pathway_links(deleted_pathway_ids)
+            self._delete_by_ids(Pathway, deleted_pathway_ids)
+
+            changed_pathways = [
+                pathway
+                for pathway in pathways
+                if remove_path_prefix(pathway.kegg_id) in old_pathway_ids
+            ]
+            self._update_pathways(changed_pathways, old_pathway_ids)
+            if species is None:
+                species = _get_human_species()
+            added_pathway_count = self._insert_pathways(pathways, species)
+
+            changed_proteins = [protein for protein in proteins if protein.kegg_id in old_protein_ids]
+            self._update_proteins(changed_proteins, old_protein_ids, hgnc_mapping)
+
+            # the memberships of new proteins are inserted along with them
+            kegg_protein_id_to_pathway_ids = self._get_kegg_protein_id_to_pathway_ids(pairs, species=species)
+            added_proteins = [protein for protein in proteins if protein.kegg_id not in old_protein_ids]
+            next_id = self._get_next_id(Protein)
+            self._load_proteins(added_proteins, kegg_protein_id_to_pathway_ids, next_id, hgnc_mapping)
+            pathway_ids = dict(
+                self.session.query(Pathway.identifier, Pathway.id).filter(Pathway.species_id == species.id),
+            )
+            added_pairs = [
+                {'protein_id': old_protein_ids[kegg_protein_id], 'pathway_id': pathway_ids[identifier]}
+                for kegg_protein_id, identifier in pairs.difference(old_pairs)
+                if kegg_protein_id in old_protein_ids and identifier in pathway_ids
+            ]
+            if added_pairs:
+                self._insert(protein_pathway, added_pairs)
+
+            # the links of new pathways are inserted along with them
+            changed_pathway_ids = [pathway_ids[remove_path_prefix(pathway.kegg_id)] for pathway in changed_pathways]
+            for chunk in iter_chunks(changed_pathway_ids, 500):
+                self.session.execute(related_pathway.delete().where(related_pathway.c.pathway_id.in_(chunk)))
+            self._insert_related_pathways(changed_pathways, pathway_ids)
+
+            if release is not None:
+                self.session.add(Release(release=release))
+
+        self.populate_hierarchy(url=hierarchy_url, force=True)
+        self._invalidate_caches()
+        self.refresh_pathway_similarity()
+        prune_default_entity_store()
+        return {
+            'pathways_added': added_pathway_count,
+            'pathways_changed': len(changed_pathways),
+            'pathways_deleted': len(deleted_pathway_ids),
+            'proteins_added': len(added_proteins),
+            'proteins_changed': len(changed_proteins),
+            'proteins_deleted': len(deleted_protein_ids),
+            'memberships_added': len(added_pairs) + sum(
+                len(kegg_protein_id_to_pathway_ids.get(protein.kegg_id, ()))
+                for protein in added_proteins
+            ),
+            'memberships_deleted': len(removed_pairs),
+        }
+
+    def _update_pathways(self, pathways: Sequence[PathwayEntry], pathway_ids: Mapping[str, int]) -> None:
+        """Update the names and descriptions of pathways that are already in the database."""
+        if not pathways:
+            return
+        statement = Pathway.__table__.update().where(Pathway.id == bindparam('_id')).values(
+            name=bindparam('name'),
+            definition=bindparam('definition'),
+        )
+        self.session.execute(statement, [
+            {
+                '_id': pathway_ids[remove_path_prefix(pathway.kegg_id)],
+                'name': pathway.name,
+                'definition': pathway.definition,
+            }
+            for pathway in pathways
+        ])
+        increment(f'rows.updated.{Pathway.__tablename__}', len(pathways))
+
+    def _update_proteins(
+        self,
+        proteins: Sequence[ProteinEntry],
+        protein_ids: Mapping[str, int],
+        hgnc_mapping: HGNCMapping,
+    ) -> None:
+        """Update the identifiers of proteins that are already in the database."""
+        if not proteins:
+            return
+        hgnc_ids = hgnc_mapping.get_hgnc_ids([protein.entrez_id for protein in proteins])
+        hgnc_symbols = hgnc_mapping.get_hgnc_symbols(hgnc_ids)
+        statement = Protein.__table__.update().where(Protein.id == bindparam('_id')).values(
+            entrez_id=bindparam('entrez_id'),
+            uniprot_id=bindparam('uniprot_id'),
+            hgnc_id=bindparam('hgnc_id'),
+            hgnc_symbol=bindparam('hgnc_symbol'),
+        )
+        self.session.execute(statement, [
+            {
+                '_id': protein_ids[protein.kegg_id],
+                'entrez_id': protein.entrez_id,
+                'uniprot_id': _get_uniprot_id(protein),
+                'hgnc_id': hgnc_id,
+                'hgnc_symbol': hgnc_symbol,
+            }
+            for protein, hgnc_id, hgnc_symbol in zip(proteins, hgnc_ids, hgnc_symbols)
+        ])
+        increment(f'rows.updated.{Protein.__tablename__}', len(proteins))
+
+    def _delete_memberships(self, pairs: Sequence[Tuple[int, int]]) -> None:
+        """Delete memberships by the primary keys of their proteins and pathways."""
+        if not pairs:
+            return
+        statement = protein_pathway.delete().where(and_(
+            protein_pathway.c.protein_id == bindparam('_protein_id'),
+            protein_pathway.c.pathway_id == bindparam('_pathway_id'),
+        ))
+        self.session.execute(statement, [
+            {'_protein_id': protein_id, '_pathway_id': pathway_id}
+            for protein_id, pathway_id in pairs
+        ])
+        increment(f'rows.deleted.{protein_pathway.name}', len(pairs))
 
     def count_pathways(self) -> int:
         """Count the pathways in the database."""
@@ -188,13 +1387,330 @@ class Manager(CompathManager):
         """Count the pathways in the database."""
         return self._count_model(Protein)
 
+    def count_pathway_categories(self) -> int:
+        """Count the categories and reference maps of the hierarchy of pathway maps in the database."""
+        return self._count_model(PathwayCategory)
+
     def summarize(self) -> Mapping[str, int]:
         """Summarize the database."""
         return {
             'pathways': self.count_pathways(),
             'proteins': self.count_proteins(),
+            'pathway_categories': self.count_pathway_categories(),
         }
 
+    def write_bel(self, file: TextIO, fmt: str = 'bel', chunk_size: Optional[int] = None) -> int:
+        """Write all protein-pathway memberships as BEL, streaming them from the database.
+
+        Unlike :meth:`to_bel`, no ORM objects or graph are built, so the memory used doesn't grow with the database.
+
+        :param file: A file opened for writing text
+        :param fmt: Either ``bel`` for a BEL script or ``jsonl`` for node-link JSON lines
+        :param chunk_size: The number of rows fetched from the database at a time
+        :return: The number of lines written
+
+        See :mod:`bio2bel_kegg.export` for the formats.
+        """
+        return write_export(
+            self.session,
+            file,
+            fmt=fmt,
+            name=f'Pathway Definitions from bio2bel_{self.module_name}',
+            chunk_size=chunk_size,
+        )
+
+    def export_membership_matrix(
+        self,
+        directory: str,
+        kegg_code: Optional[str] = None,
+        key: str = 'hgnc_symbol',
+    ) -> MembershipMatrix:
+        """Export the protein-pathway memberships as a matrix that can be memory-mapped, along with a GMT file.
+
+        The arrays of the matrix are saved in the directory, where :meth:`bio2bel_kegg.matrix.MembershipMatrix.load`
+        opens them without a connection to the database. The gene sets are written to ``kegg.gmt`` in the same
+        directory.
+
+        :param directory: The directory of the export
+        :param kegg_code: The KEGG code of an organism, like ``hsa``, to which the export is restricted. Defaults to
+         all organisms in the database.
+        :param key: The identifiers of the proteins in the GMT file. One of ``kegg_id``, ``hgnc_id``,
+         ``hgnc_symbol``, or ``entrez_id``.
+        """
+        matrix = MembershipMatrix.from_session(self.session, species_id=self._get_species_id(kegg_code))
+        matrix.save(directory)
+        with open(os.path.join(directory, f'{self.module_name}.gmt'), 'w') as file:
+            matrix.write_gmt(file, key=key)
+        return matrix
+
+    @staticmethod
+    def _add_cli_cache_migrate(main: click.Group) -> click.Group:  # noqa: D202
+        """Add a command to the cache group for converting the entity cache between backends."""
+
+        @main.commands['cache'].command()
+        @click.option('--source', type=click.Choice(['directory', 'packed']), default='directory', show_default=True)
+        @click.option('--target', type=click.Choice(['directory', 'packed']), default='packed', show_default=True)
+        @click.option('--delete', is_flag=True, help='Delete the files of a directory source once they are copied')
+        @verbose_option
+        def migrate(source: str, target: str, delete: bool):
+            """Copy the cached KEGG entities to another store."""
+            if source == target:
+                click.secho('source and target must be different', fg='red')
+                sys.exit(1)
+            with get_entity_store(source) as source_store, get_entity_store(target) as target_store:
+                count = migrate_entity_store(source_store, target_store, delete=delete)
+            click.echo(f'Copied {count} entities from the {source} store to the {target} store')
+
+        return main
+
+    @staticmethod
+    def _add_cli_cache_stats(main: click.Group) -> click.Group:  # noqa: D202
+        """Add a command to the cache group for showing the size and the usage of the entity cache."""
+
+        @main.commands['cache'].command()
+        @click.option('--backend', type=click.Choice(['directory', 'packed']), help='Defaults to the configured one')
+        @click.option('--verify', is_flag=True, help='Read each entity and drop the ones that are corrupt')
+        @verbose_option
+        def stats(backend: Optional[str], verify: bool):
+            """Show the size and the usage of the cached KEGG entities."""
+            with get_entity_store(backend) as store:
+                _check_records_usage(store)
+                if verify:
+                    dropped_ids = store.verify()
+                    click.echo(f'Dropped {len(dropped_ids)} corrupt entities')
+                entity_store_stats = store.stats()
+            click.echo(f'Entities: {entity_store_stats.entities}')
+            click.echo(f'Size: {entity_store_stats.size} bytes')
+            click.echo(f'Size on disk: {entity_store_stats.disk_size} bytes')
+            for label, access in (
+                ('Least recent use', entity_store_stats.oldest_access),
+                ('Most recent use', entity_store_stats.newest_access),
+            ):
+                if access is not None:
+                    click.echo(f'{label}: {time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(access))}')
+
+        return main
+
+    @staticmethod
+    def _add_cli_cache_prune(main: click.Group) -> click.Group:  # noqa: D202
+        """Add a command to the cache group for evicting the least recently used entities."""
+
+        @main.commands['cache'].command()
+        @click.option('--max-size', type=int, default=ENTITY_STORE_MAX_SIZE or None,
+                      help='The size in bytes. Defaults to $BIO2BEL_KEGG_ENTITY_STORE_MAX_SIZE')
+        @click.option('--backend', type=click.Choice(['directory', 'packed']), help='Defaults to the configured one')
+        @click.option('--verify', is_flag=True, help='Drop the corrupt entities first')
+        @verbose_option
+        def prune(max_size: Optional[int], backend: Optional[str], verify: bool):
+            """Evict the least recently used KEGG entities until the cache fits in a size."""
+            if max_size is None:
+                click.secho('give --max-size or set BIO2BEL_KEGG_ENTITY_STORE_MAX_SIZE', fg='red')
+                sys.exit(1)
+            with get_entity_store(backend) as store:
+                _check_records_usage(store)
+                if verify:
+                    dropped_ids = store.verify()
+                    click.echo(f'Dropped {len(dropped_ids)} corrupt entities')
+                count = store.prune(max_size)
+            click.echo(f'Evicted {count} entities')
+
+        return main
+
+    @staticmethod
+    def _add_cli_update(main: click.Group) -> click.Group:  # noqa: D202
+        """Add a command for updating the database to the current KEGG release."""
+
+        @main.command()
+        @click.option('-f', '--force', is_flag=True, help='Update even if the KEGG release has not changed')
+        @metrics_option
+        @verbose_option
+        @click.pass_obj
+        def update(manager: 'Manager', force: bool, metrics: Optional[str]):
+            """Update the database to the current KEGG release."""
+            with _collect_metrics(metrics):
+                changes = manager.update(force=force)
+            if not changes:
+                click.echo(f'Already up to date with KEGG {manager.get_release()}')
+                return
+            for key, value in changes.items():
+                click.echo(f'{key}: {value}')
+
+        return main
+
+    @staticmethod
+    def _add_cli_populate_organisms(main: click.Group) -> click.Group:  # noqa: D202
+        """Add a command for populating the database with several organisms."""
+
+        @main.command(name='populate-organisms')
+        @click.option('-o', '--organism', 'organisms', multiple=True, help='A KEGG organism code, like mmu')
+        @click.option('--all', 'all_organisms', is_flag=True, help='Load all KEGG organisms')
+        @click.option('-p', '--processes', type=int, help='The number of worker processes. Defaults to the CPUs.')
+        @protein_source_option
+        @metrics_option
+        @verbose_option
+        @click.pass_obj
+        def populate_organisms(
+            manager: 'Manager',
+            organisms: Sequence[str],
+            all_organisms: bool,
+            processes: int,
+            protein_source: str,
+            metrics: Optional[str],
+        ):
+            """Populate the database with organisms, skipping the ones already loaded."""
+            if not organisms and not all_organisms:
+                click.secho('give organisms with --organism or use --all', fg='red')
+                sys.exit(1)
+            with _collect_metrics(metrics):
+                loaded = manager.populate_organisms(
+                    'all' if all_organisms else organisms,
+                    processes=processes,
+                    protein_source=protein_source,
+                )
+            click.echo(f'Loaded {len(loaded)} organisms')
+
+        return main
+
+    @staticmethod
+    def _add_cli_bundle(main: click.Group) -> click.Group:  # noqa: D202
+        """Add commands for building offline bundles of KEGG and populating the database from them."""
+
+        @main.group()
+        def bundle():
+            """Build and use offline bundles of KEGG."""
+
+        @bundle.command(name='build')
+        @click.option('-o', '--output', type=click.Path(dir_okay=False), required=True, help='The path of the bundle')
+        @click.option('--fetch-missing', is_flag=True, help='Fetch the entities of the lists that are not cached')
+        @click.option('-f', '--force', is_flag=True, help='Download the lists of human again')
+        @verbose_option
+        def build(output: str, fetch_missing: bool, force: bool):
+            """Pack the downloaded lists and the cached entities into a bundle."""
+            manifest = build_bundle(output, list_paths=get_list_paths(force=force), fetch_missing=fetch_missing)
+            click.echo(
+                f'Bundled {len(manifest["lists"])} lists and {manifest["entities"]["count"]} entities of KEGG'
+                f' {manifest["kegg_release"]} in {output}',
+            )
+            if manifest['missing_entities']:
+                click.secho(f'{len(manifest["missing_entities"])} entities of the lists are missing', fg='yellow')
+
+        @bundle.command(name='verify')
+        @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+        @verbose_option
+        def verify(path: str):
+            """Check a bundle against the checksums of its manifest."""
+            try:
+                with Bundle(path) as snapshot:
+                    snapshot.verify()
+            except ValueError as e:
+                click.secho(str(e), fg='red')
+                sys.exit(1)
+            click.echo(f'{path} is a valid bundle of KEGG {snapshot.release}')
+
+        @bundle.command(name='populate')
+        @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+        @click.option('-o', '--organism', 'organisms', multiple=True, help='A KEGG organism code. Defaults to human.')
+        @click.option('-p', '--processes', type=int, help='The number of processes used for parsing')
+        @protein_source_option
+        @metrics_option
+        @verbose_option
+        @click.pass_obj
+        def populate(
+            manager: 'Manager',
+            path: str,
+            organisms: Sequence[str],
+            processes: Optional[int],
+            protein_source: str,
+            metrics: Optional[str],
+        ):
+            """Populate the database from a bundle, without the network."""
+            with _collect_metrics(metrics):
+                manager.populate(
+                    bundle=path,
+                    organisms=organisms or None,
+                    processes=processes,
+                    protein_source=protein_source,
+                )
+            click.echo(f'Populated KEGG {manager.get_release()} from {path}')
+
+        return main
+
+    @staticmethod
+    def _add_cli_enrich(main: click.Group) -> click.Group:  # noqa: D202
+        """Add a command for calculating the enrichment of pathways for the gene sets in a GMT file."""
+
+        @main.command(name='enrich')
+        @click.argument('gmt', type=click.File())
+        @click.option('-o', '--output', type=click.File('w'), default='-', help='Defaults to standard out')
+        @click.option('--key', type=click.Choice(['hgnc_symbol', 'hgnc_id', 'entrez_id']), default='hgnc_symbol',
+                      show_default=True)
+        @click.option('--kegg-code', help='The KEGG code of the organism whose pathways are tested, like hsa')
+        @verbose_option
+        @click.pass_obj
+        def enrich(manager: 'Manager', gmt, output, key: str, kegg_code: Optional[str]):
+            """Calculate the enrichment of pathways for the gene sets in a GMT file."""
+            gene_sets = (
+                (name, genes)
+                for name, _, *genes in (line.rstrip('\n').split('\t') for line in gmt)
+            )
+            header = True
+            for table in manager.iter_batch_enrichment(dict(gene_sets), key=key, kegg_code=kegg_code):
+                table.to_csv(output, sep='\t', index=False, header=header)
+                header = False
+
+        return main
+
+    @staticmethod
+    def _add_cli_export_bel(main: click.Group) -> click.Group:  # noqa: D202
+        """Add a command for streaming all protein-pathway memberships as BEL."""
+
+        @main.command(name='export-bel')
+        @click.option('-o', '--output', type=click.File('w'), default='-', help='Defaults to standard out')
+        @click.option('-f', '--fmt', type=click.Choice(FORMATS), default='bel', show_default=True,
+                      help='A BEL script or node-link JSON lines')
+        @verbose_option
+        @click.pass_obj
+        def export_bel(manager: 'Manager', output, fmt: str):
+            """Write all protein-pathway memberships as BEL."""
+            manager.write_bel(output, fmt=fmt)
+
+        return main
+
+    @staticmethod
+    def _add_cli_export_matrix(main: click.Group) -> click.Group:  # noqa: D202
+        """Add a command for exporting the protein-pathway memberships as a matrix and a GMT file."""
+
+        @main.command(name='export-matrix')
+        @click.option('-d', '--directory', type=click.Path(file_okay=False, dir_okay=True), default='.',
+                      help='Defaults to CWD')
+        @click.option('--kegg-code', help='The KEGG code of the organism to export, like hsa. Defaults to all.')
+        @click.option('--key', type=click.Choice(['kegg_id', 'hgnc_id', 'hgnc_symbol', 'entrez_id']),
+                      default='hgnc_symbol', show_default=True, help='The identifiers of the proteins in the GMT file')
+        @verbose_option
+        @click.pass_obj
+        def export_matrix(manager: 'Manager', directory: str, kegg_code: Optional[str], key: str):
+            """Export the protein-pathway memberships as a memory-mappable matrix and a GMT file."""
+            matrix = manager.export_membership_matrix(directory, kegg_code=kegg_code, key=key)
+            n_pathways, n_proteins = matrix.shape
+            click.echo(f'Exported {len(matrix)} memberships of {n_proteins} proteins in {n_pathways} pathways')
+
+        return main
+
+    @classmethod
+    def get_cli(cls) -> click.Group:
+        """Get a :mod:`click` main function to use as a command line interface."""
+        main = super().get_cli()
+        cls._add_cli_cache_migrate(main)
+        cls._add_cli_cache_stats(main)
+        cls._add_cli_cache_prune(main)
+        cls._add_cli_update(main)
+        cls._add_cli_populate_organisms(main)
+        cls._add_cli_bundle(main)
+        cls._add_cli_enrich(main)
+        cls._add_cli_export_bel(main)
+        cls._add_cli_export_matrix(main)
+        return main
+
     def _add_admin(self, app, **kwargs):
         """Add admin methods."""
         from flask_admin import Admin
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+"""Mappings from NCBI Entrez Gene identifiers to HGNC identifiers and symbols.
+
+The mappings come from :mod:`protmapper`, which is only imported the first time they're needed. They're then saved as
+sorted :mod:`numpy` arrays in a directory for the installed version of protmapper, so later processes can memory-map
+them instead of rebuilding them.
+"""
+
+import logging
+import os
+from functools import lru_cache
+from typing import Iterable, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+from .constants import MAPPINGS_DIRECTORY
+
+__all__ = [
+    'HGNCMapping',
+    'get_hgnc_mapping',
+]
+
+logger = logging.getLogger(__name__)
+
+_ARRAY_NAMES = ('entrez_ids', 'entrez_hgnc_ids', 'hgnc_ids', 'hgnc_symbols')
+
+
+class HGNCMapping:
+    """Maps NCBI Entrez Gene identifiers to HGNC identifiers and HGNC identifiers to symbols.
+
+    Both mappings are kept as arrays of integer identifiers sorted for binary search, each aligned with an array of
+    values.
+    """
+
+    def __init__(
+        self,
+        entrez_ids: np.ndarray,
+        entrez_hgnc_ids: np.ndarray,
+        hgnc_ids: np.ndarray,
+        hgnc_symbols: np.ndarray,
+    ):
+        """Initialize the mapping.
+
+        :param entrez_ids: Sorted NCBI Entrez Gene identifiers
+        :param entrez_hgnc_ids: The HGNC identifier for each NCBI Entrez Gene identifier
+        :param hgnc_ids: Sorted HGNC identifiers
+        :param hgnc_symbols: The symbol for each HGNC identifier
+        """
+        self.entrez_ids = entrez_ids
+        self.entrez_hgnc_ids = entrez_hgnc_ids
+        self.hgnc_ids = hgnc_ids
+        self.hgnc_symbols = hgnc_symbols
+
+    @classmethod
+    def from_dicts(
+        cls,
+        entrez_id_to_hgnc_id: Mapping[str, str],
+        hgnc_id_to_symbol: Mapping[str, str],
+    ) -> 'HGNCMapping':
+        """Build the mapping from dictionaries. Keys that aren't numeric are left out."""
+        entrez_ids, entrez_hgnc_ids = _get_sorted_arrays({
+            entrez_id: hgnc_id
+            for entrez_id, hgnc_id in entrez_id_to_hgnc_id.items()
+            if hgnc_id and hgnc_id.isdigit()
+        })
+        hgnc_ids, hgnc_symbols = _get_sorted_arrays(hgnc_id_to_symbol)
+        return cls(
+            entrez_ids=entrez_ids,
+            entrez_hgnc_ids=entrez_hgnc_ids.astype(np.int64),
+            hgnc_ids=hgnc_ids,
+            hgnc_symbols=hgnc_symbols.astype(str),
+        )
+
+    @classmethod
+    def from_protmapper(cls) -> 'HGNCMapping':
+        """Build the mapping from the resources of :mod:`protmapper`, which might need to download them."""
+        from protmapper.api import hgnc_name_to_id
+        from protmapper.uniprot_client import get_entrez_id, um
+
+        hgnc_id_to_entrez_id = {
+            hgnc: get_entrez_id(uniprot)
+            for uniprot, hgnc in um.uniprot_hgnc.items()
+        }
+        return cls.from_dicts(
+            entrez_id_to_hgnc_id={v: k for k, v in hgnc_id_to_entrez_id.items() if v},
+            hgnc_id_to_symbol={v: k for k, v in hgnc_name_to_id.items()},
+        )
+
+    @classmethod
+    def load(cls, directory: str) -> 'HGNCMapping':
+        """Load a mapping saved with :meth:`save`, memory-mapping its arrays."""
+        return cls(**{
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+            for name in _ARRAY_NAMES
+        })
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        """Check if a mapping was saved in the given directory."""
+        return all(os.path.exists(os.path.join(directory, f'{name}.npy')) for name in _ARRAY_NAMES)
+
+    def save(self, directory: str) -> None:
+        """Save the arrays of the mapping in the given directory."""
+        os.makedirs(directory, exist_ok=True)
+        for name in _ARRAY_NAMES:
+            path = os.path.join(directory, f'{name}.npy')
+            temporary_path = f'{path}.{os.getpid()}.tmp'
+            with open(temporary_path, 'wb') as file:
+                np.save(file, getattr(self, name))
+            os.replace(temporary_path, path)  # so other processes never load a partially written array
+
+    def get_hgnc_ids(self, entrez_ids: Sequence[Optional[str]]) -> List[Optional[str]]:
+        """Look up the HGNC identifiers for NCBI Entrez Gene identifiers.
+
+        :param entrez_ids: NCBI Entrez Gene identifiers
+        :return: The HGNC identifier for each NCBI Entrez Gene identifier, or None if it isn't mapped
+        """
+        return [
+            None if hgnc_id is None else str(hgnc_id)
+            for hgnc_id in _lookup(self.entrez_ids, self.entrez_hgnc_ids, entrez_ids)
+        ]
+
+    def get_hgnc_symbols(self, hgnc_ids: Sequence[Optional[str]]) -> List[Optional[str]]:
+        """Look up the symbols for HGNC identifiers.
+
+        :param hgnc_ids: HGNC identifiers. None is allowed and maps to None.
+        :return: The symbol for each HGNC identifier, or None if it isn't mapped
+        """
+        return _lookup(self.hgnc_ids, self.hgnc_symbols, hgnc_ids)
+
+    def __len__(self) -> int:  # noqa: D105
+        return len(self.entrez_ids)
+
+
+def _get_sorted_arrays(d: Mapping[str, str]):
+    items = sorted(
+        (int(key), value)
+        for key, value in d.items()
+        if key and key.isdigit()
+    )
+    keys = np.array([key for key, _ in items], dtype=np.int64)
+    values = np.array([value for _, value in items])
+    return keys, values
+
+
+def _to_int_array(identifiers: Iterable[Optional[str]]) -> np.ndarray:
+    return np.array(
+        [
+            int(identifier) if identifier and identifier.isdigit() else -1
+            for identifier in identifiers
+        ],
+        dtype=np.int64,
+    )
+
+
+def _lookup(keys: np.ndarray, values: np.ndarray, identifiers: Sequence[Optional[str]]) -> list:
+    """Look up the values for identifiers with a binary search in the sorted keys."""
+    queries = _to_int_array(identifiers)
+    if not len(keys):
+        return [None] * len(queries)
+    indexes = np.searchsorted(keys, queries)
+    np.clip(indexes, 0, len(keys) - 1, out=indexes)
+    found = keys[indexes] == queries
+    return [
+        value if is_found else None
+        for value, is_found in zip(values[indexes].tolist(), found.tolist())
+    ]
+
+
+def get_protmapper_version() -> str:
+    """Get the installed version of protmapper without importing it, since importing it loads its resources."""
+    try:
+        from importlib.metadata import version
+    except ImportError:  # Python 3.7
+        from pkg_resources import get_distribution
+        return get_distribution('protmapper').version
+    return version('protmapper')
+
+
+@lru_cache(maxsize=None)
+def get_hgnc_mapping(directory: Optional[str] = None) -> HGNCMapping:
+    """Get the mapping, building and saving it the first time it's used with the installed version of protmapper.
+
+    :param directory: The directory where the arrays are saved. Defaults to a directory for the installed version of
+     protmapper in :data:`bio2bel_kegg.constants.MAPPINGS_DIRECTORY`.
+    """
+    if directory is None:
+        directory = os.path.join(MAPPINGS_DIRECTORY, f'protmapper-{get_protmapper_version()}')
+
+    if not HGNCMapping.exists(directory):
+        logger.info('building HGNC mappings from protmapper in %s', directory)
+        HGNCMapping.from_protmapper().save(directory)
+
+    return HGNCMapping.load(directory)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+"""An export of the protein-pathway memberships as a sparse matrix that can be memory-mapped.
+
+The memberships are a compressed sparse row (CSR) matrix with a row for each pathway and a column for each protein,
+along with arrays of the identifiers of the pathways and proteins. Each array is saved as an uncompressed ``.npy``
+file of fixed-width types, so :meth:`MembershipMatrix.load` memory-maps them instead of reading them. Any number of
+processes that load the same export then share a single read-only copy in the page cache, without connecting to the
+database.
+"""
+
+import logging
+import os
+from typing import Iterable, List, Optional, TextIO, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .enrichment import query_memberships
+
+__all__ = [
+    'MembershipMatrix',
+]
+
+logger = logging.getLogger(__name__)
+
+#: The keys by which the proteins of a :class:`MembershipMatrix` are identified
+KEYS = ('kegg_id', 'hgnc_id', 'hgnc_symbol', 'entrez_id')
+
+_ARRAY_NAMES = ('pathway_ids', 'pathway_names', 'indptr', 'indices', *KEYS)
+
+
+class MembershipMatrix:
+    """Protein-pathway memberships as a CSR matrix with a row for each pathway and a column for each protein."""
+
+    def __init__(
+        self,
+        pathway_ids: np.ndarray,
+        pathway_names: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        kegg_id: np.ndarray,
+        hgnc_id: np.ndarray,
+        hgnc_symbol: np.ndarray,
+        entrez_id: np.ndarray,
+    ):
+        """Initialize the matrix. The arrays are used as they are, so they can be memory-mapped.
+
+        :param pathway_ids: The KEGG identifier of each pathway (row)
+        :param pathway_names: The name of each pathway (row)
+        :param indptr: The offsets in ``indices`` where the proteins of each pathway start, with one more element
+         than there are pathways
+        :param indices: The columns of the proteins of each pathway, one pathway after another
+        :param kegg_id: The KEGG identifier of each protein (column)
+        :param hgnc_id: The HGNC identifier of each protein (column), or an empty string
+        :param hgnc_symbol: The HGNC symbol of each protein (column), or an empty string
+        :param entrez_id: The NCBI Entrez Gene identifier of each protein (column)
+        """
+        self.pathway_ids = pathway_ids
+        self.pathway_names = pathway_names
+        self.indptr = indptr
+        self.indices = indices
+        self.kegg_id = kegg_id
+        self.hgnc_id = hgnc_id
+        self.hgnc_symbol = hgnc_symbol
+        self.entrez_id = entrez_id
+
+    @classmethod
+    def from_session(cls, session: Session, species_id: Optional[int] = None) -> 'MembershipMatrix':
+        """Build the matrix from the database with :func:`bio2bel_kegg.enrichment.query_memberships`.
+
+        :param session: A SQLAlchemy session
+        :param species_id: The primary key of a species to which the pathways are restricted. The proteins in the
+         matrix are the ones in at least one of the pathways.
+        """
+        memberships = query_memberships(session, species_id=species_id)
+        proteins = memberships.proteins
+        n_pathways = len(memberships.pathway_ids)
+        rows, columns = memberships.pathway_positions, memberships.protein_positions
+
+        order = np.lexsort((columns, rows))
+        logger.info('exported %d memberships of %d proteins in %d pathways', len(rows), len(proteins), n_pathways)
+        return cls(
+            pathway_ids=_to_str_array(memberships.pathway_ids),
+            pathway_names=_to_str_array(memberships.pathway_names),
+            indptr=np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n_pathways))]).astype(np.int64),
+            indices=columns[order].astype(np.int32),
+            **{
+                key: _to_str_array(protein[i] for protein in proteins)
+                for i, key in enumerate(KEYS)
+            },
+        )
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: Optional[str] = 'r') -> 'MembershipMatrix':
+        """Load a matrix saved with :meth:`save`.
+
+        :param directory: The directory of the matrix
+        :param mmap_mode: The mode in which the arrays are memory-mapped. If None, they're read into memory.
+        """
+        return cls(**{
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+            for name in _ARRAY_NAMES
+        })
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        """Check if a matrix was saved in the given directory."""
+        return all(os.path.exists(os.path.join(directory, f'{name}.npy')) for name in _ARRAY_NAMES)
+
+    def save(self, directory: str) -> None:
+        """Save each array of the matrix as a ``.npy`` file in the given directory."""
+        os.makedirs(directory, exist_ok=True)
+        for name in _ARRAY_NAMES:
+            path = os.path.join(directory, f'{name}.npy')
+            temporary_path = f'{path}.{os.getpid()}.tmp'
+            with open(temporary_path, 'wb') as file:
+                np.save(file, getattr(self, name))
+            os.replace(temporary_path, path)  # so other processes never load a partially written array
+
+    def get_columns(self, row: int) -> np.ndarray:
+        """Get the columns of the proteins of the pathway in the given row."""
+        return self.indices[self.indptr[row]:self.indptr[row + 1]]
+
+    def iter_gene_sets(self, key: str = 'hgnc_symbol') -> Iterable[Tuple[str, str, List[str]]]:
+        """Iterate over the KEGG identifier, name, and protein identifiers of each pathway.
+
+        :param key: One of ``kegg_id``, ``hgnc_id``, ``hgnc_symbol``, or ``entrez_id``. Proteins without an
+         identifier of this kind are left out.
+        """
+        if key not in KEYS:
+            raise ValueError(f'invalid key: {key}. Use one of {", ".join(KEYS)}')
+        values = getattr(self, key)
+        for row, (pathway_id, name) in enumerate(zip(self.pathway_ids.tolist(), self.pathway_names.tolist())):
+            yield pathway_id, name, [value for value in values[self.get_columns(row)].tolist() if value]
+
+    def write_gmt(self, file: TextIO, key: str = 'hgnc_symbol') -> None:
+        """Write the gene sets of the pathways in the GMT format, with the name of each pathway as its description.
+
+        :param file: A file opened for writing text
+        :param key: One of ``kegg_id``, ``hgnc_id``, ``hgnc_symbol``, or ``entrez_id``
+        """
+        for pathway_id, name, values in self.iter_gene_sets(key=key):
+            print(pathway_id, name, *values, sep='\t', file=file)  # noqa:T001
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """The number of pathways and the number of proteins."""
+        return len(self.pathway_ids), len(self.kegg_id)
+
+    def __len__(self) -> int:  # noqa: D105
+        return len(self.indices)
+
+
+def _to_str_array(values: Iterable[Optional[str]]) -> np.ndarray:
+    """Make a fixed-width string array, which can be memory-mapped unlike an array of objects."""
+    return np.array([value or '' for value in values], dtype=str)
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+
+"""Timings and counters of where the time of populating and updating the database goes.
+
+Metrics are only collected inside of :func:`collect_metrics`. Outside of it, the functions that record them return
+right away, and :func:`timed` returns the function it's given, so the instrumentation costs next to nothing when it's
+disabled. Three kinds of metrics are recorded:
+
+1. stages, with their number of calls, wall time, and CPU time of this process. Stages can be nested and run
+   interleaved, since fetching, parsing, and loading are streamed into each other, so their times overlap.
+2. counters, like the HTTP requests sent, the bytes received, the entities found in and missing from the entity store,
+   and the rows inserted into each table
+3. histograms, like the latency of HTTP requests
+
+The report is a JSON object with a key for each kind. Each value that is recorded can also be sent to external
+sinks, like a StatsD or Prometheus client, as it happens. A sink is a function that takes the kind, the name, and the
+value.
+
+.. code-block:: python
+
+    from bio2bel_kegg.manager import Manager
+    from bio2bel_kegg.metrics import collect_metrics
+
+    manager = Manager()
+    with collect_metrics('populate_metrics.json') as metrics:
+        manager.populate()
+
+    print(metrics.counters['http.requests'])
+
+Metrics are also collected when the environment variable ``BIO2BEL_KEGG_METRICS`` is set to the path of the report
+while :meth:`Manager.populate`, :meth:`Manager.populate_organisms`, or :meth:`Manager.update` run.
+"""
+
+import bisect
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence
+
+from .constants import METRICS_PATH
+
+__all__ = [
+    'Metrics',
+    'MetricsSink',
+    'collect_metrics',
+    'get_metrics',
+    'register_sink',
+    'stage',
+    'increment',
+    'observe',
+    'timed',
+    'measured',
+]
+
+logger = logging.getLogger(__name__)
+
+#: A function that gets the kind (``stage``, ``counter``, or ``histogram``), the name, and the value of each metric
+#: as it's recorded. The value of a stage is its wall time in seconds.
+MetricsSink = Callable[[str, str, float], None]
+
+#: The upper bounds in seconds of the buckets of latency histograms
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics: Optional['Metrics'] = None
+_sinks: List[MetricsSink] = []
+
+
+class _Stage:
+    __slots__ = ('calls', 'wall', 'cpu')
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'count', 'sum', 'min', 'max')
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def add(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, values: Mapping[str, Any]) -> None:
+        if not values['count']:
+            return
+        for i, count in enumerate(values['buckets'].values()):
+            self.counts[i] += count
+        self.count += values['count']
+        self.sum += values['sum']
+        self.min = min(self.min, values['min'])
+        self.max = max(self.max, values['max'])
+
+    def to_json(self) -> Mapping[str, Any]:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'mean': self.sum / self.count if self.count else None,
+            # the count of each bucket is of the values up to its bound that aren't in the previous buckets
+            'buckets': {
+                **{str(bound): count for bound, count in zip(self.buckets, self.counts)},
+                'inf': self.counts[-1],
+            },
+        }
+
+
+class Metrics:
+    """Stages, counters, and histograms recorded from any thread."""
+
+    def __init__(self, sinks: Iterable[MetricsSink] = ()):
+        """Initialize the metrics.
+
+        :param sinks: Functions to which each value is sent as it's recorded
+        """
+        self.sinks = list(sinks)
+        self.stages: Dict[str, _Stage] = defaultdict(_Stage)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.histograms: Dict[str, _Histogram] = {}
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def add_stage(self, name: str, wall: float, cpu: float, calls: int = 1) -> None:
+        """Add the time of one or more calls of a stage."""
+        with self._lock:
+            record = self.stages[name]
+            record.calls += calls
+            record.wall += wall
+            record.cpu += cpu
+        self._send('stage', name, wall)
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """Add to a counter."""
+        with self._lock:
+            self.counters[name] += value
+        self._send('counter', name, value)
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        """Add a value to a histogram. The buckets are only used when the histogram is made by its first value."""
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = _Histogram(buckets)
+            histogram.add(value)
+        self._send('histogram', name, value)
+
+    def merge(self, report: Mapping[str, Any]) -> None:
+        """Add the metrics of a report made by :meth:`to_json`, like one sent back by a worker process.
+
+        The values of the report aren't sent to the sinks.
+        """
+        with self._lock:
+            for name, values in report['stages'].items():
+                record = self.stages[name]
+                record.calls += values['calls']
+                record.wall += values['wall_time']
+                record.cpu += values['cpu_time']
+            for name, value in report['counters'].items():
+                self.counters[name] += value
+            for name, values in report['histograms'].items():
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    buckets = [float(bound) for bound in values['buckets'] if bound != 'inf']
+                    histogram = self.histograms[name] = _Histogram(buckets)
+                histogram.merge(values)
+
+    def _send(self, kind: str, name: str, value: float) -> None:
+        for sink in self.sinks:
+            try:
+                sink(kind, name, value)
+            except Exception:  # a broken sink shouldn't break a populate
+                logger.exception('metrics sink %r failed on %s %s', sink, kind, name)
+
+    def to_json(self) -> Mapping[str, Any]:
+        """Get the report of the metrics."""
+        with self._lock:
+            return {
+                'wall_time': time.perf_counter() - self._start,
+                'stages': {
+                    name: {'calls': record.calls, 'wall_time': record.wall, 'cpu_time': record.cpu}
+                    for name, record in sorted(self.stages.items())
+                },
+                'counters': dict(sorted(self.counters.items())),
+                'histograms': {
+                    name: histogram.to_json()
+                    for name, histogram in sorted(self.histograms.items())
+                },
+            }
+
+    def write(self, path: str) -> None:
+        """Write the report of the metrics as JSON."""
+        with open(path, 'w') as file:
+            json.dump(self.to_json(), file, indent=2)
+
+
+def get_metrics() -> Optional[Metrics]:
+    """Get the metrics that are being collected, or None if they aren't."""
+    return _metrics
+
+
+def register_sink(sink: MetricsSink) -> None:
+    """Send the values recorded by all later calls of :func:`collect_metrics` to a sink."""
+    _sinks.append(sink)
+
+
+@contextmanager
+def collect_metrics(path: Optional[str] = None, sinks: Iterable[MetricsSink] = ()) -> Iterator[Metrics]:
+    """Collect metrics while the context is open.
+
+    If metrics are already being collected, the outer collection is used and neither the path nor the sinks are.
+
+    :param path: The path of the JSON report written at the end, even if there's an error
+    :param sinks: Functions to which each value is sent as it's recorded, on top of the registered ones
+    """
+    global _metrics
+    if _metrics is not None:
+        yield _metrics
+        return
+
+    metrics = _metrics = Metrics(sinks=[*_sinks, *sinks])
+    try:
+        yield metrics
+    finally:
+        _metrics = None
+        if path is not None:
+            metrics.write(path)
+            logger.info('wrote metrics to %s', path)
+
+
+def _reset() -> None:
+    """Stop collecting metrics without writing them, like in a worker process forked while they were collected."""
+    global _metrics
+    _metrics = None
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name: str):
+    """Time a block of code as a stage, if metrics are being collected.
+
+    :param name: The name of the stage, like ``populate.proteins``
+    """
+    if _metrics is None:
+        return _NULL_STAGE
+    return _time_stage(_metrics, name)
+
+
+@contextmanager
+def _time_stage(metrics: Metrics, name: str) -> Iterator[None]:
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        metrics.add_stage(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+
+def increment(name: str, value: int = 1) -> None:
+    """Add to a counter, if metrics are being collected."""
+    if _metrics is not None:
+        _metrics.increment(name, value)
+
+
+def observe(name: str, value: float) -> None:
+    """Add a value to a histogram, if metrics are being collected."""
+    if _metrics is not None:
+        _metrics.observe(name, value)
+
+
+def timed(function: Callable, name: str) -> Callable:
+    """Time each call of a function as a stage if metrics are being collected, or else return the function itself.
+
+    Unlike :func:`stage`, this is checked once rather than on each call, so it's meant for functions called many
+    times in a loop, like a parser.
+    """
+    metrics = _metrics
+    if metrics is None:
+        return function
+
+    @wraps(function)
+    def _timed(*args, **kwargs):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            metrics.add_stage(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    return _timed
+
+
+def measured(name: str, collect: bool = False) -> Callable[[Callable], Callable]:
+    """Make a decorator that times each call of a function as a stage.
+
+    :param name: The name of the stage
+    :param collect: Collect metrics while the function runs if :data:`bio2bel_kegg.constants.METRICS_PATH` is set,
+     writing the report there, unless they're being collected already
+    """
+    def _decorator(function: Callable) -> Callable:
+        @wraps(function)
+        def _measured(*args, **kwargs):
+            if collect and METRICS_PATH and _metrics is None:
+                with collect_metrics(METRICS_PATH), stage(name):
+                    return function(*args, **kwargs)
+            with stage(name):
+                return function(*args, **kwargs)
+
+        return _measured
+
+    return _decorator
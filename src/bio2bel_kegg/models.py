@@ -4,9 +4,10 @@
 
 from __future__ import annotations
 
+from datetime import datetime
 from typing import List, Optional
 
-from sqlalchemy import Column, ForeignKey, Integer, String, Table, Text
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, Table, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -20,22 +21,70 @@ Base = declarative_base()
 SPECIES_TABLE_NAME = f'{MODULE_NAME}_species'
 PATHWAY_TABLE_NAME = f'{MODULE_NAME}_pathway'
 PATHWAY_TABLE_HIERARCHY = f'{MODULE_NAME}_pathway_hierarchy'
+PATHWAY_CATEGORY_TABLE_NAME = f'{MODULE_NAME}_pathway_category'
+RELATED_PATHWAY_TABLE = f'{MODULE_NAME}_related_pathway'
 PROTEIN_TABLE_NAME = f'{MODULE_NAME}_protein'
 PROTEIN_PATHWAY_TABLE = f'{MODULE_NAME}_protein_pathway'
+RELEASE_TABLE_NAME = f'{MODULE_NAME}_release'
+
+NCBIGENE = 'ncbigene'
 
 protein_pathway = Table(
     PROTEIN_PATHWAY_TABLE,
     Base.metadata,
     Column('protein_id', Integer, ForeignKey(f'{PROTEIN_TABLE_NAME}.id'), primary_key=True),
     Column('pathway_id', Integer, ForeignKey(f'{PATHWAY_TABLE_NAME}.id'), primary_key=True),
+    # the primary key only covers lookups by protein, so this covers lookups of the proteins of a pathway
+    Index(f'ix_{PROTEIN_PATHWAY_TABLE}_pathway_id_protein_id', 'pathway_id', 'protein_id'),
+)
+
+#: The transitive closure of the KEGG BRITE hierarchy of pathway maps: a row for each pathway and each node above it,
+#: from its reference map at depth 0 up to its top category, so all the pathways under a category are one join away
+pathway_hierarchy = Table(
+    PATHWAY_TABLE_HIERARCHY,
+    Base.metadata,
+    Column('category_id', Integer, ForeignKey(f'{PATHWAY_CATEGORY_TABLE_NAME}.id'), primary_key=True),
+    Column('pathway_id', Integer, ForeignKey(f'{PATHWAY_TABLE_NAME}.id'), primary_key=True),
+    Column('depth', Integer, nullable=False, doc='the number of levels from the reference map of the pathway'),
+    # the primary key only covers lookups by category, so this covers lookups of the categories of a pathway
+    Index(f'ix_{PATHWAY_TABLE_HIERARCHY}_pathway_id_category_id', 'pathway_id', 'category_id'),
+)
+
+#: The links of the REL_PATHWAY sections of the pathways
+related_pathway = Table(
+    RELATED_PATHWAY_TABLE,
+    Base.metadata,
+    Column('pathway_id', Integer, ForeignKey(f'{PATHWAY_TABLE_NAME}.id'), primary_key=True),
+    Column('related_pathway_id', Integer, ForeignKey(f'{PATHWAY_TABLE_NAME}.id'), primary_key=True),
 )
 
 
+class Release(Base):
+    """KEGG releases loaded in the database."""
+
+    __tablename__ = RELEASE_TABLE_NAME
+
+    id = Column(Integer, primary_key=True)  # noqa:A003
+
+    release = Column(String(255), nullable=False, doc='KEGG release, like "Release 106.0+/05-16, May 23"')
+    created = Column(DateTime, default=datetime.utcnow, nullable=False, doc='when the release was loaded')
+
+    def __repr__(self):  # noqa: D105
+        return f'Release(release={self.release}, created={self.created})'
+
+
 class Species(Base, SpeciesMixin):
-    """Species table."""
+    """Species table.
+
+    An organism's species is written in the same transaction as its pathways and proteins, so an organism is
+    completely loaded if and only if its species is in the table.
+    """
 
     __tablename__ = SPECIES_TABLE_NAME
 
+    kegg_code = Column(String(8), unique=True, index=True, doc='KEGG organism code, like hsa')
+    kegg_genome_id = Column(String(16), doc='KEGG genome identifier, like T01001')
+
 
 class Pathway(Base, CompathPathwayMixin):
     """Pathway Table."""
@@ -58,6 +107,52 @@ class Pathway(Base, CompathPathwayMixin):
         backref='pathways',
     )
 
+    related_pathways = relationship(
+        'Pathway',
+        secondary=related_pathway,
+        primaryjoin=lambda: Pathway.id == related_pathway.c.pathway_id,
+        secondaryjoin=lambda: Pathway.id == related_pathway.c.related_pathway_id,
+        viewonly=True,
+        doc='the pathways in the REL_PATHWAY section of this pathway',
+    )
+
+    categories = relationship(
+        'PathwayCategory',
+        secondary=pathway_hierarchy,
+        viewonly=True,
+        order_by='PathwayCategory.level',
+        doc='the nodes of the KEGG BRITE hierarchy above this pathway, from the top category down to its reference map',
+    )
+
+
+class PathwayCategory(Base):
+    """A node of the KEGG BRITE hierarchy of pathway maps (br08901).
+
+    The nodes are the top categories like Metabolism, their subcategories like Carbohydrate metabolism, and at the
+    leaves the reference maps like 00010, which the pathways of each organism are drawn from.
+    """
+
+    __tablename__ = PATHWAY_CATEGORY_TABLE_NAME
+
+    id = Column(Integer, primary_key=True)  # noqa:A003
+
+    name = Column(String(255), nullable=False, index=True, doc='name of the category or the reference map')
+    level = Column(Integer, nullable=False, doc='level in the hierarchy, from 1 for the top categories')
+    map_number = Column(String(8), index=True, doc='map number of a reference map, like 00010')
+
+    parent_id = Column(Integer, ForeignKey(f'{PATHWAY_CATEGORY_TABLE_NAME}.id'))
+    parent = relationship('PathwayCategory', remote_side=[id], backref='children')
+
+    pathways = relationship(
+        Pathway,
+        secondary=pathway_hierarchy,
+        viewonly=True,
+        doc='the pathways of all organisms under this node, at any depth',
+    )
+
+    def __repr__(self):  # noqa: D105
+        return f'PathwayCategory(name={self.name}, level={self.level}, map_number={self.map_number})'
+
 
 class Protein(Base, CompathProteinMixin):
     """Genes Table."""
@@ -68,9 +163,9 @@ class Protein(Base, CompathProteinMixin):
 
     kegg_id = Column(String(255), nullable=False, index=True, doc='KEGG id of the protein')
     entrez_id = Column(String(255), nullable=False, index=True, doc='Entrez identifier')
-    uniprot_id = Column(String(255), doc='uniprot id of the protein (there could be more than one)')
-    hgnc_id = Column(String(255), doc='hgnc id of the protein')
-    hgnc_symbol = Column(String(255), doc='hgnc symbol of the protein')
+    uniprot_id = Column(String(255), index=True, doc='uniprot id of the protein (there could be more than one)')
+    hgnc_id = Column(String(255), index=True, doc='hgnc id of the protein')
+    hgnc_symbol = Column(String(255), index=True, doc='hgnc symbol of the protein')
 
     def __repr__(self):
         """Return HGNC symbol."""
@@ -83,11 +178,7 @@ class Protein(Base, CompathProteinMixin):
 
     def to_pybel(self) -> pybel.dsl.Protein:
         """Serialize to PyBEL node data dictionary."""
-        return pybel.dsl.Protein(
-            namespace=HGNC,
-            identifier=self.hgnc_id,
-            name=self.hgnc_symbol,
-        )
+        return get_protein_node(self.hgnc_id, self.hgnc_symbol, self.entrez_id)
 
     def get_uniprot_ids(self) -> Optional[List[str]]:
         """Return a list of uniprot ids."""
@@ -95,3 +186,14 @@ class Protein(Base, CompathProteinMixin):
             return None
 
         return self.uniprot_id.split(" ")
+
+
+def get_protein_node(hgnc_id: Optional[str], hgnc_symbol: Optional[str], entrez_id: str) -> pybel.dsl.Protein:
+    """Make the PyBEL node of a protein, which is in the NCBI Gene namespace if it doesn't have an HGNC identifier.
+
+    Only human proteins have HGNC identifiers, so the proteins of other organisms are identified by their NCBI Entrez
+    Gene identifiers.
+    """
+    if not hgnc_id:
+        return pybel.dsl.Protein(namespace=NCBIGENE, identifier=entrez_id, name=entrez_id)
+    return pybel.dsl.Protein(namespace=HGNC, identifier=hgnc_id, name=hgnc_symbol)
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+
+"""Fetching and parsing the pathways and proteins of KEGG organisms in a pool of worker processes.
+
+Each worker downloads the ``list/pathway/<org>`` and ``link/pathway/<org>`` files of one organism, fetches the flat
+files of its genome, pathways, and proteins, and parses them into compact records. Only these records are sent back
+to the main process, which loads them into the database one organism at a time. The organisms can also be read from
+a bundle made by :func:`bio2bel_kegg.bundle.build_bundle`, in which case nothing is downloaded.
+"""
+
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import ExitStack
+from functools import lru_cache
+from typing import Any, IO, Iterable, List, Mapping, NamedTuple, Optional, Tuple, Union
+
+import pandas as pd
+
+from .bundle import Bundle
+from .client import (
+    PathwayEntry, ProteinEntry, get_pathway_proteins, iter_entities_texts, iter_sections, parse_pathway_entry,
+    parse_protein_entry,
+)
+from .constants import KEGG_REQUESTS_PER_SECOND, PROTEIN_SOURCES
+from .fetcher import Fetcher, OfflineFetcher
+from .metrics import _reset as _reset_metrics
+from .metrics import collect_metrics, get_metrics, stage, timed
+from .parsers import (
+    get_conv_protein_entries, get_entity_pathway_df, get_ncbigene_conv_df, get_pathway_df, get_uniprot_conv_df,
+)
+from .store import EntityStore, get_default_entity_store
+
+__all__ = [
+    'OrganismEntries',
+    'get_organism_entries',
+    'get_bundle_organism_entries',
+    'iter_organisms_entries',
+    'parse_taxonomy_id',
+]
+
+logger = logging.getLogger(__name__)
+
+
+class OrganismEntries(NamedTuple):
+    """The parsed pathways and proteins of a KEGG organism."""
+
+    #: The KEGG organism code, like hsa
+    kegg_code: str
+    #: The KEGG genome identifier, like T01001
+    kegg_genome_id: Optional[str]
+    #: The NCBI Taxonomy identifier from the genome entry, like 9606
+    taxonomy_id: Optional[str]
+    pathways: List[PathwayEntry]
+    proteins: List[ProteinEntry]
+    #: Pairs of KEGG protein identifiers and KEGG pathway identifiers, or the categorical dataframe of the link file,
+    #: which is much smaller to send back from a worker process
+    protein_pathway_pairs: Union[pd.DataFrame, List[Tuple[str, str]]]
+
+
+def parse_taxonomy_id(text: str) -> Optional[str]:
+    """Get the NCBI Taxonomy identifier from the flat file of a KEGG genome, like ``gn:T01001``.
+
+    :param text: The text of the flat file
+    :return: The identifier, like ``9606``, or None if the genome has no TAXONOMY section
+    """
+    for _, values in iter_sections(text, {'TAXONOMY'}):
+        for value in values:
+            if value.startswith('TAX:'):
+                return value[len('TAX:'):].strip()
+    return None
+
+
+def get_organism_entries(
+    kegg_code: str,
+    kegg_genome_id: Optional[str] = None,
+    fetcher: Optional[Fetcher] = None,
+    store: Optional[EntityStore] = None,
+    pathways_url: Union[None, str, IO] = None,
+    protein_pathway_url: Union[None, str, IO] = None,
+    protein_source: str = 'entries',
+    ncbigene_url: Union[None, str, IO] = None,
+    uniprot_url: Union[None, str, IO] = None,
+) -> OrganismEntries:
+    """Fetch and parse the pathways and proteins of an organism.
+
+    :param kegg_code: The KEGG organism code, like ``hsa``
+    :param kegg_genome_id: The KEGG genome identifier, like ``T01001``, used to look up the NCBI Taxonomy identifier
+    :param fetcher: The fetcher used to get the entity descriptions from the KEGG API
+    :param store: The store that caches entities. Defaults to the one configured in :mod:`bio2bel_kegg.store`.
+    :param pathways_url: An optional url or file of the KEGG pathway list of the organism
+    :param protein_pathway_url: An optional url or file of the KEGG protein-pathway links of the organism
+    :param protein_source: Where the proteins come from, one of :data:`bio2bel_kegg.constants.PROTEIN_SOURCES`.
+     ``entries`` fetches the flat file of each protein. ``pathways`` takes the proteins and their memberships from
+     the GENE sections of the pathways, see :func:`bio2bel_kegg.client.get_pathway_proteins`. ``conv`` takes the
+     proteins from the protein-pathway links and their identifiers from the organism's conv tables, see
+     :func:`bio2bel_kegg.parsers.get_conv_protein_entries`. Both of the latter need a few requests instead of one for
+     every few proteins.
+    :param ncbigene_url: An optional url or file of the NCBI Entrez Gene conv table of the organism
+    :param uniprot_url: An optional url or file of the UniProt conv table of the organism
+    """
+    if protein_source not in PROTEIN_SOURCES:
+        raise ValueError(f'unknown protein source: {protein_source}')
+    if fetcher is None:
+        fetcher = Fetcher()
+
+    with stage('organisms.get_entries'):
+        taxonomy_id = None
+        if kegg_genome_id is not None:
+            for _, text in iter_entities_texts([f'gn:{kegg_genome_id}'], fetcher=fetcher, store=store):
+                taxonomy_id = parse_taxonomy_id(text)
+
+        with stage('organisms.get_lists'):
+            pathways_df = get_pathway_df(url=pathways_url, organism=kegg_code)
+        parse = timed(parse_pathway_entry, 'parse.parse_pathway_entry')
+        pathways = [
+            parse(entity)
+            for entity in iter_entities_texts(list(pathways_df['kegg_pathway_id']), fetcher=fetcher, store=store)
+        ]
+
+        if protein_source == 'pathways':
+            proteins, protein_pathway_pairs = get_pathway_proteins(pathways, kegg_code)
+        else:
+            with stage('organisms.get_lists'):
+                entity_pathway_df = get_entity_pathway_df(url=protein_pathway_url, organism=kegg_code)
+            protein_pathway_pairs = entity_pathway_df
+            kegg_protein_ids = entity_pathway_df['kegg_protein_id'].unique().tolist()
+            if protein_source == 'conv':
+                with stage('organisms.get_lists'):
+                    proteins = get_conv_protein_entries(
+                        kegg_protein_ids,
+                        get_ncbigene_conv_df(url=ncbigene_url, organism=kegg_code),
+                        get_uniprot_conv_df(url=uniprot_url, organism=kegg_code),
+                    )
+            else:
+                parse = timed(parse_protein_entry, 'parse.parse_protein_entry')
+                proteins = [
+                    parse(entity)
+                    for entity in iter_entities_texts(kegg_protein_ids, fetcher=fetcher, store=store)
+                ]
+
+    return OrganismEntries(
+        kegg_code=kegg_code,
+        kegg_genome_id=kegg_genome_id,
+        taxonomy_id=taxonomy_id,
+        pathways=pathways,
+        proteins=proteins,
+        protein_pathway_pairs=protein_pathway_pairs,
+    )
+
+
+def get_bundle_organism_entries(
+    bundle: Bundle,
+    kegg_code: str,
+    kegg_genome_id: Optional[str] = None,
+    protein_source: str = 'entries',
+) -> OrganismEntries:
+    """Parse the pathways and proteins of an organism from a bundle, without the network.
+
+    Entities that aren't in the bundle are logged and skipped.
+
+    :param bundle: The open bundle
+    :param kegg_code: The KEGG organism code, like ``hsa``
+    :param kegg_genome_id: The KEGG genome identifier, like ``T01001``
+    :param protein_source: Where the proteins come from, like for :func:`get_organism_entries`
+    :raises ValueError: If the bundle doesn't have the lists of the organism
+    """
+    pathways_name, protein_pathway_name = f'{kegg_code}_pathways.tsv', f'{kegg_code}_protein_pathway.tsv'
+    # the lists of human are always bundled, under the names of the files downloaded for a populate of human
+    if kegg_code == 'hsa' and not bundle.has_list(pathways_name):
+        pathways_name, protein_pathway_name = 'pathways.tsv', 'protein_pathway.tsv'
+    with ExitStack() as stack:
+        conv_files = {}
+        if protein_source == 'conv':
+            conv_files = {
+                'ncbigene_url': stack.enter_context(bundle.open_list(f'{kegg_code}_ncbi-geneid.tsv')),
+                'uniprot_url': stack.enter_context(bundle.open_list(f'{kegg_code}_uniprot.tsv')),
+            }
+        return get_organism_entries(
+            kegg_code,
+            kegg_genome_id,
+            fetcher=OfflineFetcher(),
+            store=bundle.store,
+            pathways_url=stack.enter_context(bundle.open_list(pathways_name)),
+            protein_pathway_url=stack.enter_context(bundle.open_list(protein_pathway_name)),
+            protein_source=protein_source,
+            **conv_files,
+        )
+
+
+@lru_cache(maxsize=1)
+def _open_bundle(path: str) -> Bundle:
+    """Open a bundle once per worker process, since reading the index of a big one takes a while."""
+    return Bundle(path)
+
+
+def _initialize_worker() -> None:
+    # a forked worker would otherwise share the open segment files of its parent's entity store
+    get_default_entity_store.cache_clear()
+    _open_bundle.cache_clear()
+    # and would add to a copy of the metrics of its parent
+    _reset_metrics()
+
+
+def iter_organisms_entries(
+    organisms: Iterable[Tuple[str, Optional[str]]],
+    processes: Optional[int] = None,
+    requests_per_second: Optional[float] = None,
+    bundle: Optional[Bundle] = None,
+    protein_source: str = 'entries',
+) -> Iterable[OrganismEntries]:
+    """Fetch and parse organisms in a pool of processes, yielding each one as soon as it's done.
+
+    Organisms that can't be fetched are logged and skipped, so they can be tried again later.
+
+    :param organisms: Pairs of KEGG organism codes and KEGG genome identifiers
+    :param processes: The number of worker processes. If 1, the organisms are handled in this process.
+    :param requests_per_second: The rate limit for requests to the KEGG API, shared by all workers. Defaults to
+     :data:`bio2bel_kegg.constants.KEGG_REQUESTS_PER_SECOND`.
+    :param bundle: A bundle from which the organisms are read instead of being fetched. Each worker opens its own.
+    :param protein_source: Where the proteins come from, like for :func:`get_organism_entries`
+    """
+    if requests_per_second is None:
+        requests_per_second = KEGG_REQUESTS_PER_SECOND
+
+    if processes == 1:
+        fetcher = Fetcher(requests_per_second=requests_per_second)
+        for kegg_code, kegg_genome_id in organisms:
+            try:
+                if bundle is None:
+                    entries = get_organism_entries(
+                        kegg_code, kegg_genome_id, fetcher=fetcher, protein_source=protein_source,
+                    )
+                else:
+                    entries = get_bundle_organism_entries(bundle, kegg_code, kegg_genome_id, protein_source)
+            except Exception:
+                logger.exception('could not get organism %s', kegg_code)
+                continue
+            yield entries
+        return
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    organisms = iter(organisms)
+    # workers collect their own metrics and send them back with their results, which are merged into these
+    metrics = get_metrics()
+    # each worker gets its share of the rate limit, since KEGG throttles by client rather than by connection
+    worker_requests_per_second = requests_per_second / processes
+    with ProcessPoolExecutor(max_workers=processes, initializer=_initialize_worker) as executor:
+        future_to_code = {}
+
+        def _submit(n: int) -> None:
+            for kegg_code, kegg_genome_id in organisms:
+                future = executor.submit(
+                    _get_organism_entries,
+                    kegg_code,
+                    kegg_genome_id,
+                    worker_requests_per_second,
+                    metrics is not None,
+                    None if bundle is None else bundle.path,
+                    protein_source,
+                )
+                future_to_code[future] = kegg_code
+                n -= 1
+                if not n:
+                    return
+
+        # keep a few organisms queued per worker so results don't pile up in memory before they're loaded
+        _submit(2 * processes)
+        while future_to_code:
+            done, _ = wait(future_to_code, return_when=FIRST_COMPLETED)
+            for future in done:
+                kegg_code = future_to_code.pop(future)
+                try:
+                    entries = future.result()
+                except Exception:
+                    logger.exception('could not get organism %s', kegg_code)
+                    continue
+                if metrics is not None:
+                    entries, report = entries
+                    metrics.merge(report)
+                yield entries
+            _submit(len(done))
+
+
+def _get_organism_entries(
+    kegg_code: str,
+    kegg_genome_id: Optional[str],
+    requests_per_second: float,
+    collect: bool = False,
+    bundle_path: Optional[str] = None,
+    protein_source: str = 'entries',
+) -> Union[OrganismEntries, Tuple[OrganismEntries, Mapping[str, Any]]]:
+    if not collect:
+        return _get_worker_entries(kegg_code, kegg_genome_id, requests_per_second, bundle_path, protein_source)
+    with collect_metrics() as metrics:
+        entries = _get_worker_entries(kegg_code, kegg_genome_id, requests_per_second, bundle_path, protein_source)
+    return entries, metrics.to_json()
+
+
+def _get_worker_entries(
+    kegg_code: str,
+    kegg_genome_id: Optional[str],
+    requests_per_second: float,
+    bundle_path: Optional[str],
+    protein_source: str,
+) -> OrganismEntries:
+    if bundle_path is not None:
+        return get_bundle_organism_entries(_open_bundle(bundle_path), kegg_code, kegg_genome_id, protein_source)
+    fetcher = Fetcher(requests_per_second=requests_per_second)
+    return get_organism_entries(kegg_code, kegg_genome_id, fetcher=fetcher, protein_source=protein_source)
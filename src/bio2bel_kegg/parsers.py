@@ -3,53 +3,235 @@
 """This module parsers the KEGG pathway names file.
 
 The "Complete list of pathways" file maps the KEGG identifiers to their corresponding pathway name .
+
+The protein-pathway link files are read into categorical columns, so each identifier is kept once however many rows
+it's in and each row only takes two integer codes. This matters for the link file of all organisms, which has millions
+of rows but only as many distinct pathways as there are organisms times a few hundred. Functions that work on the
+whole column, like :func:`remove_path_prefix`, only have to go over the distinct identifiers. The link files can also
+be read in chunks with :func:`iter_entity_pathway_dfs`.
 """
 
-from typing import Optional
+import re
+from typing import Iterable, Iterator, List, Optional, Tuple, TypeVar
 
 import pandas as pd
 
 from bio2bel.utils import ensure_path
-from .constants import KEGG_HUMAN_PATHWAYS_URL, KEGG_ORGANISM_URL, MODULE_NAME, PROTEIN_PATHWAY_HUMAN_URL
+from .client import ProteinEntry
+from .constants import (
+    KEGG_CONV_URL, KEGG_HUMAN_PATHWAYS_URL, KEGG_ORGANISM_URL, KEGG_PATHWAY_HIERARCHY_URL, KEGG_PATHWAYS_URL,
+    KEGG_STATISTICS_URL, MODULE_NAME, PROTEIN_PATHWAY_HUMAN_URL, PROTEIN_PATHWAY_URL,
+)
 
 __all__ = [
     'get_pathway_df',
     'get_entity_pathway_df',
+    'iter_entity_pathway_dfs',
+    'remove_path_prefix',
     'get_organisms_df',
+    'get_ncbigene_conv_df',
+    'get_uniprot_conv_df',
+    'get_conv_protein_entries',
+    'get_kegg_release',
+    'parse_kegg_release',
+    'get_pathway_hierarchy',
+    'parse_pathway_hierarchy',
 ]
 
+#: The name of the downloaded KEGG BRITE hierarchy of pathway maps in the data directory
+PATHWAY_HIERARCHY_NAME = 'br08901.keg'
+
+#: A reference map in the hierarchy, like ``00010  Glycolysis / Gluconeogenesis``
+_MAP_NUMBER = re.compile(r'^(\d{5})\s+')
+_HTML_TAG = re.compile(r'<[^>]*>')
 
-def get_pathway_df(url: Optional[str] = None) -> pd.DataFrame:
+
+def get_pathway_df(url: Optional[str] = None, force: bool = False, organism: Optional[str] = None) -> pd.DataFrame:
     """Convert tab separated txt files to pandas Dataframe.
 
     :param url: url from KEGG tab separated file
+    :param force: Download the file again even if it's already in the data directory
+    :param organism: The KEGG code of the organism whose pathways are listed, like ``hsa``. Defaults to human.
     :return: dataframe of the file
     """
+    if url is None and organism is not None:
+        url = ensure_path(MODULE_NAME, f'{KEGG_PATHWAYS_URL}/{organism}', path=f'{organism}_pathways.tsv', force=force)
+    # each pathway is listed once, so its identifier gains nothing from being categorical
     df = pd.read_csv(
-        url or ensure_path(MODULE_NAME, KEGG_HUMAN_PATHWAYS_URL, path='pathways.tsv'),
+        url or ensure_path(MODULE_NAME, KEGG_HUMAN_PATHWAYS_URL, path='pathways.tsv', force=force),
         sep='\t',
         header=None,
         names=['kegg_pathway_id', 'name'],
+        dtype=str,
     )
-    # df['kegg_pathway_id'] = df['kegg_pathway_id'].map(_remove_path_prefix)
     return df
 
 
-def get_entity_pathway_df(url: Optional[str] = None) -> pd.DataFrame:
+def get_entity_pathway_df(
+    url: Optional[str] = None,
+    force: bool = False,
+    organism: Optional[str] = None,
+) -> pd.DataFrame:
     """Convert tab separated text files in to DataFrame.
 
     :param url: An optional url from a KEGG TSV file
+    :param force: Download the file again even if it's already in the data directory
+    :param organism: The KEGG code of the organism whose proteins are linked, like ``hsa``. Defaults to human.
+    :return: A dataframe with the categorical columns ``kegg_protein_id`` and ``kegg_pathway_id``. The pathway
+     identifiers keep their ``path:`` prefix, which can be removed with :func:`remove_path_prefix`.
     """
-    df = pd.read_csv(
-        url or ensure_path(MODULE_NAME, PROTEIN_PATHWAY_HUMAN_URL, path='protein_pathway.tsv'),
+    return pd.read_csv(
+        _get_entity_pathway_path(url=url, force=force, organism=organism),
         sep='\t',
         header=None,
         names=['kegg_protein_id', 'kegg_pathway_id'],
+        dtype='category',
     )
-    # df['kegg_pathway_id'] = df['kegg_pathway_id'].map(_remove_path_prefix)
+
+
+def iter_entity_pathway_dfs(
+    url: Optional[str] = None,
+    force: bool = False,
+    organism: Optional[str] = None,
+    chunksize: int = 1000000,
+) -> Iterator[pd.DataFrame]:
+    """Iterate over a protein-pathway link file in chunks, like :func:`get_entity_pathway_df`.
+
+    The categories of each chunk are only the identifiers in it.
+
+    :param url: An optional url from a KEGG TSV file
+    :param force: Download the file again even if it's already in the data directory
+    :param organism: The KEGG code of the organism whose proteins are linked, like ``hsa``. Defaults to human.
+    :param chunksize: The number of rows in each chunk
+    """
+    yield from pd.read_csv(
+        _get_entity_pathway_path(url=url, force=force, organism=organism),
+        sep='\t',
+        header=None,
+        names=['kegg_protein_id', 'kegg_pathway_id'],
+        dtype='category',
+        chunksize=chunksize,
+    )
+
+
+def _get_entity_pathway_path(url: Optional[str], force: bool, organism: Optional[str]):
+    if url is not None:
+        return url
+    if organism is not None:
+        return ensure_path(
+            MODULE_NAME, f'{PROTEIN_PATHWAY_URL}/{organism}', path=f'{organism}_protein_pathway.tsv', force=force,
+        )
+    return ensure_path(MODULE_NAME, PROTEIN_PATHWAY_HUMAN_URL, path='protein_pathway.tsv', force=force)
+
+
+PathwayIds = TypeVar('PathwayIds', str, pd.Series)
+
+
+def remove_path_prefix(kegg_pathway_ids: PathwayIds) -> PathwayIds:
+    """Remove the ``path:`` prefix from a KEGG pathway identifier or a column of them.
+
+    :param kegg_pathway_ids: A KEGG pathway identifier or a column, like the ``kegg_pathway_id`` column of
+     :func:`get_entity_pathway_df`. The categories of a categorical column are renamed, so the rows aren't copied.
+    :return: An identifier or a column of the same type, without the prefixes
+    """
+    if isinstance(kegg_pathway_ids, str):
+        if kegg_pathway_ids.startswith('path:'):
+            return kegg_pathway_ids[len('path:'):]
+        return kegg_pathway_ids
+    if isinstance(kegg_pathway_ids.dtype, pd.CategoricalDtype):
+        categories = kegg_pathway_ids.cat.categories
+        new_categories = categories.str.replace('^path:', '', regex=True)
+        if new_categories.is_unique:
+            return kegg_pathway_ids.cat.rename_categories(new_categories)
+        # the same pathway is in the column both with and without its prefix
+        return kegg_pathway_ids.astype(str).str.replace('^path:', '', regex=True).astype('category')
+    return kegg_pathway_ids.str.replace('^path:', '', regex=True)
+
+
+def _get_conv_df(
+    target: str,
+    column: str,
+    url: Optional[str],
+    force: bool,
+    organism: Optional[str],
+) -> pd.DataFrame:
+    if organism is None:
+        organism = 'hsa'
+    if url is None:
+        url = ensure_path(
+            MODULE_NAME, f'{KEGG_CONV_URL}/{target}/{organism}', path=f'{organism}_{target}.tsv', force=force,
+        )
+    df = pd.read_csv(
+        url,
+        sep='\t',
+        header=None,
+        names=['kegg_protein_id', column],
+        dtype=str,
+    )
+    # the identifiers are prefixed with their database, like ncbi-geneid:10458 or up:Q9UQB8
+    df[column] = df[column].str.split(':', n=1).str[1]
     return df
 
 
+def get_ncbigene_conv_df(
+    url: Optional[str] = None,
+    force: bool = False,
+    organism: Optional[str] = None,
+) -> pd.DataFrame:
+    """Get the NCBI Entrez Gene identifiers of the genes of an organism from ``conv/ncbi-geneid/<org>``.
+
+    :param url: An optional url from a KEGG conv file
+    :param force: Download the file again even if it's already in the data directory
+    :param organism: The KEGG code of the organism, like ``hsa``. Defaults to human.
+    :return: A dataframe with the columns ``kegg_protein_id`` and ``entrez_id``
+    """
+    return _get_conv_df('ncbi-geneid', 'entrez_id', url=url, force=force, organism=organism)
+
+
+def get_uniprot_conv_df(
+    url: Optional[str] = None,
+    force: bool = False,
+    organism: Optional[str] = None,
+) -> pd.DataFrame:
+    """Get the UniProt identifiers of the genes of an organism from ``conv/uniprot/<org>``.
+
+    :param url: An optional url from a KEGG conv file
+    :param force: Download the file again even if it's already in the data directory
+    :param organism: The KEGG code of the organism, like ``hsa``. Defaults to human.
+    :return: A dataframe with the columns ``kegg_protein_id`` and ``uniprot_id``, with a row for each of the UniProt
+     identifiers of a gene
+    """
+    return _get_conv_df('uniprot', 'uniprot_id', url=url, force=force, organism=organism)
+
+
+def get_conv_protein_entries(
+    kegg_protein_ids: Iterable[str],
+    ncbigene_df: pd.DataFrame,
+    uniprot_df: pd.DataFrame,
+) -> List[ProteinEntry]:
+    """Join the identifiers of the conv tables onto proteins, instead of fetching the flat file of each protein.
+
+    :param kegg_protein_ids: KEGG protein identifiers, like the ones of a protein-pathway link file
+    :param ncbigene_df: The table from :func:`get_ncbigene_conv_df`
+    :param uniprot_df: The table from :func:`get_uniprot_conv_df`
+    :return: The proteins in the given order. Proteins without an NCBI Entrez Gene identifier get the one from their
+     KEGG identifier, like the ENTRY line of their flat file has, and the UniProt identifiers of each are in its xrefs.
+    """
+    uniprot_ids = uniprot_df.groupby('kegg_protein_id', sort=False)['uniprot_id'].agg(' '.join)
+    df = pd.DataFrame({'kegg_protein_id': pd.unique(pd.Series(list(kegg_protein_ids), dtype=str))})
+    df = df.merge(ncbigene_df.drop_duplicates('kegg_protein_id'), how='left', on='kegg_protein_id')
+    df = df.merge(uniprot_ids.reset_index(), how='left', on='kegg_protein_id')
+    df['entrez_id'] = df['entrez_id'].fillna(df['kegg_protein_id'].str.split(':', n=1).str[1])
+    return [
+        ProteinEntry(
+            kegg_id=kegg_protein_id,
+            entrez_id=entrez_id,
+            xrefs=() if pd.isna(uniprot_id) else tuple(('uniprot', xref) for xref in uniprot_id.split(' ')),
+        )
+        for kegg_protein_id, entrez_id, uniprot_id in df[['kegg_protein_id', 'entrez_id', 'uniprot_id']].values
+    ]
+
+
 def get_organisms_df(url: Optional[str] = None) -> pd.DataFrame:
     """Convert tab separated txt files to pandas Dataframe.
 
@@ -71,3 +253,73 @@ def get_organisms_df(url: Optional[str] = None) -> pd.DataFrame:
     )
     df['name'] = df['name'].map(lambda name: name.replace(')', '').split(' ('))
     return df
+
+
+def get_kegg_release(url: Optional[str] = None, force: bool = True) -> Optional[str]:
+    """Get the current KEGG release from the KEGG database statistics.
+
+    :param url: An optional url from a KEGG statistics file
+    :param force: Download the file again even if it's already in the data directory. Defaults to true, since the
+     point is to find out if there's a new release.
+    :return: The release, like ``Release 106.0+/05-16, May 23``, or None if it can't be found
+    """
+    path = url or ensure_path(MODULE_NAME, KEGG_STATISTICS_URL, path='kegg_info.txt', force=force)
+    with open(path) as file:
+        return parse_kegg_release(file)
+
+
+def parse_kegg_release(lines: Iterable[str]) -> Optional[str]:
+    """Parse the release out of the lines of the KEGG database statistics.
+
+    :param lines: The lines from ``/info/kegg``
+    """
+    for line in lines:
+        line = line.strip()
+        if line.startswith('kegg') and 'Release' in line:
+            return line[line.index('Release'):]
+    return None
+
+
+def get_pathway_hierarchy(url: Optional[str] = None, force: bool = False) -> List[Tuple[Tuple[str, ...], str, str]]:
+    """Get the KEGG BRITE hierarchy of pathway maps (``br08901``).
+
+    :param url: An optional url from a KEGG BRITE hierarchy file
+    :param force: Download the file again even if it's already in the data directory
+    :return: See :func:`parse_pathway_hierarchy`
+    """
+    path = url or ensure_path(MODULE_NAME, KEGG_PATHWAY_HIERARCHY_URL, path=PATHWAY_HIERARCHY_NAME, force=force)
+    with open(path) as file:
+        return parse_pathway_hierarchy(file)
+
+
+def parse_pathway_hierarchy(lines: Iterable[str]) -> List[Tuple[Tuple[str, ...], str, str]]:
+    """Parse the lines of a KEGG BRITE hierarchy of pathway maps.
+
+    Each line of the hierarchy starts with a letter for its level, from ``A`` for the top categories like
+    Metabolism to ``C`` for the reference maps, like ``C    00010  Glycolysis / Gluconeogenesis``.
+
+    :param lines: The lines from ``/get/br:br08901``
+    :return: A triple for each reference map of the names of its categories from the top down, its map number like
+     ``00010``, and its name. A map that is in several categories has a triple for each.
+    """
+    nodes = []
+    for line in lines:
+        # the header, comment, and separator lines start with +, #, and !
+        if not line[:1].isupper():
+            continue
+        text = _HTML_TAG.sub('', line[1:]).strip()
+        if text:
+            nodes.append((ord(line[0]) - ord('A'), text))
+
+    rv = []
+    categories = []
+    for i, (level, text) in enumerate(nodes):
+        is_leaf = i + 1 == len(nodes) or nodes[i + 1][0] <= level
+        if is_leaf and _MAP_NUMBER.match(text):
+            map_number, name = text.split(None, 1)
+            rv.append((tuple(categories[:level]), map_number, name.strip()))
+        else:
+            del categories[level:]
+            # some versions of the hierarchy number the categories too, like 09100 Metabolism
+            categories.append(_MAP_NUMBER.sub('', text))
+    return rv
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+"""The overlaps of all pairs of pathways, with their Jaccard indexes and overlap coefficients.
+
+The overlaps are the product of the transposed protein-pathway matrix of a :class:`MembershipIndex` with itself. Only
+the pairs that share at least one protein are kept, so pathways of different organisms never make a pair. They're
+counted from the pairs of pathways of each protein, a chunk of proteins at a time, then saved in a compressed
+:mod:`numpy` archive so they're only recalculated when the database changes.
+"""
+
+import logging
+import os
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from .enrichment import MembershipIndex, _concatenate_ranges
+
+__all__ = [
+    'PathwaySimilarity',
+    'Similarity',
+]
+
+logger = logging.getLogger(__name__)
+
+#: The similarity metrics by which pairs of pathways can be compared
+METRICS = ('overlap', 'jaccard', 'overlap_coefficient')
+
+#: The largest number of pairs of pathways of proteins counted at once
+PAIR_CHUNK_SIZE = 1 << 22
+
+_ARRAY_NAMES = ('pathway_ids', 'pathway_sizes', 'rows', 'columns', 'overlaps', 'n_memberships', 'checksum')
+
+
+class Similarity(NamedTuple):
+    """The similarity of two pathways."""
+
+    #: The number of proteins in both pathways
+    overlap: int
+    #: The size of the intersection over the size of the union
+    jaccard: float
+    #: The size of the intersection over the size of the smaller pathway
+    overlap_coefficient: float
+
+
+class PathwaySimilarity:
+    """The overlaps of the pairs of pathways that share proteins, as a sparse symmetric matrix."""
+
+    def __init__(
+        self,
+        pathway_ids: np.ndarray,
+        pathway_sizes: np.ndarray,
+        rows: np.ndarray,
+        columns: np.ndarray,
+        overlaps: np.ndarray,
+        n_memberships: int,
+        checksum: str = '',
+    ):
+        """Initialize the matrix.
+
+        :param pathway_ids: The KEGG identifier of each pathway
+        :param pathway_sizes: The number of proteins in each pathway
+        :param rows: The first pathway of each pair, always before the second
+        :param columns: The second pathway of each pair
+        :param overlaps: The number of proteins shared by the pathways of each pair
+        :param n_memberships: The number of protein-pathway memberships the overlaps were counted from
+        :param checksum: The checksum of the membership index the overlaps were counted from, for telling if they're
+         out of date. See :meth:`bio2bel_kegg.enrichment.MembershipIndex.get_checksum`.
+        """
+        self.pathway_ids = np.asarray(pathway_ids, dtype=str)
+        self.pathway_sizes = np.asarray(pathway_sizes, dtype=np.int64)
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.columns = np.asarray(columns, dtype=np.int64)
+        self.overlaps = np.asarray(overlaps, dtype=np.int64)
+        self.n_memberships = int(n_memberships)
+        self.checksum = str(checksum)
+
+        self._pathway_id_to_position = {pathway_id: i for i, pathway_id in enumerate(self.pathway_ids.tolist())}
+
+        # both halves of the symmetric matrix as CSR, with the neighbors of each pathway sorted
+        sources = np.concatenate([self.rows, self.columns])
+        targets = np.concatenate([self.columns, self.rows])
+        order = np.argsort(sources * len(self.pathway_ids) + targets)
+        self._indptr = np.concatenate([[0], np.cumsum(np.bincount(sources, minlength=len(self.pathway_ids)))])
+        self._indices = targets[order]
+        self._pairs = np.concatenate([np.arange(len(self.rows))] * 2)[order]
+
+    @classmethod
+    def from_membership_index(cls, index: MembershipIndex) -> 'PathwaySimilarity':
+        """Count the overlaps of all pairs of pathways in a membership index."""
+        n_pathways = len(index.pathway_ids)
+        degrees = np.diff(index.indptr)
+        pair_counts = np.cumsum(degrees * (degrees - 1) // 2)
+
+        keys, counts = [], []
+        start = 0
+        while start < index.n_proteins:
+            # the proteins of a chunk together have up to PAIR_CHUNK_SIZE pairs, or one protein has more
+            offset = pair_counts[start - 1] if start else 0
+            end = max(int(np.searchsorted(pair_counts, offset + PAIR_CHUNK_SIZE, side='right')), start + 1)
+            chunk_keys, chunk_counts = _count_pairs(index.indptr[start:end + 1], index.indices, n_pathways)
+            keys.append(chunk_keys)
+            counts.append(chunk_counts)
+            start = end
+
+        keys, counts = _sum_by_key(np.concatenate(keys or [[]]), np.concatenate(counts or [[]]))
+        logger.info('counted the overlaps of %d pairs of pathways', len(keys))
+        return cls(
+            pathway_ids=index.pathway_ids.astype(str),
+            pathway_sizes=index.pathway_sizes,
+            rows=keys // max(n_pathways, 1),
+            columns=keys % max(n_pathways, 1),
+            overlaps=counts,
+            n_memberships=len(index.indices),
+            checksum=index.get_checksum(),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'PathwaySimilarity':
+        """Load a matrix saved with :meth:`save`. Archives saved before checksums were kept have an empty one."""
+        with np.load(path) as archive:
+            return cls(**{name: archive[name] for name in _ARRAY_NAMES if name in archive.files})
+
+    def save(self, path: str) -> None:
+        """Save the matrix in a compressed archive, with the smallest integer types that hold its values."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        pair_dtype = np.min_scalar_type(max(len(self.pathway_ids), 1))
+        arrays = {
+            'pathway_ids': self.pathway_ids,
+            'pathway_sizes': self.pathway_sizes.astype(np.min_scalar_type(int(self.pathway_sizes.max(initial=0)))),
+            'rows': self.rows.astype(pair_dtype),
+            'columns': self.columns.astype(pair_dtype),
+            'overlaps': self.overlaps.astype(np.min_scalar_type(int(self.overlaps.max(initial=0)))),
+            'n_memberships': np.int64(self.n_memberships),
+            'checksum': np.str_(self.checksum),
+        }
+        temporary_path = f'{path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'wb') as file:
+            np.savez_compressed(file, **arrays)
+        os.replace(temporary_path, path)  # so other processes never load a partially written archive
+
+    def get_metric(self, metric: str = 'jaccard') -> np.ndarray:
+        """Get the value of a metric for each pair.
+
+        :param metric: One of ``overlap``, ``jaccard``, or ``overlap_coefficient``
+        """
+        return self._get_metric(metric, slice(None))
+
+    def _get_metric(self, metric: str, pairs) -> np.ndarray:
+        overlaps = self.overlaps[pairs]
+        if metric == 'overlap':
+            return overlaps
+        first_sizes, second_sizes = self.pathway_sizes[self.rows[pairs]], self.pathway_sizes[self.columns[pairs]]
+        if metric == 'jaccard':
+            return overlaps / (first_sizes + second_sizes - overlaps)
+        if metric == 'overlap_coefficient':
+            return overlaps / np.minimum(first_sizes, second_sizes)
+        raise ValueError(f'invalid metric: {metric}. Use one of {", ".join(METRICS)}')
+
+    def get_similarity(self, pathway_id: str, other_pathway_id: str) -> Similarity:
+        """Get the similarity of two pathways, which is zero if they don't share any proteins.
+
+        :param pathway_id: The KEGG identifier of a pathway, like ``hsa00010``
+        :param other_pathway_id: The KEGG identifier of another pathway
+        """
+        position, other_position = self._get_position(pathway_id), self._get_position(other_pathway_id)
+        start, end = self._indptr[position], self._indptr[position + 1]
+        i = start + int(np.searchsorted(self._indices[start:end], other_position))
+        if i == end or self._indices[i] != other_position:
+            return Similarity(0, 0.0, 0.0)
+        pair = self._pairs[i]
+        overlap = int(self.overlaps[pair])
+        first_size, second_size = int(self.pathway_sizes[position]), int(self.pathway_sizes[other_position])
+        return Similarity(
+            overlap=overlap,
+            jaccard=overlap / (first_size + second_size - overlap),
+            overlap_coefficient=overlap / min(first_size, second_size),
+        )
+
+    def get_most_similar(self, pathway_id: str, k: int = 10, metric: str = 'jaccard') -> pd.DataFrame:
+        """Get the pathways most similar to a pathway, leaving out the ones that don't share any proteins.
+
+        :param pathway_id: The KEGG identifier of a pathway, like ``hsa00010``
+        :param k: The largest number of pathways returned
+        :param metric: The metric by which the pathways are ordered. One of ``overlap``, ``jaccard``, or
+         ``overlap_coefficient``
+        :return: A table with the KEGG identifier of each pathway and its similarity by each metric, ordered from the
+         most similar
+        """
+        position = self._get_position(pathway_id)
+        start, end = self._indptr[position], self._indptr[position + 1]
+        # a stable sort keeps pathways with the same similarity in the order of the database
+        order = np.argsort(-self._get_metric(metric, self._pairs[start:end]), kind='stable')[:k]
+        table = self._get_table(self._pairs[start:end][order])
+        table.insert(0, 'pathway_id', self.pathway_ids[self._indices[start:end][order]])
+        return table
+
+    def get_pairs(self, threshold: float, metric: str = 'jaccard') -> pd.DataFrame:
+        """Get all pairs of pathways whose similarity is at least the threshold.
+
+        :param threshold: The lowest value of the metric. Pairs of pathways that don't share any proteins are always
+         left out.
+        :param metric: One of ``overlap``, ``jaccard``, or ``overlap_coefficient``
+        :return: A table with the KEGG identifiers of the pathways of each pair and their similarity by each metric,
+         ordered from the most similar
+        """
+        values = self.get_metric(metric)
+        pairs = np.flatnonzero(values >= threshold)
+        pairs = pairs[np.argsort(-values[pairs], kind='stable')]
+        table = self._get_table(pairs)
+        table.insert(0, 'pathway_id', self.pathway_ids[self.rows[pairs]])
+        table.insert(1, 'other_pathway_id', self.pathway_ids[self.columns[pairs]])
+        return table
+
+    def _get_table(self, pairs: np.ndarray) -> pd.DataFrame:
+        return pd.DataFrame({
+            metric: self._get_metric(metric, pairs)
+            for metric in METRICS
+        })
+
+    def _get_position(self, pathway_id: str) -> int:
+        position = self._pathway_id_to_position.get(pathway_id)
+        if position is None:
+            raise KeyError(f'pathway is not in the similarity matrix: {pathway_id}')
+        return position
+
+    def __len__(self) -> int:  # noqa: D105
+        return len(self.overlaps)
+
+
+def _count_pairs(indptr: np.ndarray, indices: np.ndarray, n_pathways: int):
+    """Count the pairs of pathways shared by the proteins whose memberships start at the given offsets."""
+    ends = np.repeat(indptr[1:], np.diff(indptr))
+    positions = np.arange(indptr[0], indptr[-1])
+    partners = _concatenate_ranges(positions + 1, ends)
+    firsts = indices[np.repeat(positions, ends - positions - 1)]
+    seconds = indices[partners]
+    return _sum_by_key(
+        np.minimum(firsts, seconds) * n_pathways + np.maximum(firsts, seconds),
+        np.ones(len(partners), dtype=np.int64),
+    )
+
+
+def _sum_by_key(keys: np.ndarray, counts: np.ndarray):
+    """Sum the counts of equal keys, returning the distinct keys in order with their sums."""
+    keys = keys.astype(np.int64)
+    if not len(keys):
+        return keys, counts.astype(np.int64)
+    order = np.argsort(keys)
+    keys, counts = keys[order], counts[order]
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    return keys[starts], np.add.reduceat(counts.astype(np.int64), starts)
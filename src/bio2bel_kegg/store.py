@@ -0,0 +1,656 @@
+# -*- coding: utf-8 -*-
+
+"""Storage for the KEGG flat files of entities downloaded with ``get`` requests.
+
+Two backends are available:
+
+1. :class:`DirectoryEntityStore` keeps one text file per entity in ``<directory>/<prefix>/<identifier>.txt``. This
+   is the original layout of :data:`bio2bel_kegg.constants.ENTITY_DIRECTORY`.
+2. :class:`PackedEntityStore` appends compressed entries to a small number of segment files and keeps an offset index
+   next to them, so the cache stays a handful of files no matter how many organisms are loaded. Segments are read
+   through :mod:`mmap`.
+
+The backend used by default is set with the ``BIO2BEL_KEGG_ENTITY_STORE`` environment variable, which can be either
+``packed`` (the default) or ``directory``. An existing directory cache can be converted with
+:func:`migrate_entity_store` or ``bio2bel_kegg cache migrate``.
+
+Both stores only trust entries that end with the ``///`` terminator of KEGG flat files. The packed store also keeps a
+CRC-32 checksum of each entry in its index. An entry that is truncated or corrupt is dropped when it's read, as if it
+had never been stored, so it's fetched again. The directory store writes each file under a temporary name then
+renames it, so an interrupted write never leaves a partial entry behind.
+
+Reads record the time the entity was last used, which lets :meth:`EntityStore.prune` evict the least recently used
+entities until the store fits in a given size. The directory store only records them when a size cap is configured,
+since each one costs a write of the metadata of the file, and otherwise evicts the entities written first. When the
+``BIO2BEL_KEGG_ENTITY_STORE_MAX_SIZE`` environment variable is set to a number of bytes, the default store is pruned
+to it at the end of each populate and update. The store can also be inspected and pruned with
+``bio2bel_kegg cache stats`` and ``bio2bel_kegg cache prune``.
+"""
+
+import atexit
+import logging
+import mmap
+import os
+import time
+import uuid
+import zlib
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from tqdm import tqdm
+
+from .constants import ENTITY_DIRECTORY, ENTITY_STORE_BACKEND, ENTITY_STORE_DIRECTORY, ENTITY_STORE_MAX_SIZE
+from .metrics import increment
+
+__all__ = [
+    'EntityStore',
+    'EntityStoreStats',
+    'DirectoryEntityStore',
+    'PackedEntityStore',
+    'is_complete_entry',
+    'get_entity_store',
+    'get_default_entity_store',
+    'migrate_entity_store',
+    'prune_default_entity_store',
+]
+
+logger = logging.getLogger(__name__)
+
+#: The size in bytes after which a packed store starts a new segment
+SEGMENT_MAX_SIZE = 256 * 1024 * 1024
+
+SEGMENT_EXTENSION = '.seg'
+INDEX_EXTENSION = '.idx'
+ACCESS_EXTENSION = '.acc'
+
+#: An upper bound on the size in bytes of the line of an entity in the index and in the access log of a packed store,
+#: besides its identifier
+ENTRY_LINES_MAX_SIZE = 96
+
+#: The number of reads a packed store records in memory before appending them to its access log
+ACCESS_LOG_BUFFER_SIZE = 4096
+
+#: The age in seconds after which the temporary file of a write to a directory store is left over from an interrupted
+#: write, and is deleted when the store is pruned
+TEMPORARY_FILE_MAX_AGE = 3600
+
+
+def is_complete_entry(text: str) -> bool:
+    """Check that the text of an entity ends with the ``///`` terminator of KEGG flat files."""
+    return text.endswith('///\n') or text.rstrip().endswith('///')
+
+
+class EntityStoreStats(NamedTuple):
+    """The size and the usage of an entity store."""
+
+    #: The number of entities
+    entities: int
+    #: The size in bytes of the entities, compressed for a packed store
+    size: int
+    #: The size in bytes of the files of the store, including the entities that were replaced or dropped
+    disk_size: int
+    #: The time of the least recent use of an entity, in seconds since the epoch
+    oldest_access: Optional[float]
+    #: The time of the most recent use of an entity, in seconds since the epoch
+    newest_access: Optional[float]
+
+
+class EntityStore(ABC):
+    """A store for the KEGG flat files of entities, keyed by their prefixed identifiers."""
+
+    #: Does the store record the use of its entities, so it can be verified and pruned? Stores that don't, like
+    #: read-only ones, have no usage, nothing to verify, and nothing to evict.
+    records_usage = False
+
+    @abstractmethod
+    def get(self, entity_id: str) -> Optional[str]:
+        """Get the text of an entity, or None if it's not in the store.
+
+        :param entity_id: A KEGG entity identifier (with prefix)
+        """
+
+    @abstractmethod
+    def put(self, entity_id: str, text: str) -> None:
+        """Add the text of an entity to the store.
+
+        :param entity_id: A KEGG entity identifier (with prefix)
+        :param text: The KEGG flat file of the entity
+        """
+
+    @abstractmethod
+    def __contains__(self, entity_id: str) -> bool:  # noqa: D105
+        pass
+
+    @abstractmethod
+    def __iter__(self) -> Iterator[str]:  # noqa: D105
+        pass
+
+    def __len__(self) -> int:  # noqa: D105
+        return sum(1 for _ in self)
+
+    def iter_usage(self) -> Iterable[Tuple[str, int, float]]:
+        """Iterate over the identifier, size in bytes, and time of last use of each entity."""
+        return iter(())
+
+    def get_disk_size(self) -> int:
+        """Get the size in bytes of the files of the store."""
+        return 0
+
+    def stats(self) -> EntityStoreStats:
+        """Get the size and the usage of the store."""
+        entities = size = 0
+        oldest_access = newest_access = None
+        for _, entity_size, access in self.iter_usage():
+            entities += 1
+            size += entity_size
+            oldest_access = access if oldest_access is None else min(oldest_access, access)
+            newest_access = access if newest_access is None else max(newest_access, access)
+        return EntityStoreStats(
+            entities=entities,
+            size=size,
+            disk_size=self.get_disk_size(),
+            oldest_access=oldest_access,
+            newest_access=newest_access,
+        )
+
+    def verify(self) -> List[str]:
+        """Read each entity and drop the ones that are truncated or corrupt, without recording their use.
+
+        :return: The identifiers of the entities that were dropped
+        """
+        return []
+
+    def prune(self, max_size: int) -> int:
+        """Evict the least recently used entities until the files of the store take up at most the given size.
+
+        Entities are evicted from under other processes that use the same store, so it's meant to run when nothing
+        else is loading entities.
+
+        :param max_size: The size in bytes
+        :return: The number of entities that were evicted
+        """
+        return 0
+
+    def close(self) -> None:
+        """Release the resources held by the store."""
+
+    def __enter__(self):  # noqa: D105
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):  # noqa: D105
+        self.close()
+
+
+class DirectoryEntityStore(EntityStore):
+    """A store that keeps each entity in its own text file."""
+
+    records_usage = True
+
+    def __init__(self, directory: Optional[str] = None, record_access: Optional[bool] = None):
+        """Initialize the store.
+
+        :param directory: The directory containing one subdirectory per prefix. Defaults to
+         :data:`bio2bel_kegg.constants.ENTITY_DIRECTORY`.
+        :param record_access: Should reads update the modification times of the files, which :meth:`prune` evicts
+         by? Defaults to recording them if :data:`bio2bel_kegg.constants.ENTITY_STORE_MAX_SIZE` is set.
+        """
+        self.directory = directory or ENTITY_DIRECTORY
+        self.record_access = bool(ENTITY_STORE_MAX_SIZE) if record_access is None else record_access
+
+    def get_path(self, entity_id: str) -> str:
+        """Get the path to the file for the given entity.
+
+        :param entity_id: A KEGG entity identifier (with prefix)
+        """
+        prefix, identifier = entity_id.split(':', 1)
+        return os.path.join(self.directory, prefix, f'{identifier}.txt')
+
+    def get(self, entity_id: str) -> Optional[str]:  # noqa: D102
+        path = self.get_path(entity_id)
+        text = self._read(entity_id, path)
+        if text is not None and self.record_access:
+            try:  # the modification time of a file is the time of the last use of its entity
+                os.utime(path)
+            except OSError:  # like in a read-only cache
+                pass
+        return text
+
+    def _read(self, entity_id: str, path: str) -> Optional[str]:
+        try:
+            with open(path) as file:
+                text = file.read()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning('could not read %s: %s', path, e)
+            text = ''
+        if is_complete_entry(text):
+            return text
+
+        logger.warning('dropping incomplete entity %s', entity_id)
+        increment('store.invalid')
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+    def put(self, entity_id: str, text: str) -> None:  # noqa: D102
+        path = self.get_path(entity_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f'{path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w') as file:
+            file.write(text)
+        os.replace(temporary_path, path)
+
+    def __contains__(self, entity_id: str) -> bool:  # noqa: D105
+        return os.path.exists(self.get_path(entity_id))
+
+    def __iter__(self) -> Iterator[str]:  # noqa: D105
+        if not os.path.isdir(self.directory):
+            return
+        for prefix_entry in os.scandir(self.directory):
+            if not prefix_entry.is_dir():
+                continue
+            for entry in os.scandir(prefix_entry.path):
+                if entry.name.endswith('.txt'):
+                    yield f'{prefix_entry.name}:{entry.name[:-len(".txt")]}'
+
+    def _iter_files(self) -> Iterable[Tuple[str, os.DirEntry]]:
+        if not os.path.isdir(self.directory):
+            return
+        for prefix_entry in os.scandir(self.directory):
+            if prefix_entry.is_dir():
+                for entry in os.scandir(prefix_entry.path):
+                    yield prefix_entry.name, entry
+
+    def iter_usage(self) -> Iterable[Tuple[str, int, float]]:  # noqa: D102
+        for prefix, entry in self._iter_files():
+            if entry.name.endswith('.txt'):
+                stat = entry.stat()
+                yield f'{prefix}:{entry.name[:-len(".txt")]}', stat.st_size, stat.st_mtime
+
+    def get_disk_size(self) -> int:  # noqa: D102
+        return sum(entry.stat().st_size for _, entry in self._iter_files())
+
+    def verify(self) -> List[str]:  # noqa: D102
+        return [
+            entity_id
+            for entity_id in tqdm(list(self), desc='Verifying entities', unit_scale=True)
+            if self._read(entity_id, self.get_path(entity_id)) is None
+        ]
+
+    def prune(self, max_size: int) -> int:  # noqa: D102
+        now = time.time()
+        usage = []
+        for prefix, entry in self._iter_files():
+            stat = entry.stat()
+            if entry.name.endswith('.tmp'):
+                if now - stat.st_mtime > TEMPORARY_FILE_MAX_AGE:
+                    os.remove(entry.path)
+            elif entry.name.endswith('.txt'):
+                usage.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(entity_size for _, entity_size, _ in usage)
+        count = 0
+        for _, entity_size, path in sorted(usage):
+            if size <= max_size:
+                break
+            os.remove(path)
+            size -= entity_size
+            count += 1
+        increment('store.evicted', count)
+        return count
+
+
+class PackedEntityStore(EntityStore):
+    """A store that appends compressed entities to segment files and indexes their offsets.
+
+    Each process that writes to the store gets its own segment and index files, so several processes can fill the
+    same store at the same time without locking. An index file has one tab-separated line per entity with its
+    identifier, segment name, offset, compressed length, and the CRC-32 checksum of the compressed data. Later lines
+    take precedence over earlier ones. The times the entities are read are appended to an access log next to the
+    index, in batches and when the store is closed.
+    """
+
+    records_usage = True
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        segment_max_size: Optional[int] = None,
+        verify_checksums: bool = True,
+    ):
+        """Initialize the store.
+
+        :param directory: The directory for the segment and index files. Defaults to
+         :data:`bio2bel_kegg.constants.ENTITY_STORE_DIRECTORY`.
+        :param segment_max_size: The size in bytes after which a new segment is started
+        :param verify_checksums: Should the checksum of each entity be checked when it's read?
+        """
+        self.directory = directory or ENTITY_STORE_DIRECTORY
+        os.makedirs(self.directory, exist_ok=True)
+        self.segment_max_size = segment_max_size or SEGMENT_MAX_SIZE
+        self.verify_checksums = verify_checksums
+
+        self._index: Dict[str, Tuple[str, int, int, Optional[int]]] = {}
+        self._maps: Dict[str, mmap.mmap] = {}
+        self._accesses: Dict[str, float] = {}
+        self._new_accesses: Dict[str, float] = {}
+
+        # writing is set up lazily so opening a store to read it doesn't leave empty files behind
+        self._writer_token = None
+        self._segment_number = 0
+        self._segment_name = None
+        self._segment_file = None
+        self._index_file = None
+
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Reload the index files and access logs, picking up entities written by other processes."""
+        index_names = sorted(
+            (name for name in os.listdir(self.directory) if name.endswith(INDEX_EXTENSION)),
+            key=lambda name: os.path.getmtime(os.path.join(self.directory, name)),
+        )
+        for name in index_names:
+            with open(os.path.join(self.directory, name)) as file:
+                for line in file:
+                    try:
+                        # indexes written before checksums were added have four columns
+                        entity_id, segment_name, offset, length, *checksum = line.rstrip('\n').split('\t')
+                        self._index[entity_id] = (
+                            segment_name, int(offset), int(length), int(checksum[0]) if checksum else None,
+                        )
+                    except ValueError:  # a line left incomplete by an interrupted write
+                        logger.debug('skipping malformed line in %s: %s', name, line)
+
+        for name in os.listdir(self.directory):
+            if not name.endswith(ACCESS_EXTENSION):
+                continue
+            with open(os.path.join(self.directory, name)) as file:
+                for line in file:
+                    try:
+                        entity_id, access = line.rstrip('\n').split('\t')
+                        access = float(access)
+                    except ValueError:
+                        continue
+                    if access > self._accesses.get(entity_id, 0.0):
+                        self._accesses[entity_id] = access
+
+    def get(self, entity_id: str) -> Optional[str]:  # noqa: D102
+        text = self._read(entity_id)
+        if text is not None:
+            self._record_access(entity_id, time.time())
+        return text
+
+    def _read(self, entity_id: str) -> Optional[str]:
+        data = self._read_data(entity_id)
+        if data is None:
+            return None
+        try:
+            text = zlib.decompress(data).decode('utf-8')
+        except (zlib.error, ValueError):
+            text = ''
+        if is_complete_entry(text):
+            return text
+        self._drop(entity_id)
+        return None
+
+    def _read_data(self, entity_id: str) -> Optional[bytes]:
+        location = self._index.get(entity_id)
+        if location is None:
+            return None
+        data = self._read_location(*location)
+        if data is None:
+            self._drop(entity_id)
+        return data
+
+    def _read_location(self, segment_name: str, offset: int, length: int, checksum: Optional[int]) -> Optional[bytes]:
+        try:
+            data = self._get_map(segment_name, offset + length)[offset:offset + length]
+        except (OSError, ValueError):  # the segment is missing or empty
+            return None
+        if len(data) != length or (self.verify_checksums and checksum is not None and zlib.crc32(data) != checksum):
+            return None
+        return data
+
+    def _drop(self, entity_id: str) -> None:
+        """Forget a corrupt entity, so it's fetched and written again."""
+        logger.warning('dropping corrupt entity %s', entity_id)
+        increment('store.invalid')
+        del self._index[entity_id]
+        self._accesses.pop(entity_id, None)
+        self._new_accesses.pop(entity_id, None)
+
+    def _get_map(self, segment_name: str, end: int) -> mmap.mmap:
+        segment_map = self._maps.get(segment_name)
+        if segment_map is None or len(segment_map) < end:  # the segment grew since it was mapped
+            if segment_map is not None:
+                segment_map.close()
+            if segment_name == self._segment_name:
+                self._segment_file.flush()
+            with open(os.path.join(self.directory, segment_name), 'rb') as file:
+                segment_map = self._maps[segment_name] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return segment_map
+
+    def put(self, entity_id: str, text: str) -> None:  # noqa: D102
+        self._write(entity_id, zlib.compress(text.encode('utf-8')))
+        self._record_access(entity_id, time.time())
+
+    def _write(self, entity_id: str, data: bytes) -> None:
+        if self._segment_file is None or self._segment_file.tell() + len(data) > self.segment_max_size:
+            self._open_segment()
+
+        offset = self._segment_file.tell()
+        checksum = zlib.crc32(data)
+        self._segment_file.write(data)
+        self._segment_file.flush()
+        # the entry is only indexed once its data is written
+        self._index_file.write(f'{entity_id}\t{self._segment_name}\t{offset}\t{len(data)}\t{checksum}\n')
+        self._index_file.flush()
+        self._index[entity_id] = self._segment_name, offset, len(data), checksum
+
+    def _get_writer_token(self) -> str:
+        if self._writer_token is None:
+            self._writer_token = f'{os.getpid():x}-{uuid.uuid4().hex[:8]}'
+        return self._writer_token
+
+    def _open_segment(self) -> None:
+        if self._index_file is None:
+            self._index_file = open(os.path.join(self.directory, f'{self._get_writer_token()}{INDEX_EXTENSION}'), 'a')
+        else:
+            self._segment_file.close()
+            self._segment_number += 1
+
+        self._segment_name = f'{self._writer_token}-{self._segment_number:05d}{SEGMENT_EXTENSION}'
+        self._segment_file = open(os.path.join(self.directory, self._segment_name), 'ab')
+
+    def _record_access(self, entity_id: str, access: float) -> None:
+        self._accesses[entity_id] = self._new_accesses[entity_id] = access
+        if len(self._new_accesses) >= ACCESS_LOG_BUFFER_SIZE:
+            self._flush_accesses()
+
+    def _flush_accesses(self) -> None:
+        if not self._new_accesses:
+            return
+        path = os.path.join(self.directory, f'{self._get_writer_token()}{ACCESS_EXTENSION}')
+        try:
+            with open(path, 'a') as file:
+                for entity_id, access in self._new_accesses.items():
+                    file.write(f'{entity_id}\t{access:.0f}\n')
+        except OSError as e:  # like in a read-only cache, where the entities are used without being evicted
+            logger.debug('could not record the use of entities in %s: %s', path, e)
+        self._new_accesses.clear()
+
+    def _get_access(self, entity_id: str, segment_times: Dict[str, float]) -> float:
+        access = self._accesses.get(entity_id)
+        if access is not None:
+            return access
+        # entities that were never read since the access logs were added were last used when they were written
+        segment_name = self._index[entity_id][0]
+        if segment_name not in segment_times:
+            try:
+                segment_times[segment_name] = os.path.getmtime(os.path.join(self.directory, segment_name))
+            except OSError:
+                segment_times[segment_name] = 0.0
+        return segment_times[segment_name]
+
+    def iter_usage(self) -> Iterable[Tuple[str, int, float]]:  # noqa: D102
+        segment_times = {}
+        for entity_id, (_, _, length, _) in list(self._index.items()):
+            yield entity_id, length, self._get_access(entity_id, segment_times)
+
+    def get_disk_size(self) -> int:  # noqa: D102
+        self._flush_accesses()
+        return sum(
+            entry.stat().st_size
+            for entry in os.scandir(self.directory)
+            if entry.name.endswith((SEGMENT_EXTENSION, INDEX_EXTENSION, ACCESS_EXTENSION))
+        )
+
+    def verify(self) -> List[str]:  # noqa: D102
+        return [
+            entity_id
+            for entity_id in tqdm(list(self._index), desc='Verifying entities', unit_scale=True)
+            if self._read(entity_id) is None
+        ]
+
+    def prune(self, max_size: int) -> int:
+        """Evict the least recently used entities until the files of the store take up at most the given size.
+
+        The entities that are kept are copied to a new segment, without decompressing them, and all the other
+        segment, index, and access log files are deleted, which also reclaims the space of the entities that were
+        replaced or dropped. Other processes that use the same store while it's pruned lose the entities they wrote
+        and can't read the ones they indexed before, so it's meant to run when nothing else is loading entities.
+
+        :param max_size: The size in bytes
+        :return: The number of entities that were evicted
+        """
+        self._flush_accesses()
+        self.refresh()
+        if self.get_disk_size() <= max_size:
+            return 0
+
+        # the cost of an entity is its data plus its lines in the index and the access log
+        size, keep = 0, []
+        for entity_id, length, access in sorted(self.iter_usage(), key=lambda usage: usage[2], reverse=True):
+            size += length + 2 * len(entity_id) + ENTRY_LINES_MAX_SIZE
+            if size > max_size:
+                break
+            keep.append((entity_id, access))
+
+        old_index = self._index
+        old_names = [
+            name
+            for name in os.listdir(self.directory)
+            if name.endswith((SEGMENT_EXTENSION, INDEX_EXTENSION, ACCESS_EXTENSION))
+        ]
+        self.close()
+        self._index, self._accesses = {}, {}
+        # copy in the order of the old segments so they're read sequentially
+        for entity_id, access in sorted(keep, key=lambda pair: old_index[pair[0]][:2]):
+            data = self._read_location(*old_index[entity_id])
+            if data is not None:
+                self._write(entity_id, data)
+                self._record_access(entity_id, access)
+        self.close()
+
+        for name in old_names:
+            os.remove(os.path.join(self.directory, name))
+
+        count = len(old_index) - len(self._index)
+        increment('store.evicted', count)
+        return count
+
+    def __contains__(self, entity_id: str) -> bool:  # noqa: D105
+        return entity_id in self._index
+
+    def __iter__(self) -> Iterator[str]:  # noqa: D105
+        return iter(list(self._index))
+
+    def __len__(self) -> int:  # noqa: D105
+        return len(self._index)
+
+    def close(self) -> None:  # noqa: D102
+        self._flush_accesses()
+        for segment_map in self._maps.values():
+            segment_map.close()
+        self._maps.clear()
+        for file in (self._segment_file, self._index_file):
+            if file is not None:
+                file.close()
+        self._writer_token = self._segment_name = self._segment_file = self._index_file = None
+        self._segment_number = 0
+
+
+def get_entity_store(backend: Optional[str] = None, directory: Optional[str] = None) -> EntityStore:
+    """Get an entity store.
+
+    :param backend: Either ``packed`` or ``directory``. Defaults to
+     :data:`bio2bel_kegg.constants.ENTITY_STORE_BACKEND`.
+    :param directory: The directory of the store. Defaults to the one for the backend in :mod:`bio2bel_kegg.constants`.
+    """
+    if backend is None:
+        backend = ENTITY_STORE_BACKEND
+    if backend == 'packed':
+        return PackedEntityStore(directory=directory)
+    if backend == 'directory':
+        return DirectoryEntityStore(directory=directory)
+    raise ValueError(f'unknown entity store backend: {backend}')
+
+
+@lru_cache(maxsize=None)
+def get_default_entity_store() -> EntityStore:
+    """Get the entity store shared by the functions in :mod:`bio2bel_kegg.client`."""
+    store = get_entity_store()
+    # so the last reads are recorded in the access log of a packed store
+    atexit.register(store.close)
+    return store
+
+
+def prune_default_entity_store(max_size: Optional[int] = None) -> int:
+    """Prune the default entity store, if a maximum size is given or configured.
+
+    :param max_size: The size in bytes. Defaults to :data:`bio2bel_kegg.constants.ENTITY_STORE_MAX_SIZE`, where 0
+     means the store isn't pruned.
+    :return: The number of entities that were evicted
+    """
+    if max_size is None:
+        max_size = ENTITY_STORE_MAX_SIZE
+    if not max_size:
+        return 0
+    count = get_default_entity_store().prune(max_size)
+    if count:
+        logger.info('evicted %d entities from the entity store to keep it under %d bytes', count, max_size)
+    return count
+
+
+def migrate_entity_store(source: EntityStore, target: EntityStore, delete: bool = False) -> int:
+    """Copy all entities from one store to another.
+
+    :param source: The store to copy from, like a :class:`DirectoryEntityStore` of an existing cache
+    :param target: The store to copy to, like a :class:`PackedEntityStore`
+    :param delete: Should the files of a :class:`DirectoryEntityStore` source be deleted once they are copied?
+    :return: The number of entities copied. Truncated or corrupt entities are dropped from the source and skipped,
+     so they're fetched again when they're next needed.
+    """
+    count = skipped = 0
+    for entity_id in tqdm(source, desc='Migrating entities', unit_scale=True):
+        if entity_id not in target:
+            text = source.get(entity_id)
+            if text is None:
+                logger.warning('skipping invalid entity %s', entity_id)
+                skipped += 1
+                continue
+            target.put(entity_id, text)
+            count += 1
+        if delete and isinstance(source, DirectoryEntityStore):
+            try:
+                os.remove(source.get_path(entity_id))
+            except FileNotFoundError:  # invalid entities are removed as they're read
+                pass
+    if skipped:
+        logger.warning('skipped %d invalid entities', skipped)
+    return count
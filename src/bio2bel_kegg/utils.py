@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+"""Utilities for Bio2BEL KEGG."""
+
+import itertools as itt
+import logging
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, TypeVar
+
+from sqlalchemy import MetaData, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from .metrics import stage
+
+__all__ = [
+    'iter_chunks',
+    'bulk_load_transaction',
+    'add_missing_columns',
+    'create_missing_indexes',
+]
+
+logger = logging.getLogger(__name__)
+
+X = TypeVar('X')
+
+#: Settings for SQLite connections during bulk loads: use a 64 MiB page cache so the indexes being built stay in
+#: memory, and keep temporary tables in memory too
+SQLITE_BULK_LOAD_PRAGMAS = {
+    'cache_size': '-65536',
+    'temp_store': 'MEMORY',
+}
+
+
+def iter_chunks(iterable: Iterable[X], size: int) -> Iterator[List[X]]:
+    """Iterate over lists of consecutive elements, each with up to the given number of elements.
+
+    :param iterable: Any iterable, which is consumed lazily
+    :param size: The largest number of elements in a chunk
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itt.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+@contextmanager
+def bulk_load_transaction(session: Session) -> Iterator[Session]:
+    """Run a bulk load in a single transaction that is committed at the end, or rolled back on errors.
+
+    On SQLite, the connection is tuned with :data:`SQLITE_BULK_LOAD_PRAGMAS` while the load runs, then the previous
+    settings are restored.
+
+    :param session: The session used for the load
+    """
+    pragmas = {}
+    if session.get_bind().dialect.name == 'sqlite':
+        for name, value in SQLITE_BULK_LOAD_PRAGMAS.items():
+            pragmas[name] = session.execute(f'PRAGMA {name}').scalar()
+            session.execute(f'PRAGMA {name} = {value}')
+
+    try:
+        yield session
+        with stage('db.commit'):
+            session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        if pragmas:
+            for name, value in pragmas.items():
+                session.execute(f'PRAGMA {name} = {value}')
+            session.commit()
+
+
+def add_missing_columns(engine: Engine, metadata: MetaData) -> List[str]:
+    """Add the columns of the tables in the metadata that aren't in the database yet.
+
+    Like indexes, columns added to the models aren't added to tables that already exist by
+    :meth:`MetaData.create_all`. Their unique constraints come from their indexes, which
+    :func:`create_missing_indexes` creates afterwards.
+
+    :param engine: The engine of the database
+    :param metadata: The metadata with the tables and their columns
+    :return: The names of the columns that were added, like ``kegg_species.kegg_code``
+    """
+    inspector = inspect(engine)
+    table_names = set(inspector.get_table_names())
+    preparer = engine.dialect.identifier_preparer
+    added = []
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if table.name not in table_names:
+                continue
+            column_names = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in column_names:
+                    continue
+                if not column.nullable:
+                    logger.warning('can not add column %s.%s without a default', table.name, column.name)
+                    continue
+                connection.execute(
+                    f'ALTER TABLE {preparer.quote(table.name)} ADD COLUMN {preparer.quote(column.name)}'
+                    f' {column.type.compile(dialect=engine.dialect)}',
+                )
+                added.append(f'{table.name}.{column.name}')
+    return added
+
+
+def create_missing_indexes(engine: Engine, metadata: MetaData) -> List[str]:
+    """Create the indexes of the tables in the metadata that aren't in the database yet.
+
+    Tables created before an index was added to the models don't get it from :meth:`MetaData.create_all`, which skips
+    tables that already exist.
+
+    :param engine: The engine of the database
+    :param metadata: The metadata with the tables and their indexes
+    :return: The names of the indexes that were created. Indexes on columns that the tables don't have yet are
+     skipped.
+    """
+    inspector = inspect(engine)
+    table_names = set(inspector.get_table_names())
+    created = []
+    for table in metadata.sorted_tables:
+        if table.name not in table_names:
+            continue
+        index_names = {index['name'] for index in inspector.get_indexes(table.name)}
+        column_names = {column['name'] for column in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            if index.name in index_names:
+                continue
+            missing_columns = sorted({column.name for column in index.columns}.difference(column_names))
+            if missing_columns:
+                logger.warning('skipping index %s on missing columns: %s', index.name, ', '.join(missing_columns))
+                continue
+            index.create(bind=engine)
+            created.append(index.name)
+    return created
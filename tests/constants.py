@@ -21,6 +21,11 @@ test_proteins_path = os.path.join(RESOURCES_DIRECTORY, 'pathway_gene.txt')
 
 test_protein_path = os.path.join(RESOURCES_DIRECTORY, 'test_protein.txt')
 test_pathway_path = os.path.join(RESOURCES_DIRECTORY, 'test_pathway.txt')
+test_release_path = os.path.join(RESOURCES_DIRECTORY, 'kegg_info.txt')
+test_genome_path = os.path.join(RESOURCES_DIRECTORY, 'gn:T01001.txt')
+test_ncbigene_conv_path = os.path.join(RESOURCES_DIRECTORY, 'hsa_ncbi-geneid.txt')
+test_uniprot_conv_path = os.path.join(RESOURCES_DIRECTORY, 'hsa_uniprot.txt')
+test_hierarchy_path = os.path.join(RESOURCES_DIRECTORY, 'br08901.keg')
 
 
 class DatabaseMixin(TemporaryConnectionMixin):
@@ -38,6 +43,8 @@ class DatabaseMixin(TemporaryConnectionMixin):
         cls.manager.populate(
             pathways_url=test_pathways_path,
             protein_pathway_url=test_proteins_path,
+            release_url=test_release_path,
+            hierarchy_url=test_hierarchy_path,
         )
 
     @classmethod
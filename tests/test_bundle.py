@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for offline bundles."""
+
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from bio2bel.testing import TemporaryConnectionMixin
+from bio2bel_kegg import manager as manager_module
+from bio2bel_kegg.bundle import Bundle, build_bundle
+from bio2bel_kegg.fetcher import OfflineFetcher
+from bio2bel_kegg.manager import Manager
+from bio2bel_kegg.mappings import HGNCMapping
+from bio2bel_kegg.metrics import collect_metrics
+from bio2bel_kegg.organisms import OrganismEntries
+from bio2bel_kegg.client import PathwayEntry, ProteinEntry
+from bio2bel_kegg.models import Pathway, PathwayCategory, Protein, Species, pathway_hierarchy, protein_pathway
+from bio2bel_kegg.store import DirectoryEntityStore
+from tests.constants import (
+    test_genome_path, test_hierarchy_path, test_ncbigene_conv_path, test_pathway_path, test_pathways_path,
+    test_protein_path, test_proteins_path, test_release_path, test_uniprot_conv_path,
+)
+
+ORGANISMS_TSV = 'T01001\thsa\tHomo sapiens (human)\tEukaryotes;Animals;Vertebrates;Mammals\n'
+
+
+class TestBundle(TemporaryConnectionMixin, unittest.TestCase):
+    """Test building bundles and populating from them."""
+
+    def setUp(self):
+        """Fill an entity store with the test entities and build a bundle of it."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = DirectoryEntityStore(os.path.join(self.directory.name, 'entities'))
+        for entity_id, path in (
+            ('hsa:112268384', test_protein_path),
+            ('path:hsa00010', test_pathway_path),
+            ('gn:T01001', test_genome_path),
+        ):
+            with open(path) as file:
+                self.store.put(entity_id, file.read())
+
+        organisms_path = os.path.join(self.directory.name, 'organisms.tsv')
+        with open(organisms_path, 'w') as file:
+            file.write(ORGANISMS_TSV)
+        self.list_paths = {
+            'br08901.keg': test_hierarchy_path,
+            'hsa_ncbi-geneid.tsv': test_ncbigene_conv_path,
+            'hsa_uniprot.tsv': test_uniprot_conv_path,
+            'kegg_info.txt': test_release_path,
+            'organisms.tsv': organisms_path,
+            'pathways.tsv': test_pathways_path,
+            'protein_pathway.tsv': test_proteins_path,
+        }
+        self.path = os.path.join(self.directory.name, 'kegg.zip')
+        self.manifest = build_bundle(self.path, list_paths=self.list_paths, store=self.store)
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.directory.cleanup()
+
+    def test_build(self):
+        """Test the manifest and the store of a bundle."""
+        self.assertEqual(sorted(self.list_paths), sorted(self.manifest['lists']))
+        self.assertEqual(3, self.manifest['entities']['count'])
+        self.assertIn('path:hsa00020', self.manifest['missing_entities'])
+        self.assertNotIn('path:hsa00010', self.manifest['missing_entities'])
+
+        with Bundle(self.path) as bundle:
+            bundle.verify()
+            self.assertIsNotNone(bundle.release)
+            self.assertEqual(self.manifest['kegg_release'], bundle.release)
+            self.assertEqual(set(self.store), set(bundle.store))
+            self.assertEqual(3, len(bundle.store))
+            self.assertIn('path:hsa00010', bundle.store)
+            self.assertNotIn('path:hsa00020', bundle.store)
+            self.assertEqual(self.store.get('hsa:112268384'), bundle.store.get('hsa:112268384'))
+            self.assertIsNone(bundle.store.get('path:hsa00020'))
+            # a bundle is read-only, so it has no usage to report and nothing to verify or evict
+            self.assertFalse(bundle.store.records_usage)
+            self.assertEqual(0, bundle.store.stats().entities)
+            self.assertEqual([], bundle.store.verify())
+            self.assertEqual(0, bundle.store.prune(0))
+            self.assertEqual(3, len(bundle.store))
+            with self.assertRaises(TypeError):
+                bundle.store.put('path:hsa00020', '')
+            with bundle.open_list('pathways.tsv') as file, open(test_pathways_path, 'rb') as expected:
+                self.assertEqual(expected.read(), file.read())
+            with self.assertRaises(ValueError):
+                bundle.open_list('mmu_pathways.tsv')
+
+    def test_reproducible(self):
+        """Test that bundles of the same files are identical."""
+        path = os.path.join(self.directory.name, 'kegg2.zip')
+        build_bundle(path, list_paths=self.list_paths, store=self.store)
+        with open(self.path, 'rb') as file, open(path, 'rb') as other_file:
+            self.assertEqual(file.read(), other_file.read())
+
+    def test_corrupt(self):
+        """Test that entities that don't match the manifest are found."""
+        path = os.path.join(self.directory.name, 'corrupt.zip')
+        with zipfile.ZipFile(self.path) as source, zipfile.ZipFile(path, 'w') as target:
+            for name in source.namelist():
+                data = source.read(name)
+                if name == 'entities/path/hsa00010.txt':
+                    data = data.replace(b'Glycolysis', b'Glycolysys')
+                target.writestr(name, data)
+
+        with Bundle(path) as bundle, self.assertRaises(ValueError):
+            bundle.verify()
+
+    def test_not_a_bundle(self):
+        """Test opening files that aren't bundles."""
+        with self.assertRaises(ValueError):
+            Bundle(test_pathways_path)
+
+        path = os.path.join(self.directory.name, 'empty.zip')
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr('lists/pathways.tsv', '')
+        with self.assertRaises(ValueError):
+            Bundle(path)
+
+    def test_offline_fetcher(self):
+        """Test that the offline fetcher fails each URL without a request."""
+        results = list(OfflineFetcher().iter_texts(['http://rest.kegg.jp/get/hsa:1']))
+        self.assertEqual(1, len(results))
+        self.assertIsNone(results[0].text)
+
+    def test_populate(self):
+        """Test populating from a bundle without the network."""
+        manager = Manager(connection=self.connection)
+        manager.create_all()
+        hgnc_mapping = HGNCMapping.from_dicts({}, {})
+        try:
+            with mock.patch.object(manager_module, 'get_hgnc_mapping', return_value=hgnc_mapping), \
+                    collect_metrics() as metrics:
+                manager.populate(bundle=self.path)
+
+            self.assertNotIn('http.requests', metrics.counters)
+            self.assertEqual(self.manifest['kegg_release'], manager.get_release())
+            self.assertEqual(['hsa00010'], [identifier for identifier, in manager.session.query(Pathway.identifier)])
+        finally:
+            manager.drop_all()
+            manager.session.close()
+
+    def test_populate_hierarchy(self):
+        """Test loading the hierarchy of pathway maps from a bundle and linking pathways to it as they're loaded."""
+        manager = Manager(connection=self.connection)
+        manager.create_all()
+        hgnc_mapping = HGNCMapping.from_dicts({}, {})
+        try:
+            with mock.patch.object(manager_module, 'get_hgnc_mapping', return_value=hgnc_mapping):
+                manager.populate(bundle=self.path)
+            # 2 top categories, 5 lower categories, and 7 reference maps
+            self.assertEqual(14, manager.count_pathway_categories())
+            self.assertEqual(14, manager.summarize()['pathway_categories'])
+            map_category = manager.session.query(PathwayCategory).filter(PathwayCategory.map_number == '01100').one()
+            self.assertEqual(['Metabolism', 'Global and overview maps'], [
+                map_category.parent.parent.name,
+                map_category.parent.name,
+            ])
+            self.assertEqual(1, manager.get_pathway_category('Metabolism').level)
+
+            # hsa00010 is under two categories, so it has two reference maps, two categories, and two top categories
+            pathway = manager.get_pathway_by_id('hsa00010')
+            self.assertEqual(6, manager.session.query(pathway_hierarchy).count())
+            self.assertEqual(
+                ['Metabolism', 'Organismal Systems'],
+                sorted(category.name for category in pathway.categories if category.level == 1),
+            )
+            self.assertEqual([pathway], manager.get_pathways_under_category('Metabolism'))
+            self.assertEqual([pathway], manager.get_pathways_under_category('Environmental adaptation', 'hsa'))
+            self.assertEqual([], manager.get_pathways_under_category('Energy metabolism'))
+            self.assertEqual(
+                sorted(protein.kegg_id for protein in pathway.proteins),
+                [protein.kegg_id for protein in manager.get_proteins_under_category('Carbohydrate metabolism')],
+            )
+
+            manager._load_pathways(
+                [
+                    PathwayEntry('path:hsa00020', 'Citrate cycle (TCA cycle)', related_ids=('hsa00010', 'hsa99999')),
+                    PathwayEntry('path:hsa04740', 'Olfactory transduction'),
+                ],
+                manager.session.query(Species).one(),
+            )
+            self.assertEqual(
+                ['hsa00010', 'hsa00020'],
+                [pathway.identifier for pathway in manager.get_pathways_under_category('Carbohydrate metabolism')],
+            )
+            self.assertEqual(
+                ['hsa04740'],
+                [pathway.identifier for pathway in manager.get_pathways_under_category('Sensory system')],
+            )
+            self.assertEqual([pathway], manager.get_pathway_by_id('hsa00020').related_pathways)
+
+            # the same hierarchy isn't loaded again
+            self.assertFalse(manager.populate_hierarchy(url=test_hierarchy_path))
+        finally:
+            manager.drop_all()
+            manager.session.close()
+
+    def test_update_other_organisms(self):
+        """Test that updating from the lists of human leaves the other organisms alone."""
+        manager = Manager(connection=self.connection)
+        manager.create_all()
+        hgnc_mapping = HGNCMapping.from_dicts({}, {})
+        try:
+            with mock.patch.object(manager_module, 'get_hgnc_mapping', return_value=hgnc_mapping):
+                manager.populate(bundle=self.path)
+                manager._load_organism(OrganismEntries(
+                    kegg_code='mmu',
+                    kegg_genome_id='T01002',
+                    taxonomy_id='10090',
+                    pathways=[PathwayEntry('path:mmu00010', 'Glycolysis / Gluconeogenesis - Mus musculus (mouse)')],
+                    proteins=[ProteinEntry('mmu:103988', '103988'), ProteinEntry('mmu:106557', '106557')],
+                    protein_pathway_pairs=[('mmu:103988', 'path:mmu00010'), ('mmu:106557', 'path:mmu00010')],
+                ), name='Mus musculus')
+                human_counts = manager.count_pathways() - 1, manager.count_proteins() - 2
+
+                summary = manager.update(
+                    pathways_url=test_pathways_path,
+                    protein_pathway_url=test_proteins_path,
+                    release_url=test_release_path,
+                    fetcher=OfflineFetcher(),
+                    force=True,
+                    hierarchy_url=test_hierarchy_path,
+                )
+
+            self.assertEqual(0, summary['pathways_deleted'])
+            self.assertEqual(0, summary['proteins_deleted'])
+            self.assertEqual(0, summary['memberships_deleted'])
+            mmu = manager.session.query(Species).filter(Species.kegg_code == 'mmu').one()
+            self.assertEqual(['mmu00010'], [pathway.identifier for pathway in mmu.pathways])
+            self.assertEqual(
+                ['mmu:103988', 'mmu:106557'],
+                sorted(protein.kegg_id for protein in mmu.pathways[0].proteins),
+            )
+            self.assertEqual(human_counts, (manager.count_pathways() - 1, manager.count_proteins() - 2))
+        finally:
+            manager.drop_all()
+            manager.session.close()
+
+    def test_populate_pathways_only(self):
+        """Test populating the proteins from the GENE sections of the pathways."""
+        manager = Manager(connection=self.connection)
+        manager.create_all()
+        hgnc_mapping = HGNCMapping.from_dicts({'3101': '4922'}, {'4922': 'HK3'})
+        try:
+            with mock.patch.object(manager_module, 'get_hgnc_mapping', return_value=hgnc_mapping):
+                manager.populate(bundle=self.path, protein_source='pathways')
+
+            self.assertEqual(68, manager.count_proteins())
+            self.assertEqual(68, manager.session.query(protein_pathway).count())
+            protein = manager.session.query(Protein).filter(Protein.kegg_id == 'hsa:3101').one()
+            self.assertEqual(('3101', '4922', 'HK3'), (protein.entrez_id, protein.hgnc_id, protein.hgnc_symbol))
+            self.assertEqual(['hsa00010'], [pathway.identifier for pathway in protein.pathways])
+
+            # human is skipped once it's loaded, and loaded again if its proteins were interrupted
+            with mock.patch.object(manager_module, 'get_hgnc_mapping', return_value=hgnc_mapping):
+                manager.populate(bundle=self.path, protein_source='pathways')
+                self.assertEqual(68, manager.count_proteins())
+                manager.session.execute(protein_pathway.delete())
+                manager.session.execute(Protein.__table__.delete())
+                manager.session.commit()
+                manager.populate(bundle=self.path, protein_source='pathways')
+            self.assertEqual(1, manager.session.query(Species).count())
+            self.assertEqual(1, manager.count_pathways())
+            self.assertEqual(68, manager.session.query(protein_pathway).count())
+        finally:
+            manager.drop_all()
+            manager.session.close()
+
+    def test_populate_conv(self):
+        """Test populating the proteins from the protein-pathway links with the identifiers of the conv tables."""
+        manager = Manager(connection=self.connection)
+        manager.create_all()
+        hgnc_mapping = HGNCMapping.from_dicts({'124': '249'}, {'249': 'ADH1A'})
+        try:
+            with mock.patch.object(manager_module, 'get_hgnc_mapping', return_value=hgnc_mapping):
+                manager.populate(bundle=self.path, protein_source='conv')
+
+            self.assertEqual(29, manager.count_proteins())
+            # only the memberships of the pathway in the bundle
+            self.assertEqual(16, manager.session.query(protein_pathway).count())
+            protein = manager.session.query(Protein).filter(Protein.kegg_id == 'hsa:10327').one()
+            self.assertEqual(['O60218', 'V9HWI0'], protein.get_uniprot_ids())
+            protein = manager.session.query(Protein).filter(Protein.kegg_id == 'hsa:124').one()
+            self.assertEqual(('124', 'P07327', '249', 'ADH1A'), (
+                protein.entrez_id, protein.uniprot_id, protein.hgnc_id, protein.hgnc_symbol,
+            ))
+        finally:
+            manager.drop_all()
+            manager.session.close()
+
+    def test_populate_organisms(self):
+        """Test populating organisms from a bundle, in this process and in worker processes."""
+        for processes in (1, 2):
+            with self.subTest(processes=processes):
+                self._help_test_populate_organisms(processes)
+
+    def _help_test_populate_organisms(self, processes: int):
+        manager = Manager(connection=self.connection)
+        manager.create_all()
+        hgnc_mapping = HGNCMapping.from_dicts({}, {})
+        try:
+            with mock.patch.object(manager_module, 'get_hgnc_mapping', return_value=hgnc_mapping):
+                manager.populate(bundle=self.path, organisms='hsa', processes=processes)
+
+            species = manager.session.query(Species).one()
+            self.assertEqual('hsa', species.kegg_code)
+            self.assertEqual('9606', species.taxonomy_id)
+            self.assertEqual(['hsa00010'], [identifier for identifier, in manager.session.query(Pathway.identifier)])
+
+            # human was loaded by the organism path, so populating it again is skipped
+            with mock.patch.object(manager_module, 'get_hgnc_mapping', return_value=hgnc_mapping):
+                manager.populate(bundle=self.path)
+            self.assertEqual(1, manager.session.query(Species).count())
+            self.assertEqual(1, manager.count_pathways())
+        finally:
+            manager.drop_all()
+            manager.session.close()
@@ -3,7 +3,7 @@
 """Test for the parser and database."""
 
 from bio2bel_kegg.models import Pathway, Protein
-from tests.constants import DatabaseMixin, enrichment_graph
+from tests.constants import DatabaseMixin, enrichment_graph, test_release_path
 
 
 class TestParse(DatabaseMixin):
@@ -157,3 +157,19 @@ class TestParse(DatabaseMixin):
         # TODO revisit this test
         self.assertEqual(32, graph_example.number_of_nodes())
         self.assertEqual(33, graph_example.number_of_edges())
+
+    def test_release(self):
+        """Test the loaded release is recorded and an update to the same release does nothing."""
+        self.assertEqual('Release 106.0+/05-16, May 23', self.manager.get_release())
+        self.assertEqual({}, self.manager.update(release_url=test_release_path))
+
+    def test_membership_index(self):
+        """Test the enrichment with the in-memory index matches the pathways in the database."""
+        enrichment = self.manager.enrich_pathways_for_genes(['PFKP'], kegg_code='hsa')
+        self.assertEqual(1, enrichment.query_size)
+        self.assertEqual({'hsa00010', 'hsa00030'}, set(enrichment.pathway_ids.tolist()))
+        self.assertEqual(
+            {14, 16},
+            {len(self.manager.get_pathway_by_id(pathway_id).proteins) for pathway_id in enrichment.pathway_ids},
+        )
+        self.assertIs(self.manager.get_membership_index('hsa'), self.manager.get_membership_index('hsa'))
@@ -4,8 +4,19 @@
 
 import unittest
 
-from bio2bel_kegg.client import parse_pathway_lines, parse_protein_lines
-from tests.constants import test_pathway_path, test_protein_path
+from bio2bel_kegg.client import (
+    PathwayEntry, get_pathway_proteins, iter_sections, parse_entities, parse_pathway_entry, parse_pathway_lines,
+    parse_protein_entry, parse_protein_lines, split_entries,
+)
+from bio2bel_kegg.organisms import parse_taxonomy_id
+from bio2bel_kegg.parsers import (
+    get_conv_protein_entries, get_entity_pathway_df, get_kegg_release, get_ncbigene_conv_df, get_pathway_hierarchy,
+    get_uniprot_conv_df, iter_entity_pathway_dfs, remove_path_prefix,
+)
+from tests.constants import (
+    test_genome_path, test_hierarchy_path, test_ncbigene_conv_path, test_pathway_path, test_protein_path,
+    test_proteins_path, test_release_path, test_uniprot_conv_path,
+)
 
 
 class TestDescriptionParse(unittest.TestCase):
@@ -21,6 +32,138 @@ class TestDescriptionParse(unittest.TestCase):
         with open(test_protein_path) as file:
             parse_protein_lines(file)
 
+    def test_iter_sections(self):
+        """Test only the requested sections are yielded, up to their first subkey."""
+        with open(test_pathway_path) as file:
+            sections = list(iter_sections(file.read(), {'NAME', 'REFERENCE', 'KO_PATHWAY'}))
+
+        self.assertEqual(['NAME', 'REFERENCE', 'REFERENCE', 'REFERENCE', 'KO_PATHWAY'], [key for key, _ in sections])
+        self.assertEqual(['Glycolysis / Gluconeogenesis - Homo sapiens (human)'], sections[0][1])
+        self.assertEqual(['(map 1)'], sections[1][1], msg='the AUTHORS, TITLE, and JOURNAL subkeys are left out')
+        self.assertEqual([''], sections[3][1])
+        self.assertEqual(['ko00010'], sections[4][1], msg='the terminator is left out')
+
+    def test_parse_text(self):
+        """Test the parsers give the same result for the text of a file and its lines."""
+        with open(test_protein_path) as file:
+            protein_text = file.read()
+        protein = parse_protein_lines(protein_text)
+        self.assertEqual(protein, parse_protein_lines(protein_text.splitlines()))
+        self.assertEqual('112268384', protein['identifier'])
+        self.assertEqual('hsa  Homo sapiens', protein['species']['name'])
+        self.assertEqual(
+            [('ncbigene', '112268384'), ('ncbiprotein', 'XP_024308429')],
+            [(xref['prefix'], xref['identifier']) for xref in protein['xrefs']],
+        )
+
+        with open(test_pathway_path) as file:
+            pathway_text = file.read()
+        pathway = parse_pathway_lines(pathway_text)
+        self.assertEqual(pathway, parse_pathway_lines(pathway_text.splitlines()))
+        self.assertEqual('hsa00010', pathway['identifier'])
+        self.assertEqual(68, len(pathway['genes']))
+
+    def test_split_entries(self):
+        """Test splitting the response to a multi-entry request."""
+        with open(test_protein_path) as file:
+            protein_text = file.read()
+        with open(test_pathway_path) as file:
+            pathway_text = file.read()
+
+        entries = list(split_entries(protein_text + pathway_text))
+        self.assertEqual(['112268384', 'hsa00010'], [identifier for identifier, _ in entries])
+        self.assertEqual(protein_text.strip(), entries[0][1].strip())
+        self.assertEqual(pathway_text.strip(), entries[1][1].strip())
+        self.assertEqual('hsa00010', parse_pathway_lines(entries[1][1].splitlines())['identifier'])
+
+    def test_parse_entities(self):
+        """Test parsing in a process pool gives the same records in the same order as parsing serially."""
+        with open(test_protein_path) as file:
+            lines = [line.rstrip() for line in file]
+        entities = [(f'hsa:{i}', lines) for i in range(25)]
+
+        expected = list(parse_entities(entities, parse_protein_entry))
+        self.assertEqual('hsa:3', expected[3].kegg_id)
+        self.assertEqual('112268384', expected[3].entrez_id)
+        self.assertEqual(expected, list(parse_entities(entities, parse_protein_entry, processes=2, chunksize=4)))
+
+    def test_pathway_proteins(self):
+        """Test getting the proteins of pathways from their GENE sections."""
+        with open(test_pathway_path) as file:
+            pathway = parse_pathway_entry(('path:hsa00010', file.read()))
+        self.assertEqual(68, len(pathway.gene_ids))
+        self.assertEqual('3101', pathway.gene_ids[0])
+
+        other = PathwayEntry('path:hsa00020', 'Citrate cycle (TCA cycle)', gene_ids=('3098', '47'))
+        proteins, protein_pathway_pairs = get_pathway_proteins([pathway, other], 'hsa')
+        self.assertEqual(69, len(proteins))
+        self.assertEqual(('hsa:3101', '3101'), (proteins[0].kegg_id, proteins[0].entrez_id))
+        self.assertEqual(70, len(protein_pathway_pairs))
+        self.assertEqual([('hsa:3098', 'path:hsa00020'), ('hsa:47', 'path:hsa00020')], protein_pathway_pairs[-2:])
+
+    def test_conv_protein_entries(self):
+        """Test joining the identifiers of the conv tables onto proteins."""
+        ncbigene_df = get_ncbigene_conv_df(url=test_ncbigene_conv_path)
+        self.assertEqual(['hsa:10327', '10327'], list(ncbigene_df.values[0]))
+        uniprot_df = get_uniprot_conv_df(url=test_uniprot_conv_path)
+        self.assertEqual(['hsa:10327', 'O60218'], list(uniprot_df.values[0]))
+
+        proteins = get_conv_protein_entries(['hsa:10327', 'hsa:127', 'hsa:10327', 'hsa:2821'], ncbigene_df, uniprot_df)
+        self.assertEqual(['hsa:10327', 'hsa:127', 'hsa:2821'], [protein.kegg_id for protein in proteins])
+        self.assertEqual((('uniprot', 'O60218'), ('uniprot', 'V9HWI0')), proteins[0].xrefs)
+        self.assertEqual('127', proteins[1].entrez_id, msg='the identifier comes from the KEGG identifier')
+        self.assertEqual((('uniprot', 'P08319'),), proteins[1].xrefs)
+        self.assertEqual(('hsa:2821', '2821', ()), tuple(proteins[2]))
+
+    def test_entity_pathway_df(self):
+        """Test reading a protein-pathway link file into categorical columns, whole and in chunks."""
+        df = get_entity_pathway_df(url=test_proteins_path)
+        self.assertEqual('category', df['kegg_protein_id'].dtype.name)
+        self.assertEqual('category', df['kegg_pathway_id'].dtype.name)
+        self.assertEqual(['hsa:10327', 'path:hsa00010'], list(df.values[0]))
+
+        kegg_pathway_ids = remove_path_prefix(df['kegg_pathway_id'])
+        self.assertEqual('category', kegg_pathway_ids.dtype.name)
+        self.assertEqual('hsa00010', kegg_pathway_ids[0])
+        self.assertFalse(kegg_pathway_ids.str.startswith('path:').any())
+        self.assertEqual(['hsa00010'], list(remove_path_prefix(df['kegg_pathway_id'].astype(str))[:1]))
+        self.assertEqual('hsa00010', remove_path_prefix('path:hsa00010'))
+        self.assertEqual('hsa00010', remove_path_prefix('hsa00010'))
+
+        chunks = list(iter_entity_pathway_dfs(url=test_proteins_path, chunksize=10))
+        self.assertEqual(-(-len(df.index) // 10), len(chunks))
+        self.assertEqual(
+            df.astype(str).values.tolist(),
+            [pair for chunk in chunks for pair in chunk.astype(str).values.tolist()],
+        )
+
+    def test_pathway_hierarchy(self):
+        """Test parsing the hierarchy of pathway maps and the classes and related pathways of a pathway."""
+        hierarchy = get_pathway_hierarchy(url=test_hierarchy_path)
+        self.assertEqual(7, len(hierarchy))
+        self.assertEqual((('Metabolism', 'Global and overview maps'), '01100', 'Metabolic pathways'), hierarchy[0])
+        self.assertEqual([
+            ('Metabolism', 'Carbohydrate metabolism'),
+            ('Organismal Systems', 'Environmental adaptation'),
+        ], [categories for categories, map_number, _ in hierarchy if map_number == '00010'])
+
+        with open(test_pathway_path) as file:
+            text = file.read()
+        self.assertEqual(['Metabolism', 'Carbohydrate metabolism'], parse_pathway_lines(text.splitlines())['classes'])
+        pathway = parse_pathway_entry(('path:hsa00010', text))
+        self.assertEqual(('hsa00020', 'hsa00030', 'hsa00500', 'hsa00620', 'hsa00640'), pathway.related_ids)
+
+    def test_kegg_release(self):
+        """Test parsing the release from the KEGG database statistics."""
+        self.assertEqual('Release 106.0+/05-16, May 23', get_kegg_release(url=test_release_path))
+
+    def test_taxonomy_id(self):
+        """Test parsing the NCBI Taxonomy identifier from a KEGG genome."""
+        with open(test_genome_path) as file:
+            text = file.read()
+        self.assertEqual('9606', parse_taxonomy_id(text))
+        self.assertIsNone(parse_taxonomy_id(text.replace('TAXONOMY    TAX:9606\n', '')))
+
     # def test_description_protein(self):
     #     """Test parsing description of a protein."""
     #     response = requests.get('http://rest.kegg.jp/get/hsa:5214')
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the in-memory membership index and batch enrichment."""
+
+import math
+import unittest
+
+import pandas as pd
+
+from bio2bel_kegg.enrichment import MembershipIndex, benjamini_hochberg, hypergeometric_sf
+
+
+def _comb(n: int, k: int) -> int:
+    return math.factorial(n) // (math.factorial(k) * math.factorial(n - k))
+
+
+def _brute_force_sf(k: int, big_k: int, n: int, big_n: int) -> float:
+    return sum(
+        _comb(big_k, i) * _comb(big_n - big_k, n - i)
+        for i in range(k, min(n, big_k) + 1)
+    ) / _comb(big_n, n)
+
+
+def _naive_benjamini_hochberg(p_values, n_tests=None):
+    m = len(p_values) if n_tests is None else n_tests
+    ranked = sorted(p_values)
+    return [
+        min(1.0, min(ranked[j] * m / (j + 1) for j in range(ranked.index(p), len(ranked))))
+        for p in p_values
+    ]
+
+
+class TestMembershipIndex(unittest.TestCase):
+    """Test the membership index."""
+
+    def setUp(self):
+        """Build an index of five proteins in three pathways."""
+        memberships = [[0, 1], [0], [1, 2], [0, 2], []]
+        indptr = [0]
+        for columns in memberships:
+            indptr.append(indptr[-1] + len(columns))
+        self.index = MembershipIndex(
+            pathway_ids=['hsa00010', 'hsa00030', 'hsa00051'],
+            pathway_names=['Glycolysis', 'Pentose phosphate pathway', 'Fructose and mannose metabolism'],
+            indptr=indptr,
+            indices=[column for columns in memberships for column in columns],
+            hgnc_ids=['8878', '8876', '4987', None, '1'],
+            hgnc_symbols=['PFKP', 'PFKL', 'GPI', None, 'A1BG'],
+            entrez_ids=['5214', '5211', '2821', '3101', '1'],
+        )
+
+    def test_overlaps(self):
+        """Test counting the overlaps of queries by different keys."""
+        self.assertEqual([2, 1, 0], self.index.count_overlaps(self.index.get_rows(['PFKP', 'PFKL', 'X'])).tolist())
+        self.assertEqual([1, 0, 1], self.index.count_overlaps(self.index.get_rows(['3101'], key='entrez_id')).tolist())
+        self.assertEqual([0, 0, 0], self.index.count_overlaps(self.index.get_rows([], key='hgnc_id')).tolist())
+        with self.assertRaises(ValueError):
+            self.index.get_rows(['PFKP'], key='uniprot_id')
+
+    def test_enrich(self):
+        """Test the enrichment only reports overlapping pathways, ordered by p-value."""
+        enrichment = self.index.enrich(['PFKP', 'PFKL', 'PFKL'])
+        self.assertEqual(2, enrichment.query_size)
+        self.assertEqual(['hsa00010', 'hsa00030'], enrichment.pathway_ids.tolist())
+        self.assertEqual([2, 1], enrichment.mapped_proteins.tolist())
+        self.assertEqual([3, 2], enrichment.pathway_sizes.tolist())
+        self.assertAlmostEqual(_brute_force_sf(2, 3, 2, 5), enrichment.p_values[0])
+        self.assertAlmostEqual(_brute_force_sf(1, 2, 2, 5), enrichment.p_values[1])
+
+    def test_query_hgnc_symbols(self):
+        """Test the results have the same form as the ones of ComPath managers."""
+        results = self.index.query_hgnc_symbols(['GPI'])
+        self.assertEqual({'hsa00030', 'hsa00051'}, set(results))
+        self.assertEqual(
+            {
+                'pathway_id': 'hsa00051',
+                'pathway_name': 'Fructose and mannose metabolism',
+                'mapped_proteins': 1,
+                'pathway_size': 1,
+                'pathway_gene_set': {'GPI'},
+            },
+            results['hsa00051'],
+        )
+
+    def test_hypergeometric_sf(self):
+        """Test the vectorized p-values against the definition."""
+        for k, big_k, n, big_n in [(0, 5, 3, 10), (1, 5, 3, 10), (3, 5, 3, 10), (2, 40, 7, 300), (5, 6, 5, 20)]:
+            with self.subTest(k=k, big_k=big_k, n=n, big_n=big_n):
+                expected = _brute_force_sf(k, big_k, n, big_n)
+                self.assertAlmostEqual(expected, hypergeometric_sf([k], [big_k], n, big_n)[0])
+        self.assertEqual(0, len(hypergeometric_sf([], [], 3, 10)))
+
+    def test_batch_enrich(self):
+        """Test the batch enrichment agrees with enriching each gene set on its own, whatever the input."""
+        gene_sets = {'a': ['PFKP', 'PFKL'], 'b': ['GPI', 'X'], 'c': ['X'], 'd': ['GPI', 'A1BG', 'PFKP']}
+        table = self.index.batch_enrich(gene_sets)
+        self.assertEqual(['a', 'a', 'b', 'b', 'd', 'd', 'd'], table['query'].tolist())
+
+        for name, genes in gene_sets.items():
+            with self.subTest(query=name):
+                enrichment = self.index.enrich(genes)
+                rows = table[table['query'] == name]
+                self.assertEqual(enrichment.pathway_ids.tolist(), rows['pathway_id'].tolist())
+                self.assertEqual(enrichment.mapped_proteins.tolist(), rows['mapped_proteins'].tolist())
+                for expected, actual in zip(enrichment.p_values.tolist(), rows['p_value'].tolist()):
+                    self.assertAlmostEqual(expected, actual)
+                for expected, actual in zip(
+                    _naive_benjamini_hochberg(enrichment.p_values.tolist(), n_tests=3),
+                    rows['q_value'].tolist(),
+                ):
+                    self.assertAlmostEqual(expected, actual)
+
+        for gene_sets_input in (list(gene_sets.values()), pd.DataFrame(
+            [[True, True, False, False]],
+            index=['a'],
+            columns=['PFKP', 'PFKL', 'GPI', 'X'],
+        )):
+            with self.subTest(type=type(gene_sets_input).__name__):
+                other = self.index.batch_enrich(gene_sets_input, chunk_size=2)
+                expected = table[table['query'] == 'a']
+                rows = other[other['query'].isin([0, 'a'])]
+                self.assertEqual(expected['pathway_id'].tolist(), rows['pathway_id'].tolist())
+                self.assertEqual(expected['p_value'].tolist(), rows['p_value'].tolist())
+
+    def test_benjamini_hochberg(self):
+        """Test the adjusted p-values against the definition, in groups and with a fixed number of tests."""
+        p_values = [0.01, 0.04, 0.03, 0.2, 0.5, 0.001, 0.04]
+        for expected, actual in zip(_naive_benjamini_hochberg(p_values), benjamini_hochberg(p_values).tolist()):
+            self.assertAlmostEqual(expected, actual)
+
+        groups = [1, 0, 1, 0, 1, 2, 0]
+        adjusted = benjamini_hochberg(p_values, groups=groups, n_tests=10).tolist()
+        for group in set(groups):
+            positions = [i for i, g in enumerate(groups) if g == group]
+            expected = _naive_benjamini_hochberg([p_values[i] for i in positions], n_tests=10)
+            for i, value in zip(positions, expected):
+                self.assertAlmostEqual(value, adjusted[i])
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the streaming BEL exports."""
+
+import io
+import json
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from bio2bel_kegg.export import write_export
+from bio2bel_kegg.models import Base, Pathway, Protein, Species
+from pybel import BELGraph
+
+
+class TestExport(unittest.TestCase):
+    """Test the streaming BEL exports on a small database of two organisms."""
+
+    def setUp(self):
+        """Fill an in-memory database."""
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+
+        human = Species(name='Homo sapiens', taxonomy_id='9606', kegg_code='hsa')
+        mouse = Species(name='Mus musculus', taxonomy_id='10090', kegg_code='mmu')
+        pfkp = Protein(kegg_id='hsa:5214', entrez_id='5214', hgnc_id='8878', hgnc_symbol='PFKP')
+        pfkl = Protein(kegg_id='hsa:5211', entrez_id='5211', hgnc_id='8876', hgnc_symbol='PFKL')
+        pfkm = Protein(kegg_id='mmu:18642', entrez_id='18642')
+        self.pathways = [
+            Pathway(identifier='hsa00010', name='Glycolysis', species=human, proteins=[pfkp, pfkl]),
+            Pathway(identifier='hsa00030', name='Pentose phosphate pathway', species=human, proteins=[pfkp]),
+            Pathway(identifier='mmu00010', name='Glycolysis', species=mouse, proteins=[pfkm]),
+        ]
+        self.session.add_all(self.pathways)
+        self.session.commit()
+
+    def tearDown(self):
+        """Close the session."""
+        self.session.close()
+
+    def _get_graph(self) -> BELGraph:
+        graph = BELGraph()
+        for pathway in self.pathways:
+            pathway.add_to_bel_graph(graph)
+        return graph
+
+    def test_bel(self):
+        """Test the BEL script has the same statements as the graph made from the ORM objects."""
+        file = io.StringIO()
+        write_export(self.session, file, fmt='bel', chunk_size=2)
+        lines = file.getvalue().splitlines()
+        self.assertIn('SET DOCUMENT Name = "KEGG"', lines)
+        statements = {line for line in lines if ' partOf ' in line}
+        self.assertEqual(
+            {f'{u.as_bel()} partOf {v.as_bel()}' for u, v in self._get_graph().edges()},
+            statements,
+        )
+        self.assertIn('p(ncbigene:18642 ! 18642) partOf bp(kegg:mmu00010 ! Glycolysis)', statements)
+
+    def test_nodelink(self):
+        """Test each node is written once, before the edges that use it."""
+        file = io.StringIO()
+        write_export(self.session, file, fmt='jsonl', chunk_size=2)
+        nodes, edges = {}, set()
+        for line in file.getvalue().splitlines():
+            data = json.loads(line)
+            if 'relation' in data:
+                self.assertIn(data['source'], nodes)
+                self.assertIn(data['target'], nodes)
+                edges.add((nodes[data['source']], nodes[data['target']]))
+            else:
+                self.assertNotIn(data['id'], nodes)
+                nodes[data['id']] = data['bel']
+
+        graph = self._get_graph()
+        self.assertEqual({node.as_bel() for node in graph}, set(nodes.values()))
+        self.assertEqual({(u.as_bel(), v.as_bel()) for u, v in graph.edges()}, edges)
+
+    def test_invalid_format(self):
+        """Test an invalid format raises an error."""
+        with self.assertRaises(ValueError):
+            write_export(self.session, io.StringIO(), fmt='xml')
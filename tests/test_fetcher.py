@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the asynchronous fetcher against a local stand-in for the KEGG API."""
+
+import threading
+import time
+import unittest
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bio2bel_kegg.fetcher import Fetcher
+from bio2bel_kegg.metrics import collect_metrics
+
+
+class MockKEGGHandler(BaseHTTPRequestHandler):
+    """Answers ``/ok/<x>`` with a body, ``/flaky/<x>`` with a 503 the first two times, and ``/broken/<x>`` with 500."""
+
+    protocol_version = 'HTTP/1.1'  # keep connections alive
+
+    def do_GET(self):  # noqa: N802
+        """Answer a GET request."""
+        server = self.server
+        with server.lock:
+            server.requests[self.path] += 1
+            server.client_ports.add(self.client_address[1])
+            count = server.requests[self.path]
+
+        if self.path.startswith('/ok/') or (self.path.startswith('/flaky/') and count > 2):
+            self._respond(200, f'ENTRY       {self.path.rsplit("/", 1)[1]}\n///\n')
+        elif self.path.startswith('/flaky/'):
+            self._respond(503, 'busy', retry_after='0')
+        elif self.path.startswith('/missing/'):
+            self._respond(404, '')
+        else:
+            self._respond(500, 'error')
+
+    def _respond(self, status: int, body: str, retry_after=None):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(data)))
+        if retry_after is not None:
+            self.send_header('Retry-After', retry_after)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):  # noqa: D102
+        pass
+
+
+class TestFetcher(unittest.TestCase):
+    """Test the fetcher."""
+
+    def setUp(self):
+        """Start a local server."""
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), MockKEGGHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = Counter()
+        self.server.client_ports = set()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def tearDown(self):
+        """Stop the local server."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fetch(self, paths, **kwargs):
+        """Fetch the given paths from the local server."""
+        kwargs.setdefault('requests_per_second', 1000)
+        kwargs.setdefault('backoff_factor', 0.01)
+        fetcher = Fetcher(**kwargs)
+        return {
+            result.url[len(self.base):]: result
+            for result in fetcher.iter_texts(f'{self.base}{path}' for path in paths)
+        }
+
+    def test_fetch(self):
+        """Test all URLs are fetched over a bounded number of persistent connections."""
+        paths = [f'/ok/{i}' for i in range(20)]
+        results = self.fetch(paths, max_connections=2)
+        self.assertEqual(set(paths), set(results))
+        self.assertEqual('ENTRY       3\n///\n', results['/ok/3'].text)
+        self.assertLessEqual(len(self.server.client_ports), 2)
+
+    def test_retry(self):
+        """Test transient failures are retried."""
+        results = self.fetch(['/flaky/1'])
+        self.assertEqual('ENTRY       1\n///\n', results['/flaky/1'].text)
+        self.assertEqual(3, self.server.requests['/flaky/1'])
+
+    def test_failure(self):
+        """Test requests that keep failing are reported."""
+        results = self.fetch(['/broken/1', '/missing/1', '/ok/1'], max_retries=2)
+        self.assertIsNone(results['/broken/1'].text)
+        self.assertEqual('HTTP 500', results['/broken/1'].error)
+        self.assertEqual(3, self.server.requests['/broken/1'])
+        self.assertEqual('', results['/missing/1'].text, msg='404 means KEGG has none of the entries')
+        self.assertEqual(1, self.server.requests['/missing/1'])
+        self.assertIsNotNone(results['/ok/1'].text)
+
+    def test_metrics(self):
+        """Test the requests, retries, failures, and latencies are counted."""
+        with collect_metrics() as metrics:
+            self.fetch(['/flaky/1', '/broken/1', '/ok/1'], max_retries=2)
+        self.assertEqual(7, metrics.counters['http.requests'])
+        self.assertEqual(4, metrics.counters['http.retries'])
+        self.assertEqual(1, metrics.counters['http.failures'])
+        self.assertEqual(2, metrics.counters['http.status.200'])
+        self.assertEqual(2, metrics.counters['http.status.503'])
+        self.assertEqual(2 * len('ENTRY       1\n///\n') + 2 * len('busy') + 3 * len('error'),
+                         metrics.counters['http.bytes'])
+        self.assertEqual(7, metrics.histograms['http.latency'].count)
+
+    def test_rate_limit(self):
+        """Test the token bucket limits the number of requests per second."""
+        start = time.monotonic()
+        self.fetch([f'/ok/{i}' for i in range(6)], max_connections=3, requests_per_second=10)
+        self.assertGreaterEqual(time.monotonic() - start, 0.45)
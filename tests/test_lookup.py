@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the batched lookups and the indexes that support them."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from sqlalchemy import create_engine, inspect
+
+from bio2bel_kegg import manager as manager_module
+from bio2bel_kegg.manager import Manager
+from bio2bel_kegg.models import Base, Pathway, Protein, Species
+
+PROTEIN_PATHWAY_INDEX = 'ix_kegg_protein_pathway_pathway_id_protein_id'
+
+
+class TestLookup(unittest.TestCase):
+    """Test the batched lookups on a small database."""
+
+    def setUp(self):
+        """Fill a temporary database."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.connection = f'sqlite:///{os.path.join(self.directory.name, "kegg.db")}'
+        self.manager = Manager(connection=self.connection)
+
+        human = Species(name='Homo sapiens', taxonomy_id='9606', kegg_code='hsa')
+        proteins = [
+            Protein(kegg_id=f'hsa:{i}', entrez_id=str(i), hgnc_id=str(100 + i), hgnc_symbol=f'GENE{i}')
+            for i in range(5)
+        ]
+        proteins.append(Protein(kegg_id='hsa:5', entrez_id='5', hgnc_id='100', hgnc_symbol='GENE0'))
+        self.manager.session.add_all(proteins)
+        self.manager.session.flush()
+        self.manager.session.add_all([
+            Pathway(identifier='hsa00010', name='Glycolysis', species=human, proteins=proteins[:3]),
+            Pathway(identifier='hsa00030', name='Pentose phosphate pathway', species=human, proteins=proteins[2:]),
+        ])
+        self.manager.session.commit()
+
+    def tearDown(self):
+        """Remove the temporary database."""
+        self.manager.session.close()
+        self.manager.engine.dispose()
+        self.directory.cleanup()
+
+    def test_lookups(self):
+        """Test the lookups in chunks smaller than the queries."""
+        with mock.patch.object(manager_module, 'IN_QUERY_CHUNK_SIZE', 2):
+            kegg_id_to_protein = self.manager.get_kegg_id_to_protein(['hsa:1', 'hsa:4', 'hsa:4', 'hsa:1', 'hsa:99'])
+            self.assertEqual({'hsa:1', 'hsa:4'}, set(kegg_id_to_protein))
+            self.assertEqual('GENE4', kegg_id_to_protein['hsa:4'].hgnc_symbol)
+
+            # the first protein loaded wins when the identifiers are shared
+            hgnc_id_to_protein = self.manager.get_hgnc_id_to_protein(['100', '102', '103', 'x'])
+            self.assertEqual({'100': 'hsa:0', '102': 'hsa:2', '103': 'hsa:3'}, {
+                key: protein.kegg_id
+                for key, protein in hgnc_id_to_protein.items()
+            })
+            self.assertEqual({'GENE0', 'GENE3'}, set(self.manager.get_hgnc_symbol_to_protein(['GENE0', 'GENE3'])))
+            self.assertEqual({}, self.manager.get_hgnc_symbol_to_protein([]))
+
+            pathway_id_to_pathway = self.manager.get_pathway_id_to_pathway(['hsa00010', 'hsa00030', 'hsa99999'])
+            self.assertEqual({'hsa00010', 'hsa00030'}, set(pathway_id_to_pathway))
+
+            proteins = self.manager.get_proteins_by_hgnc_symbols(['GENE0', 'GENE1', 'GENE2'])
+            self.assertEqual(['hsa:0', 'hsa:1', 'hsa:2', 'hsa:5'], sorted(protein.kegg_id for protein in proteins))
+
+    def test_missing_indexes(self):
+        """Test the indexes are added to the tables of a database made before they existed."""
+        engine = create_engine(self.connection)
+        with engine.begin() as connection:
+            connection.execute(f'DROP INDEX {PROTEIN_PATHWAY_INDEX}')
+            connection.execute('DROP INDEX ix_kegg_protein_hgnc_symbol')
+        self.assertNotIn(PROTEIN_PATHWAY_INDEX, _get_index_names(engine, 'kegg_protein_pathway'))
+
+        Manager(connection=self.connection).session.close()
+        self.assertIn(PROTEIN_PATHWAY_INDEX, _get_index_names(engine, 'kegg_protein_pathway'))
+        self.assertIn('ix_kegg_protein_hgnc_symbol', _get_index_names(engine, 'kegg_protein'))
+        self.assertEqual(
+            {index.name for table in Base.metadata.sorted_tables for index in table.indexes},
+            {name for table in Base.metadata.sorted_tables for name in _get_index_names(engine, table.name)},
+        )
+        engine.dispose()
+
+
+def _get_index_names(engine, table_name: str):
+    return {index['name'] for index in inspect(engine).get_indexes(table_name)}
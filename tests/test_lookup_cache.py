@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the lookup cache of records of pathways and proteins."""
+
+import os
+import tempfile
+import unittest
+
+from bio2bel_kegg.lookup_cache import LookupCache, PathwayRecord, ProteinRecord
+from bio2bel_kegg.manager import Manager
+from bio2bel_kegg.models import Pathway, Protein, Species
+
+
+class TestLookupCache(unittest.TestCase):
+    """Test the cache on its own."""
+
+    def setUp(self):
+        """Make a cache with a clock that only moves when told to."""
+        self.now = 0.0
+        self.cache = LookupCache(maxsize=2, ttl=10, timer=lambda: self.now)
+        self.loads = []
+
+    def _get(self, key):
+        return self.cache.get(key, lambda: self.loads.append(key) or key.upper())
+
+    def test_eviction(self):
+        """Test that the least recently used entry is evicted."""
+        self.assertEqual('A', self._get('a'))
+        self._get('b')
+        self._get('a')
+        self._get('c')  # evicts b, which was used less recently than a
+        self.assertEqual(2, len(self.cache))
+        self._get('a')
+        self._get('b')
+        self.assertEqual(['a', 'b', 'c', 'b'], self.loads)
+        self.assertEqual((2, 4, 2, 2, 10), tuple(self.cache.info()))
+
+    def test_expiry(self):
+        """Test that entries are loaded again once they expire."""
+        self._get('a')
+        self.now = 9.9
+        self._get('a')
+        self.now = 10.0
+        self._get('a')
+        self.assertEqual(['a', 'a'], self.loads)
+
+    def test_clear_during_load(self):
+        """Test that a value loaded before the cache was cleared isn't stored."""
+        self.cache.get('a', self.cache.clear)
+        self.assertEqual(0, len(self.cache))
+
+    def test_invalid_size(self):
+        """Test that the cache can't be empty."""
+        with self.assertRaises(ValueError):
+            LookupCache(maxsize=0)
+
+
+class TestManagerLookupCache(unittest.TestCase):
+    """Test the records looked up by the manager."""
+
+    def setUp(self):
+        """Fill a temporary database."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.manager = Manager(
+            connection=f'sqlite:///{os.path.join(self.directory.name, "kegg.db")}',
+            lookup_cache_size=16,
+        )
+        human = Species(name='Homo sapiens', taxonomy_id='9606', kegg_code='hsa')
+        protein = Protein(kegg_id='hsa:5214', entrez_id='5214', hgnc_id='8877', hgnc_symbol='PFKP')
+        self.manager.session.add(Pathway(identifier='hsa00010', name='Glycolysis', species=human, proteins=[protein]))
+        self.manager.session.commit()
+
+    def tearDown(self):
+        """Remove the temporary database."""
+        self.manager.session.close()
+        self.manager.engine.dispose()
+        self.directory.cleanup()
+
+    def test_records(self):
+        """Test that records are cached, including missing ones, until the database is dropped."""
+        self.assertEqual(
+            PathwayRecord('hsa00010', 'Glycolysis', None, 'hsa'),
+            self.manager.get_pathway_record('hsa00010'),
+        )
+        protein = ProteinRecord('hsa:5214', '5214', None, '8877', 'PFKP')
+        self.assertEqual(protein, self.manager.get_protein_record('PFKP', key='hgnc_symbol'))
+        self.assertEqual(protein, self.manager.get_protein_record('PFKP', key='hgnc_symbol'))
+        self.assertIsNone(self.manager.get_protein_record('hsa:1'))
+        self.assertIsNone(self.manager.get_protein_record('hsa:1'))
+        self.assertEqual((2, 3, 3), tuple(self.manager.get_lookup_cache_info())[:3])
+
+        with self.assertRaises(ValueError):
+            self.manager.get_protein_record('P08237', key='uniprot_id')
+
+        self.manager.drop_all()
+        self.assertEqual(0, len(self.manager.lookup_cache))
+
+    def test_disabled(self):
+        """Test that the records are looked up without a cache by default."""
+        manager = Manager(connection=self.manager.connection, lookup_cache_size=0)
+        self.assertIsNone(manager.lookup_cache)
+        self.assertIsNone(manager.get_lookup_cache_info())
+        self.assertEqual('PFKP', manager.get_protein_record('hsa:5214').hgnc_symbol)
+        manager.session.close()
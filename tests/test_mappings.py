@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the HGNC mappings."""
+
+import tempfile
+import unittest
+
+from bio2bel_kegg.mappings import HGNCMapping
+
+
+class TestHGNCMapping(unittest.TestCase):
+    """Test the HGNC mappings."""
+
+    def setUp(self):
+        """Build a small mapping."""
+        self.mapping = HGNCMapping.from_dicts(
+            entrez_id_to_hgnc_id={'5214': '8878', '5211': '8876', '3101': '4987', 'x': '1'},
+            hgnc_id_to_symbol={'8878': 'PFKP', '8876': 'PFKL'},
+        )
+
+    def _check(self, mapping: HGNCMapping):
+        self.assertEqual(3, len(mapping))
+        hgnc_ids = mapping.get_hgnc_ids(['5211', '5214', '3101', '1', None, 'x', '999999'])
+        self.assertEqual(['8876', '8878', '4987', None, None, None, None], hgnc_ids)
+        self.assertEqual(['PFKL', 'PFKP', None, None, None, None, None], mapping.get_hgnc_symbols(hgnc_ids))
+
+    def test_lookup(self):
+        """Test looking up identifiers in batches."""
+        self._check(self.mapping)
+
+    def test_save_load(self):
+        """Test the mapping works the same when it's memory-mapped from disk."""
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertFalse(HGNCMapping.exists(directory))
+            self.mapping.save(directory)
+            self.assertTrue(HGNCMapping.exists(directory))
+            self._check(HGNCMapping.load(directory))
+
+    def test_empty(self):
+        """Test an empty mapping maps everything to None."""
+        mapping = HGNCMapping.from_dicts({}, {})
+        self.assertEqual([None, None], mapping.get_hgnc_ids(['1', '2']))
+        self.assertEqual([None], mapping.get_hgnc_symbols([None]))
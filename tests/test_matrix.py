@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the memory-mappable membership matrix."""
+
+import io
+import tempfile
+import unittest
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from bio2bel_kegg.matrix import MembershipMatrix
+from bio2bel_kegg.models import Base, Pathway, Protein, Species
+
+
+class TestMembershipMatrix(unittest.TestCase):
+    """Test the membership matrix on a small database of two organisms."""
+
+    def setUp(self):
+        """Fill an in-memory database."""
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+
+        human = Species(name='Homo sapiens', taxonomy_id='9606', kegg_code='hsa')
+        mouse = Species(name='Mus musculus', taxonomy_id='10090', kegg_code='mmu')
+        pfkp = Protein(kegg_id='hsa:5214', entrez_id='5214', hgnc_id='8878', hgnc_symbol='PFKP')
+        pfkl = Protein(kegg_id='hsa:5211', entrez_id='5211', hgnc_id='8876', hgnc_symbol='PFKL')
+        pfkm = Protein(kegg_id='mmu:18642', entrez_id='18642')
+        self.session.add_all([
+            Pathway(identifier='hsa00010', name='Glycolysis', species=human, proteins=[pfkp, pfkl]),
+            Pathway(identifier='hsa00030', name='Pentose phosphate pathway', species=human, proteins=[pfkp]),
+            Pathway(identifier='mmu00010', name='Glycolysis', species=mouse, proteins=[pfkm]),
+        ])
+        self.session.commit()
+        self.human_id = human.id
+
+    def tearDown(self):
+        """Close the session."""
+        self.session.close()
+
+    def test_gene_sets(self):
+        """Test the gene sets of all organisms and of one organism."""
+        matrix = MembershipMatrix.from_session(self.session)
+        self.assertEqual((3, 3), matrix.shape)
+        self.assertEqual(4, len(matrix))
+        self.assertEqual(
+            [
+                ('hsa00010', 'Glycolysis', ['PFKP', 'PFKL']),
+                ('hsa00030', 'Pentose phosphate pathway', ['PFKP']),
+                ('mmu00010', 'Glycolysis', []),
+            ],
+            list(matrix.iter_gene_sets()),
+        )
+        self.assertEqual(['18642'], list(matrix.iter_gene_sets(key='entrez_id'))[2][2])
+        with self.assertRaises(ValueError):
+            list(matrix.iter_gene_sets(key='uniprot_id'))
+
+        matrix = MembershipMatrix.from_session(self.session, species_id=self.human_id)
+        self.assertEqual((2, 2), matrix.shape)
+        self.assertEqual(['hsa:5214', 'hsa:5211'], matrix.kegg_id.tolist())
+
+    def test_gmt(self):
+        """Test writing the GMT file."""
+        file = io.StringIO()
+        MembershipMatrix.from_session(self.session).write_gmt(file, key='hgnc_id')
+        self.assertEqual(
+            'hsa00010\tGlycolysis\t8878\t8876\nhsa00030\tPentose phosphate pathway\t8878\nmmu00010\tGlycolysis\n',
+            file.getvalue(),
+        )
+
+    def test_save(self):
+        """Test the saved matrix is memory-mapped when it's loaded."""
+        matrix = MembershipMatrix.from_session(self.session)
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertFalse(MembershipMatrix.exists(directory))
+            matrix.save(directory)
+            self.assertTrue(MembershipMatrix.exists(directory))
+            loaded = MembershipMatrix.load(directory)
+            self.assertIsInstance(loaded.indices, np.memmap)
+            self.assertIsInstance(loaded.hgnc_symbol, np.memmap)
+            self.assertEqual(list(matrix.iter_gene_sets()), list(loaded.iter_gene_sets()))
+            del loaded
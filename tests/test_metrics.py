@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the metrics of populating the database."""
+
+import json
+import os
+import tempfile
+import unittest
+
+from bio2bel_kegg import metrics
+from bio2bel_kegg.client import PathwayEntry, iter_entities_texts, parse_entities, parse_protein_entry
+from bio2bel_kegg.manager import Manager
+from bio2bel_kegg.mappings import HGNCMapping
+from bio2bel_kegg.metrics import Metrics, collect_metrics, get_metrics, increment, observe, stage, timed
+from bio2bel_kegg.models import Species
+from bio2bel_kegg.store import DirectoryEntityStore
+from tests.constants import test_protein_path
+
+
+class TestMetrics(unittest.TestCase):
+    """Test collecting metrics."""
+
+    def test_disabled(self):
+        """Test that nothing is recorded outside of a collection."""
+        self.assertIsNone(get_metrics())
+        self.assertIs(len, timed(len, 'len'))
+        with stage('nothing'):
+            increment('nothing')
+            observe('nothing', 1.0)
+        self.assertIsNone(get_metrics())
+
+    def test_collect(self):
+        """Test collecting metrics, sending them to a sink, and writing the report."""
+        values = []
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'metrics.json')
+            with collect_metrics(path, sinks=[lambda *value: values.append(value)]) as collected:
+                with stage('outer'):
+                    with collect_metrics() as nested:
+                        self.assertIs(collected, nested)
+                    timed_len = timed(len, 'len')
+                    self.assertEqual(3, timed_len('abc'))
+                    timed_len('')
+                    increment('counter', 2)
+                    increment('counter')
+                    for value in (0.01, 0.2, 100):
+                        observe('latency', value)
+            self.assertIsNone(get_metrics())
+            with open(path) as file:
+                report = json.load(file)
+
+        self.assertEqual({'counter': 3}, report['counters'])
+        self.assertEqual({'outer': 1, 'len': 2}, {name: value['calls'] for name, value in report['stages'].items()})
+        latency = report['histograms']['latency']
+        self.assertEqual(3, latency['count'])
+        self.assertEqual(0.01, latency['min'])
+        self.assertEqual(1, latency['buckets']['0.05'])
+        self.assertEqual(1, latency['buckets']['0.25'])
+        self.assertEqual(1, latency['buckets']['inf'])
+        self.assertEqual(3, sum(latency['buckets'].values()))
+        self.assertEqual(
+            [('counter', 'counter', 2), ('counter', 'counter', 1)],
+            [value for value in values if value[0] == 'counter'],
+        )
+        self.assertEqual(2, sum(name == 'len' for kind, name, _ in values))
+
+        merged = Metrics()
+        merged.merge(report)
+        merged.merge(report)
+        self.assertEqual(6, merged.counters['counter'])
+        self.assertEqual(4, merged.stages['len'].calls)
+        self.assertEqual(6, merged.to_json()['histograms']['latency']['count'])
+
+    def test_broken_sink(self):
+        """Test that a sink that raises doesn't stop the collection."""
+        def _sink(kind, name, value):
+            raise ValueError
+
+        with self.assertLogs(metrics.logger), collect_metrics(sinks=[_sink]) as collected:
+            increment('counter')
+        self.assertEqual(1, collected.counters['counter'])
+
+
+class TestPopulateMetrics(unittest.TestCase):
+    """Test the metrics of the steps of populating the database."""
+
+    def setUp(self):
+        """Make a temporary directory for an entity store and a database."""
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.directory.cleanup()
+
+    def test_populate(self):
+        """Test reading entities from the store, parsing them, and loading them."""
+        store = DirectoryEntityStore(os.path.join(self.directory.name, 'entities'))
+        with open(test_protein_path) as file:
+            store.put('hsa:112268384', file.read())
+        manager = Manager(connection=f'sqlite:///{os.path.join(self.directory.name, "kegg.db")}')
+        manager.create_all()
+
+        with collect_metrics() as collected:
+            proteins = list(parse_entities(iter_entities_texts(['hsa:112268384'], store=store), parse_protein_entry))
+            manager._load_pathways(
+                [PathwayEntry('path:hsa04740', 'Olfactory transduction')],
+                Species(name='Homo sapiens', taxonomy_id='9606', kegg_code='hsa'),
+            )
+            manager._load_pathway_proteins(
+                proteins,
+                manager._get_kegg_protein_id_to_pathway_ids([('hsa:112268384', 'path:hsa04740')]),
+                hgnc_mapping=HGNCMapping.from_dicts({'112268384': '1'}, {'1': 'OR2A1'}),
+            )
+        manager.session.close()
+
+        self.assertEqual({
+            'rows.inserted.kegg_pathway': 1,
+            'rows.inserted.kegg_protein': 1,
+            'rows.inserted.kegg_protein_pathway': 1,
+            'store.hits': 1,
+            'store.misses': 0,
+        }, dict(collected.counters))
+        self.assertEqual(1, collected.stages['parse.parse_protein_entry'].calls)
+        self.assertEqual(1, collected.stages['store.get'].calls)
+        self.assertEqual(3, collected.stages['db.insert'].calls)
+        self.assertEqual(2, collected.stages['db.commit'].calls)
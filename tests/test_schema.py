@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for opening databases made by older versions."""
+
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine, inspect
+
+from bio2bel_kegg.manager import Manager
+from bio2bel_kegg.models import Base, Species
+from bio2bel_kegg.utils import create_missing_indexes
+
+#: The schema of the first version, before the species had KEGG codes and the lookups had indexes
+BASELINE_SCHEMA = (
+    'CREATE TABLE kegg_protein (id INTEGER NOT NULL, kegg_id VARCHAR(255) NOT NULL, entrez_id VARCHAR(255) NOT NULL,'
+    ' uniprot_id VARCHAR(255), hgnc_id VARCHAR(255), hgnc_symbol VARCHAR(255), PRIMARY KEY (id))',
+    'CREATE INDEX ix_kegg_protein_kegg_id ON kegg_protein (kegg_id)',
+    'CREATE INDEX ix_kegg_protein_entrez_id ON kegg_protein (entrez_id)',
+    'CREATE TABLE kegg_species (id INTEGER NOT NULL, taxonomy_id VARCHAR(255), name VARCHAR(255), PRIMARY KEY (id))',
+    'CREATE TABLE kegg_pathway (id INTEGER NOT NULL, identifier VARCHAR(255) NOT NULL, name VARCHAR(255) NOT NULL,'
+    ' definition TEXT, species_id INTEGER, PRIMARY KEY (id), FOREIGN KEY(species_id) REFERENCES kegg_species (id))',
+    'CREATE UNIQUE INDEX ix_kegg_pathway_identifier ON kegg_pathway (identifier)',
+    'CREATE TABLE kegg_protein_pathway (protein_id INTEGER NOT NULL, pathway_id INTEGER NOT NULL,'
+    ' PRIMARY KEY (protein_id, pathway_id), FOREIGN KEY(protein_id) REFERENCES kegg_protein (id),'
+    ' FOREIGN KEY(pathway_id) REFERENCES kegg_pathway (id))',
+)
+
+
+class TestBaselineSchema(unittest.TestCase):
+    """Test upgrading a database with the schema of the first version."""
+
+    def setUp(self):
+        """Create a database with the baseline schema."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.connection = f'sqlite:///{os.path.join(self.directory.name, "kegg.db")}'
+        self.engine = create_engine(self.connection)
+        with self.engine.begin() as connection:
+            for statement in BASELINE_SCHEMA:
+                connection.execute(statement)
+
+    def tearDown(self):
+        """Remove the database."""
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def test_missing_indexes(self):
+        """Test that indexes on columns the tables don't have yet are skipped."""
+        created = create_missing_indexes(self.engine, Base.metadata)
+        self.assertIn('ix_kegg_protein_hgnc_symbol', created)
+        self.assertNotIn('ix_kegg_species_kegg_code', created)
+        index_names = {index['name'] for index in inspect(self.engine).get_indexes('kegg_protein')}
+        self.assertIn('ix_kegg_protein_hgnc_symbol', index_names)
+
+    def test_open(self):
+        """Test that a manager opens the database, creating the tables and indexes it doesn't have yet."""
+        manager = Manager(connection=self.connection)
+        try:
+            self.assertIn('kegg_release', inspect(self.engine).get_table_names())
+            self.assertEqual(0, manager.count_pathways())
+        finally:
+            manager.session.close()
+
+    def test_upgrade_species(self):
+        """Test that the species of human loaded by the first version gets its KEGG code, so it's not loaded again."""
+        with self.engine.begin() as connection:
+            connection.execute("INSERT INTO kegg_species VALUES (1, '9606', 'Homo sapiens')")
+            connection.execute("INSERT INTO kegg_pathway VALUES (1, 'hsa00010', 'Glycolysis', NULL, 1)")
+            connection.execute("INSERT INTO kegg_protein VALUES (1, 'hsa:3101', '3101', NULL, NULL, NULL)")
+            connection.execute('INSERT INTO kegg_protein_pathway VALUES (1, 1)')
+
+        manager = Manager(connection=self.connection)
+        try:
+            species = manager.session.query(Species).one()
+            self.assertEqual(('hsa', 'T01001'), (species.kegg_code, species.kegg_genome_id))
+            self.assertTrue(manager._is_human_loaded())
+            self.assertEqual(['hsa00010'], [pathway.identifier for pathway in species.pathways])
+            index_names = {index['name'] for index in inspect(self.engine).get_indexes('kegg_species')}
+            self.assertIn('ix_kegg_species_kegg_code', index_names)
+        finally:
+            manager.session.close()
+
+        # opening it again changes nothing
+        manager = Manager(connection=self.connection)
+        try:
+            self.assertEqual(['hsa'], [kegg_code for kegg_code, in manager.session.query(Species.kegg_code)])
+        finally:
+            manager.session.close()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the pathway similarity matrix."""
+
+import itertools as itt
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from bio2bel_kegg import similarity
+from bio2bel_kegg.enrichment import MembershipIndex
+from bio2bel_kegg.similarity import PathwaySimilarity, Similarity
+
+MEMBERSHIPS = [[0, 1], [0], [1, 2], [0, 2, 3], [], [3, 1, 0]]
+
+
+class TestPathwaySimilarity(unittest.TestCase):
+    """Test the pathway similarity matrix."""
+
+    def setUp(self):
+        """Count the overlaps of four pathways of six proteins."""
+        indptr = [0]
+        for columns in MEMBERSHIPS:
+            indptr.append(indptr[-1] + len(columns))
+        self.index = MembershipIndex(
+            pathway_ids=['hsa00010', 'hsa00030', 'hsa00051', 'hsa00052'],
+            pathway_names=['a', 'b', 'c', 'd'],
+            indptr=indptr,
+            indices=[column for columns in MEMBERSHIPS for column in columns],
+            hgnc_ids=[None] * len(MEMBERSHIPS),
+            hgnc_symbols=[None] * len(MEMBERSHIPS),
+            entrez_ids=[None] * len(MEMBERSHIPS),
+        )
+        self.similarity = PathwaySimilarity.from_membership_index(self.index)
+
+    def _get_expected(self, first: int, second: int) -> Similarity:
+        first_proteins = {row for row, columns in enumerate(MEMBERSHIPS) if first in columns}
+        second_proteins = {row for row, columns in enumerate(MEMBERSHIPS) if second in columns}
+        overlap = len(first_proteins & second_proteins)
+        return Similarity(
+            overlap=overlap,
+            jaccard=overlap / len(first_proteins | second_proteins),
+            overlap_coefficient=overlap / min(len(first_proteins), len(second_proteins)),
+        )
+
+    def test_similarity(self):
+        """Test the similarity of each pair against the definitions, with chunks of every size."""
+        for chunk_size in (1, 3, 1000):
+            with self.subTest(chunk_size=chunk_size), mock.patch.object(similarity, 'PAIR_CHUNK_SIZE', chunk_size):
+                matrix = PathwaySimilarity.from_membership_index(self.index)
+                for first, second in itt.permutations(range(4), 2):
+                    expected = self._get_expected(first, second)
+                    actual = matrix.get_similarity(matrix.pathway_ids[first], matrix.pathway_ids[second])
+                    self.assertEqual(expected.overlap, actual.overlap)
+                    self.assertAlmostEqual(expected.jaccard, actual.jaccard)
+                    self.assertAlmostEqual(expected.overlap_coefficient, actual.overlap_coefficient)
+
+        self.assertEqual(6, len(self.similarity))
+        with self.assertRaises(KeyError):
+            self.similarity.get_similarity('hsa00010', 'hsa99999')
+        with self.assertRaises(ValueError):
+            self.similarity.get_metric('cosine')
+
+    def test_most_similar(self):
+        """Test getting the most similar pathways."""
+        table = self.similarity.get_most_similar('hsa00010', k=2, metric='overlap')
+        self.assertEqual(['hsa00030', 'hsa00052'], table['pathway_id'].tolist())
+        self.assertEqual([2, 2], table['overlap'].tolist())
+
+        table = self.similarity.get_most_similar('hsa00052')
+        self.assertEqual(['hsa00010', 'hsa00051', 'hsa00030'], table['pathway_id'].tolist())
+        self.assertEqual([0.5, 1 / 3, 0.25], table['jaccard'].tolist())
+
+    def test_pairs(self):
+        """Test getting the pairs above a threshold."""
+        table = self.similarity.get_pairs(0.6, metric='overlap_coefficient')
+        self.assertEqual(
+            [('hsa00010', 'hsa00052'), ('hsa00010', 'hsa00030')],
+            list(zip(table['pathway_id'], table['other_pathway_id'])),
+        )
+        self.assertEqual([1.0, 2 / 3], table['overlap_coefficient'].tolist())
+        self.assertEqual(6, len(self.similarity.get_pairs(0.5, metric='overlap_coefficient').index))
+        self.assertEqual(0, len(self.similarity.get_pairs(2, metric='jaccard').index))
+
+    def test_save(self):
+        """Test saving and loading the matrix."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'similarity.npz')
+            self.similarity.save(path)
+            loaded = PathwaySimilarity.load(path)
+        self.assertEqual(self.similarity.pathway_ids.tolist(), loaded.pathway_ids.tolist())
+        self.assertEqual(self.similarity.overlaps.tolist(), loaded.overlaps.tolist())
+        self.assertEqual(self.similarity.n_memberships, loaded.n_memberships)
+        self.assertEqual(self.index.get_checksum(), loaded.checksum)
+        self.assertEqual(
+            self.similarity.get_similarity('hsa00030', 'hsa00052'),
+            loaded.get_similarity('hsa00030', 'hsa00052'),
+        )
+
+    def test_checksum(self):
+        """Test that swapping memberships changes the checksum even though the counts stay the same."""
+        memberships = [list(columns) for columns in MEMBERSHIPS]
+        memberships[1] = [2]
+        indptr = [0]
+        for columns in memberships:
+            indptr.append(indptr[-1] + len(columns))
+        index = MembershipIndex(
+            pathway_ids=self.index.pathway_ids,
+            pathway_names=self.index.pathway_names,
+            indptr=indptr,
+            indices=[column for columns in memberships for column in columns],
+            hgnc_ids=[None] * len(memberships),
+            hgnc_symbols=[None] * len(memberships),
+            entrez_ids=[None] * len(memberships),
+        )
+        self.assertEqual(len(self.index.indices), len(index.indices))
+        self.assertNotEqual(self.index.get_checksum(), index.get_checksum())
+        self.assertEqual(self.index.get_checksum(), PathwaySimilarity.from_membership_index(self.index).checksum)
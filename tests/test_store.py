@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the entity stores."""
+
+import os
+import tempfile
+import time
+import unittest
+
+from bio2bel_kegg.client import get_entities_lines
+from bio2bel_kegg.fetcher import FetchResult, Fetcher
+from bio2bel_kegg.store import DirectoryEntityStore, PackedEntityStore, is_complete_entry, migrate_entity_store
+from tests.constants import test_pathway_path, test_protein_path
+
+
+class StaticFetcher(Fetcher):
+    """A fetcher that answers each URL with the same text and counts the requests."""
+
+    def __init__(self, text: str):
+        """Initialize the fetcher with the text of the responses."""
+        super().__init__()
+        self.text = text
+        self.requests = 0
+
+    def iter_texts(self, urls, queue_size: int = 0):  # noqa: D102
+        for url in urls:
+            self.requests += 1
+            yield FetchResult(url, self.text)
+
+
+class TestStores(unittest.TestCase):
+    """Test the entity stores."""
+
+    def setUp(self):
+        """Create a temporary directory and load the test entities."""
+        self.directory = tempfile.TemporaryDirectory()
+        with open(test_protein_path) as file:
+            self.protein_text = file.read()
+        with open(test_pathway_path) as file:
+            self.pathway_text = file.read()
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.directory.cleanup()
+
+    def _help_test_store(self, store):
+        self.assertNotIn('hsa:112268384', store)
+        self.assertIsNone(store.get('hsa:112268384'))
+
+        store.put('hsa:112268384', self.protein_text)
+        store.put('path:hsa00010', self.pathway_text)
+        self.assertIn('hsa:112268384', store)
+        self.assertEqual(self.protein_text, store.get('hsa:112268384'))
+        self.assertEqual(self.pathway_text, store.get('path:hsa00010'))
+        self.assertEqual({'hsa:112268384', 'path:hsa00010'}, set(store))
+
+    def test_directory(self):
+        """Test the directory store."""
+        store = DirectoryEntityStore(self.directory.name)
+        self._help_test_store(store)
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, 'hsa', '112268384.txt')))
+
+    def test_packed(self):
+        """Test the packed store, including reopening it and starting new segments."""
+        with PackedEntityStore(self.directory.name, segment_max_size=1000) as store:
+            self._help_test_store(store)
+            store.put('path:hsa00020', self.pathway_text)
+            self.assertEqual(self.pathway_text, store.get('path:hsa00020'))
+
+        names = os.listdir(self.directory.name)
+        self.assertEqual(1, sum(name.endswith('.idx') for name in names))
+        self.assertEqual(3, sum(name.endswith('.seg') for name in names))
+
+        with PackedEntityStore(self.directory.name) as store:
+            self.assertEqual(3, len(store))
+            self.assertEqual(self.protein_text, store.get('hsa:112268384'))
+            self.assertEqual(self.pathway_text, store.get('path:hsa00020'))
+
+    def test_migrate(self):
+        """Test migrating from the directory store to the packed store."""
+        source = DirectoryEntityStore(os.path.join(self.directory.name, 'entities'))
+        source.put('hsa:112268384', self.protein_text)
+        source.put('path:hsa00010', self.pathway_text)
+
+        with PackedEntityStore(os.path.join(self.directory.name, 'entity_store')) as target:
+            self.assertEqual(2, migrate_entity_store(source, target, delete=True))
+            self.assertEqual(self.pathway_text, target.get('path:hsa00010'))
+
+        self.assertEqual([], list(source))
+
+    def test_migrate_truncated(self):
+        """Test that truncated entities are skipped when migrating, rather than failing the migration."""
+        source = DirectoryEntityStore(os.path.join(self.directory.name, 'entities'))
+        source.put('hsa:112268384', self.protein_text)
+        source.put('path:hsa00010', self.pathway_text)
+        with open(source.get_path('hsa:112268384'), 'w') as file:
+            file.write(self.protein_text[:100])
+
+        with PackedEntityStore(os.path.join(self.directory.name, 'entity_store')) as target:
+            self.assertEqual(1, migrate_entity_store(source, target, delete=True))
+            self.assertEqual(['path:hsa00010'], list(target))
+            self.assertEqual(self.pathway_text, target.get('path:hsa00010'))
+
+        self.assertEqual([], list(source))
+
+    def test_complete_entry(self):
+        """Test checking for the terminator of flat files."""
+        self.assertTrue(is_complete_entry(self.protein_text))
+        self.assertTrue(is_complete_entry('ENTRY       1\n///'))
+        self.assertFalse(is_complete_entry(self.protein_text[:len(self.protein_text) // 2]))
+        self.assertFalse(is_complete_entry(''))
+
+    def test_directory_truncated(self):
+        """Test that a truncated file in the directory store is dropped when it's read."""
+        store = DirectoryEntityStore(self.directory.name)
+        store.put('hsa:112268384', self.protein_text)
+        path = store.get_path('hsa:112268384')
+        with open(path, 'w') as file:
+            file.write(self.protein_text[:100])
+
+        self.assertIsNone(store.get('hsa:112268384'))
+        self.assertNotIn('hsa:112268384', store)
+        self.assertEqual([], [name for name in os.listdir(os.path.dirname(path)) if name.endswith('.tmp')])
+
+    def test_refetch_truncated(self):
+        """Test that an entity that was truncated in the store is fetched again."""
+        store = DirectoryEntityStore(self.directory.name)
+        # like a file left behind by an interrupted download
+        store.put('hsa:112268384', self.protein_text[:100])
+        fetcher = StaticFetcher(self.protein_text)
+
+        (entity_id, lines), = get_entities_lines(['hsa:112268384'], fetcher=fetcher, store=store)
+        self.assertEqual('hsa:112268384', entity_id)
+        self.assertEqual('///', lines[-1])
+        self.assertEqual(1, fetcher.requests)
+        self.assertEqual(self.protein_text.rstrip('\n') + '\n', store.get('hsa:112268384'))
+
+    def test_packed_corrupt(self):
+        """Test that entities in the packed store that don't match their checksums are dropped."""
+        with PackedEntityStore(self.directory.name) as store:
+            store.put('hsa:112268384', self.protein_text)
+            store.put('path:hsa00010', self.pathway_text)
+
+        segment_name, = (name for name in os.listdir(self.directory.name) if name.endswith('.seg'))
+        with open(os.path.join(self.directory.name, segment_name), 'r+b') as file:
+            file.seek(10)
+            byte = file.read(1)
+            file.seek(10)
+            file.write(bytes([byte[0] ^ 0xFF]))
+
+        with PackedEntityStore(self.directory.name) as store:
+            self.assertEqual(['hsa:112268384'], store.verify())
+            self.assertNotIn('hsa:112268384', store)
+            self.assertEqual(self.pathway_text, store.get('path:hsa00010'))
+            # a new copy takes precedence over the corrupt one
+            store.put('hsa:112268384', self.protein_text)
+
+        with PackedEntityStore(self.directory.name) as store:
+            self.assertEqual(self.protein_text, store.get('hsa:112268384'))
+
+    def test_directory_prune(self):
+        """Test evicting the least recently used entities from the directory store."""
+        store = DirectoryEntityStore(self.directory.name, record_access=True)
+        self._help_test_prune(store)
+
+    def test_directory_no_access(self):
+        """Test that reads don't touch the files of the directory store unless it records their use."""
+        store = DirectoryEntityStore(self.directory.name, record_access=False)
+        store.put('path:hsa00010', self.pathway_text)
+        self._set_access(store, 'path:hsa00010', 1000.0)
+        self.assertEqual(self.pathway_text, store.get('path:hsa00010'))
+        self.assertEqual(1000.0, os.path.getmtime(store.get_path('path:hsa00010')))
+
+    def test_packed_prune(self):
+        """Test evicting the least recently used entities from the packed store."""
+        with PackedEntityStore(self.directory.name) as store:
+            self._help_test_prune(store)
+            store.put('path:hsa00030', self.pathway_text)
+
+        with PackedEntityStore(self.directory.name) as store:
+            self.assertEqual({'path:hsa00020', 'path:hsa00030'}, set(store))
+            self.assertEqual(self.pathway_text, store.get('path:hsa00020'))
+
+        names = os.listdir(self.directory.name)
+        self.assertEqual(2, sum(name.endswith('.idx') for name in names))
+
+    def _help_test_prune(self, store):
+        for i, entity_id in enumerate(('path:hsa00010', 'path:hsa00020', 'hsa:112268384')):
+            store.put(entity_id, self.pathway_text if entity_id.startswith('path') else self.protein_text)
+            self._set_access(store, entity_id, 1000.0 * (i + 1))
+        # reading an entity makes it the most recently used one
+        self.assertEqual(self.pathway_text, store.get('path:hsa00020'))
+
+        stats = store.stats()
+        self.assertEqual(3, stats.entities)
+        self.assertEqual(1000.0, stats.oldest_access)
+        self.assertLess(time.time() - stats.newest_access, 60)
+        self.assertEqual(0, store.prune(stats.disk_size))
+
+        count = store.prune(stats.disk_size - 1)
+        self.assertEqual(1, count)
+        self.assertEqual({'path:hsa00020', 'hsa:112268384'}, set(store))
+        self.assertEqual(2, store.stats().entities)
+        self.assertLessEqual(store.stats().disk_size, stats.disk_size - 1)
+        self.assertEqual(self.pathway_text, store.get('path:hsa00020'))
+
+        self.assertEqual(1, store.prune(store.stats().disk_size - 1))
+        self.assertEqual({'path:hsa00020'}, set(store))
+
+    @staticmethod
+    def _set_access(store, entity_id: str, access: float) -> None:
+        if isinstance(store, DirectoryEntityStore):
+            os.utime(store.get_path(entity_id), (access, access))
+        else:
+            store._record_access(entity_id, access)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the utilities."""
+
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from bio2bel_kegg.utils import SQLITE_BULK_LOAD_PRAGMAS, bulk_load_transaction
+
+
+class TestBulkLoadTransaction(unittest.TestCase):
+    """Test the transactions of bulk loads."""
+
+    def setUp(self):
+        """Make a session of an in-memory database, whose connection is kept between transactions."""
+        self.engine = create_engine('sqlite://')
+        self.session = sessionmaker(bind=self.engine)()
+        self.session.execute('CREATE TABLE t (x INTEGER)')
+        self.cache_size = self.session.execute('PRAGMA cache_size').scalar()
+
+    def tearDown(self):
+        """Close the session."""
+        self.session.close()
+        self.engine.dispose()
+
+    def test_commit(self):
+        """Test that the rows are committed and the settings restored."""
+        with bulk_load_transaction(self.session):
+            self.session.execute('INSERT INTO t VALUES (1)')
+            self.assertEqual(
+                int(SQLITE_BULK_LOAD_PRAGMAS['cache_size']),
+                self.session.execute('PRAGMA cache_size').scalar(),
+            )
+        self.assertEqual(1, self.session.execute('SELECT count(*) FROM t').scalar())
+        self.assertEqual(self.cache_size, self.session.execute('PRAGMA cache_size').scalar())
+
+    def test_rollback(self):
+        """Test that the rows are rolled back and the settings restored on errors."""
+        with self.assertRaises(ValueError), bulk_load_transaction(self.session):
+            self.session.execute('INSERT INTO t VALUES (1)')
+            raise ValueError
+        self.assertEqual(0, self.session.execute('SELECT count(*) FROM t').scalar())
+        self.assertEqual(self.cache_size, self.session.execute('PRAGMA cache_size').scalar())